@@ -5,9 +5,11 @@ import ujson as json
 try:
     import usocket as socket
     import urequests as requests
+    TRACED_HTTP = True
 except Exception:
     # In desktop Python, fallback to requests (not used on Pico)
     import requests
+    TRACED_HTTP = False
 
 try:
     # local helper to atomically move tmp file to final path
@@ -15,6 +17,213 @@ try:
 except Exception:
     import os
 
+from bufpool import CHUNK, pool
+from log import log
+from storage import crc32, write_frame_meta
+from telemetry import ticks_diff, ticks_us, trace
+
+# Size and duration of the last response body read, for link throughput
+last_body = {'bytes': 0, 'us': 0}
+# Timing of the last _traced_post: dns + connect, time to first byte, and
+# whether the request was fully sent (after which a failure is not retried
+# elsewhere: the server may already be generating)
+last_post = {'connect_us': None, 'ttfb_us': None, 'sent': False}
+# Set when the last txt2img was turned away as busy: a 503 with Retry-After
+# (the passthrough's admission control). retry_after is the soonest any
+# endpoint asked to be retried, in seconds; position is its queue position
+last_busy = {'retry_after': None, 'position': None}
+
+# X-Priority values (passthrough/admission.py): lower is served sooner
+PRIORITY_RETRY = 0
+PRIORITY_BACKGROUND = 2
+
+
+def _drain(stream, outf, crc):
+    """Copy the rest of stream into outf through the pooled chunk buffer,
+    updating the running CRC32 (None stays None). Returns the crc.
+
+    Traced as 'body' (whole transfer) and 'flash' (time spent in the file
+    writes, accumulated across chunks)."""
+    buf = pool.borrow(CHUNK)
+    size = len(buf)
+    readinto = getattr(stream, 'readinto', None)
+    t_body = ticks_us()
+    flash_us = 0
+    total = 0
+    try:
+        while True:
+            if readinto:
+                n = readinto(buf)
+                chunk = buf if n == size else buf[:n or 0]
+            else:
+                chunk = stream.read(size)
+                n = len(chunk) if chunk else 0
+            if not n:
+                break
+            total += n
+            t = ticks_us()
+            outf.write(chunk)
+            flash_us += ticks_diff(ticks_us(), t)
+            if crc is not None:
+                crc = crc32(chunk, crc)
+    finally:
+        pool.give_back(CHUNK, buf)
+    last_body['bytes'] += total
+    last_body['us'] += ticks_diff(trace.span('body', t_body), t_body) - flash_us
+    trace.add('flash', flash_us, t_body)
+    return crc
+
+
+def _note_busy(r):
+    """Record a 503 + Retry-After answer in last_busy; True if r was one."""
+    if r.status_code != 503:
+        return False
+    try:
+        retry = float(r.headers.get('Retry-After'))
+    except Exception:
+        return False
+    if last_busy['retry_after'] is None or retry < last_busy['retry_after']:
+        last_busy['retry_after'] = retry
+        last_busy['position'] = r.headers.get('X-Queue-Position')
+    return True
+
+
+def _canonical_header(name):
+    return '-'.join(p[:1].upper() + p[1:].lower() for p in name.split('-'))
+
+
+class _Response:
+    """The parts of urequests.Response that txt2img uses: status_code,
+    headers, raw (the socket), content, text, json() and close()."""
+
+    def __init__(self, sock, status_code, headers):
+        self.raw = sock
+        self.status_code = status_code
+        self.headers = headers
+        self._content = None
+
+    @property
+    def content(self):
+        if self._content is None:
+            t = ticks_us()
+            try:
+                self._content = self.raw.read()
+            finally:
+                self.close()
+            last_body['bytes'] += len(self._content)
+            last_body['us'] += ticks_diff(trace.span('body', t), t)
+        return self._content
+
+    @property
+    def text(self):
+        return str(self.content, 'utf-8')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def close(self):
+        if self.raw:
+            self.raw.close()
+            self.raw = None
+
+
+def _open(url, timeout, traced=False):
+    """Connected socket for url, with (sock, host, path). traced records
+    the dns and connect spans."""
+    proto, _, rest = url.partition('//')
+    host, _, path = rest.partition('/')
+    port = 443 if proto == 'https:' else 80
+    if ':' in host:
+        host, port = host.split(':', 1)
+        port = int(port)
+    t = ticks_us()
+    ai = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0]
+    if traced:
+        t = trace.span('dns', t)
+    sock = socket.socket(ai[0], socket.SOCK_STREAM, ai[2])
+    try:
+        sock.settimeout(timeout)
+        sock.connect(ai[-1])
+        if proto == 'https:':
+            try:
+                import ssl
+            except ImportError:
+                import ussl as ssl
+            sock = ssl.wrap_socket(sock, server_hostname=host)
+        if traced:
+            trace.span('connect', t)
+    except Exception:
+        sock.close()
+        raise
+    return sock, host, path
+
+
+def probe(url, timeout_ms):
+    """GET url as a health check. Returns the round trip (connect to
+    status line) in us; raises on a network error or a 5xx status."""
+    t = ticks_us()
+    if not TRACED_HTTP:
+        r = requests.get(url, timeout=timeout_ms / 1000)
+        status = r.status_code
+        r.close()
+    else:
+        sock, host, path = _open(url, timeout_ms / 1000)
+        try:
+            sock.write(b'GET /%s HTTP/1.0\r\nHost: %s\r\n\r\n' % (path.encode('utf-8'), host.encode('utf-8')))
+            parts = sock.readline().split(None, 2)
+        finally:
+            sock.close()
+        if len(parts) < 2:
+            raise ValueError('bad HTTP status line')
+        status = int(parts[1])
+    if status >= 500:
+        raise ValueError('HTTP {}'.format(status))
+    return ticks_diff(ticks_us(), t)
+
+
+def _traced_post(url, data, headers, timeout):
+    """HTTP/1.0 POST over usocket, traced as dns, connect, send and ttfb.
+
+    urequests does all of this inside one call, so it cannot say where the
+    time went. HTTP/1.0 keeps the response simple: no chunked encoding, and
+    the body ends when the server closes the connection.
+    """
+    last_post['connect_us'] = None
+    last_post['ttfb_us'] = None
+    last_post['sent'] = False
+    t0 = ticks_us()
+    sock, host, path = _open(url, timeout, True)
+    t = ticks_us()
+    last_post['connect_us'] = ticks_diff(t, t0)
+    try:
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        sock.write(b'POST /%s HTTP/1.0\r\nHost: %s\r\nContent-Length: %d\r\n' % (
+            path.encode('utf-8'), host.encode('utf-8'), len(data)))
+        for k, v in headers.items():
+            sock.write(b'%s: %s\r\n' % (k.encode('utf-8'), v.encode('utf-8')))
+        sock.write(b'\r\n')
+        sock.write(data)
+        t = trace.span('send', t)
+        last_post['sent'] = True
+        line = sock.readline()
+        last_post['ttfb_us'] = ticks_diff(trace.span('ttfb', t), t)
+        parts = line.split(None, 2)
+        if len(parts) < 2:
+            raise ValueError('bad HTTP status line: {!r}'.format(line))
+        status = int(parts[1])
+        resp_headers = {}
+        while True:
+            line = sock.readline()
+            if not line or line == b'\r\n':
+                break
+            k, _, v = str(line, 'utf-8').partition(':')
+            resp_headers[_canonical_header(k.strip())] = v.strip()
+        return _Response(sock, status, resp_headers)
+    except Exception:
+        sock.close()
+        raise
+
 
 class A1111Client:
     def __init__(self, base_url, user=None, password=None, api_path='/sdapi/v1/txt2img', timeout=30, image_width=240, image_height=240):
@@ -26,6 +235,11 @@ class A1111Client:
         self.image_height = int(image_height) if image_height else 240
         self.auth_header = None
         self.api_key = None
+        # Pixel format of the panel, sent as X-Display-Format with the
+        # display size so the passthrough renders frames for this panel
+        self.display_format = 'rgb565-be'
+        # Optional endpoints.EndpointSelector; base_url is used without one
+        self.endpoints = None
         if user is not None and password is not None:
             creds = '{}:{}'.format(user, password)
             try:
@@ -35,6 +249,19 @@ class A1111Client:
                 import base64
                 self.auth_header = 'Basic ' + base64.b64encode(creds.encode()).decode()
 
+    def _write_raw_meta(self, path, crc):
+        """Record the metadata sidecar for a streamed RGB565 frame."""
+        try:
+            write_frame_meta(
+                path,
+                'rgb565',
+                width=getattr(self, 'target_width', self.image_width),
+                height=getattr(self, 'target_height', self.image_height),
+                crc=crc,
+            )
+        except Exception as e:
+            log.error('Failed to write frame metadata: %s', e)
+
     def build_payload(self, prompt, seed=None, steps=20, cfg_scale=7.0, sampler_name='Euler', width=None, height=None):
         w = int(width) if width else self.image_width
         h = int(height) if height else self.image_height
@@ -50,7 +277,12 @@ class A1111Client:
             payload['seed'] = seed
         return payload
 
-    def txt2img(self, prompt, seed=None, steps=None, cfg_scale=None, sampler_name=None, width=None, height=None):
+    def txt2img(self, prompt, seed=None, steps=None, cfg_scale=None, sampler_name=None, width=None, height=None,
+                priority=None):
+        """Request a frame: the saved frame path, image bytes, or None.
+
+        On None, last_busy['retry_after'] is set if the passthrough was only
+        busy and said when to retry. priority is sent as X-Priority."""
         url = self.base_url + self.api_path
         payload = self.build_payload(
             prompt,
@@ -70,182 +302,256 @@ class A1111Client:
                 headers['X-API-Key'] = self.api_key
             except Exception:
                 pass
+        if priority is not None:
+            headers['X-Priority'] = str(priority)
+        headers['X-Display-Width'] = str(getattr(self, 'target_width', self.image_width))
+        headers['X-Display-Height'] = str(getattr(self, 'target_height', self.image_height))
+        headers['X-Display-Format'] = self.display_format
+        last_body['bytes'] = 0
+        last_body['us'] = 0
+        last_busy['retry_after'] = None
+        last_busy['position'] = None
+        # Debug: print payload that will be sent
+        if __debug__:
+            log.debug('A1111Client: sending payload: %s', payload)
+        data = json.dumps(payload)
+        sel = self.endpoints
+        if sel is None:
+            try:
+                return self._post(url, data, headers)[0]
+            except Exception as e:
+                log.error('txt2img request failed: %s', e)
+                return None
+
+        # Best endpoint first; fail over to the next one when a request did
+        # not reach the server, it answered 5xx or it was busy. Any other
+        # answer (4xx, a body that failed to stream or parse) would fail the
+        # same way elsewhere, so it ends the request
         try:
-            # Debug: print payload that will be sent
+            for ep in sel.candidates():
+                ep.requests += 1
+                try:
+                    r, why = self._post(ep.target + self.api_path, data, headers, ep)
+                except Exception as e:
+                    sel.failed(ep, e)
+                    if TRACED_HTTP and last_post['sent']:
+                        # the server may already be generating this one
+                        log.error('txt2img request failed: %s', e)
+                        return None
+                    log.warn('txt2img via %s failed: %s, trying next endpoint', ep.url, e)
+                    continue
+                if why not in ('busy', 'server'):
+                    return r
+            if last_busy['retry_after'] is not None:
+                log.info('txt2img: passthrough busy, retry in %s s', last_busy['retry_after'])
+            else:
+                log.error('txt2img request failed: no endpoint answered')
+            return None
+        finally:
+            sel.touch()
+
+    def _post(self, url, data, headers, ep=None):
+        """POST data and read the response. Returns (result, why): the
+        frame path or image bytes and None, or None and why there is none:
+        'busy' (see _note_busy; nothing is marked, the endpoint is healthy,
+        just full), 'server' (a 5xx, which marks ep failed) or 'response'
+        (any other failed answer). Network errors raise. With ep, the
+        request's connect time and TTFB are fed to the endpoint selector."""
+        if TRACED_HTTP:
+            r = _traced_post(url, data, headers, self.timeout)
+            connect_us, ttfb_us = last_post['connect_us'], last_post['ttfb_us']
+        else:
+            t = ticks_us()
+            r = requests.post(url, data=data, headers=headers, timeout=self.timeout)
+            connect_us, ttfb_us = None, ticks_diff(trace.span('ttfb', t), t)
+        try:
+            if _note_busy(r):
+                return None, 'busy'
+            if r.status_code >= 500:
+                log.error('API error %d', r.status_code)
+                if ep is not None:
+                    self.endpoints.failed(ep, 'HTTP {}'.format(r.status_code))
+                return None, 'server'
+            if ep is not None:
+                self.endpoints.observe(ep, connect_us=connect_us, ttfb_us=ttfb_us)
+            result = self._read_response(r)
+            return result, None if result is not None else 'response'
+        finally:
             try:
-                print('A1111Client: sending payload:', json.dumps(payload))
+                r.close()
             except Exception:
-                print('A1111Client: sending payload (non-serializable)')
+                pass
+
+    def _read_response(self, r):
+        """Turn a txt2img response into a saved frame path or image bytes."""
+        probe = None
+        if r.status_code != 200:
+            log.error('API error %d', r.status_code)
+            # Try to print response body for debugging
+            try:
+                body = r.text if hasattr(r, 'text') else (r.content if hasattr(r, 'content') else None)
+                log.error('API response body preview: %s', body[:200] if body else None)
+            except Exception:
+                pass
+            return None
+
+        # If the passthrough returns a binary RGB565 stream (application/octet-stream),
+        # return raw bytes directly. Otherwise fall back to JSON image data (base64 PNG).
+        ctype = None
+        try:
+            ctype = r.headers.get('Content-Type')
+        except Exception:
+            pass
+
+        # If headers explicitly indicate binary, stream to file.
+        if ctype and 'application/octet-stream' in ctype:
+            # Stream binary response to file in chunks to avoid high memory usage
+            tmp_path = 'images/last.raw.tmp'
+            final_path = 'images/last.raw'
+            crc = 0
+            try:
+                # Attempt to read in chunks from raw stream if available
+                try:
+                    raw_stream = r.raw
+                    with open(tmp_path, 'wb') as outf:
+                        crc = _drain(raw_stream, outf, crc)
+                except Exception:
+                    crc = None
+                    # Fallback: some request libs provide .content as full bytes
+                    data = r.content if hasattr(r, 'content') else None
+                    if data is None:
+                        # Try reading .raw.read() fully
+                        try:
+                            data = r.raw.read()
+                        except Exception:
+                            data = None
+                    if data is not None:
+                        with open(tmp_path, 'wb') as outf:
+                            outf.write(data)
+                        crc = crc32(data)
+
+                # Rename tmp to final atomically
+                try:
+                    # remove existing final if present
+                    try:
+                        os.remove(final_path)
+                    except Exception:
+                        pass
+                    os.rename(tmp_path, final_path)
+                except Exception as e:
+                    log.error('Failed to rename streamed file: %s', e)
+                    # best-effort: leave tmp file and return None
+                    return None
 
-            # urequests on MicroPython supports timeout param
-            r = requests.post(url, data=json.dumps(payload), headers=headers, timeout=self.timeout)
-            if r.status_code != 200:
-                print('API error', r.status_code)
-                # Try to print response body for debugging
+                self._write_raw_meta(final_path, crc)
+                # Return the path so caller can display file directly
+                return final_path
+            except Exception as e:
+                log.error('Streaming binary response failed: %s', e)
+                # cleanup tmp
                 try:
-                    body = r.text if hasattr(r, 'text') else (r.content if hasattr(r, 'content') else None)
-                    print('API response body preview:', (body[:200] if body else None))
+                    os.remove(tmp_path)
                 except Exception:
                     pass
                 return None
 
-            # If the passthrough returns a binary RGB565 stream (application/octet-stream),
-            # return raw bytes directly. Otherwise fall back to JSON image data (base64 PNG).
-            ctype = None
+        # Automatic1111 returns base64-encoded images in JSON by default under "images"
+        # If headers did not indicate binary, do a safe probe of the body to
+        # decide whether to treat it as JSON or binary. Some urequests builds
+        # don't expose headers reliably, so we peek at the first chunk.
+        try:
+            probe_ok = False
+            probe = None
             try:
-                ctype = r.headers.get('Content-Type')
+                # Try to read a small chunk from the raw stream
+                if hasattr(r, 'raw'):
+                    probe = r.raw.read(512)
+                elif hasattr(r, 'content'):
+                    probe = r.content[:512]
             except Exception:
-                pass
+                probe = None
 
-            # If headers explicitly indicate binary, stream to file.
-            if ctype and 'application/octet-stream' in ctype:
-                # Stream binary response to file in chunks to avoid high memory usage
-                tmp_path = 'images/last.raw.tmp'
-                final_path = 'images/last.raw'
+            if probe:
+                # Check for JSON-like start (whitespace then '{' or '[')
+                s = probe.lstrip()[:1]
+                if s in (b'{', b'[') if isinstance(s, bytes) else s in ('{', '['):
+                    probe_ok = 'json'
+                else:
+                    # If starts with PNG signature or non-text bytes, treat as binary
+                    if isinstance(probe, (bytes, bytearray)) and probe.startswith(b'\x89PNG'):
+                        probe_ok = 'binary'
+                    else:
+                        # Heuristic: if many non-ASCII bytes in probe, assume binary
+                        non_ascii = sum(1 for c in probe if isinstance(c, int) and (c < 32 or c > 127))
+                        if non_ascii > 50:
+                            probe_ok = 'binary'
+                        else:
+                            probe_ok = 'json'
+
+            # If probe decided binary, stream the remaining content plus probe to file
+            if probe_ok == 'binary':
                 try:
-                    # Attempt to read in chunks from raw stream if available
-                    try:
-                        raw_stream = r.raw
-                        with open(tmp_path, 'wb') as outf:
-                            while True:
-                                chunk = raw_stream.read(4096)
-                                if not chunk:
-                                    break
-                                outf.write(chunk)
-                    except Exception:
-                        # Fallback: some request libs provide .content as full bytes
-                        data = r.content if hasattr(r, 'content') else None
-                        if data is None:
-                            # Try reading .raw.read() fully
-                            try:
-                                data = r.raw.read()
-                            except Exception:
-                                data = None
-                        if data is not None:
-                            with open(tmp_path, 'wb') as outf:
-                                outf.write(data)
-
-                    # Rename tmp to final atomically
+                    tmp_path = 'images/last.raw.tmp'
+                    final_path = 'images/last.raw'
+                    crc = 0
+                    with open(tmp_path, 'wb') as outf:
+                        if probe:
+                            outf.write(probe)
+                            crc = crc32(probe, crc)
+                        # attempt to drain rest of stream
+                        try:
+                            if hasattr(r, 'raw'):
+                                crc = _drain(r.raw, outf, crc)
+                            elif hasattr(r, 'content'):
+                                rest = r.content[len(probe) if probe else 0:]
+                                outf.write(rest)
+                                if crc is not None:
+                                    crc = crc32(rest, crc)
+                        except Exception:
+                            crc = None
                     try:
-                        # remove existing final if present
                         try:
                             os.remove(final_path)
                         except Exception:
                             pass
                         os.rename(tmp_path, final_path)
                     except Exception as e:
-                        print('Failed to rename streamed file:', e)
-                        # best-effort: leave tmp file and return None
+                        log.error('Failed to rename streamed file (probe): %s', e)
                         return None
-
-                    # Return the path so caller can display file directly
+                    self._write_raw_meta(final_path, crc)
                     return final_path
                 except Exception as e:
-                    print('Streaming binary response failed:', e)
-                    # cleanup tmp
+                    log.error('Probe-based streaming failed: %s', e)
                     try:
                         os.remove(tmp_path)
                     except Exception:
                         pass
                     return None
+        except Exception:
+            pass
 
-            # Automatic1111 returns base64-encoded images in JSON by default under "images"
-            # If headers did not indicate binary, do a safe probe of the body to
-            # decide whether to treat it as JSON or binary. Some urequests builds
-            # don't expose headers reliably, so we peek at the first chunk.
+        # If we get here, treat the response as JSON and attempt to decode it.
+        # The probe above already consumed the start of the body.
+        try:
+            data = json.loads(probe + r.content) if probe else r.json()
+        except Exception as e:
+            log.error('Failed to decode JSON from response: %s', e)
             try:
-                probe_ok = False
-                probe = None
-                try:
-                    # Try to read a small chunk from the raw stream
-                    if hasattr(r, 'raw'):
-                        probe = r.raw.read(512)
-                    elif hasattr(r, 'content'):
-                        probe = r.content[:512]
-                except Exception:
-                    probe = None
-
-                if probe:
-                    # Check for JSON-like start (whitespace then '{' or '[')
-                    s = probe.lstrip()[:1]
-                    if s in (b'{', b'[') if isinstance(s, bytes) else s in ('{', '['):
-                        probe_ok = 'json'
-                    else:
-                        # If starts with PNG signature or non-text bytes, treat as binary
-                        if isinstance(probe, (bytes, bytearray)) and probe.startswith(b'\x89PNG'):
-                            probe_ok = 'binary'
-                        else:
-                            # Heuristic: if many non-ASCII bytes in probe, assume binary
-                            non_ascii = sum(1 for c in probe if isinstance(c, int) and (c < 32 or c > 127))
-                            if non_ascii > 50:
-                                probe_ok = 'binary'
-                            else:
-                                probe_ok = 'json'
-
-                # If probe decided binary, stream the remaining content plus probe to file
-                if probe_ok == 'binary':
-                    try:
-                        tmp_path = 'images/last.raw.tmp'
-                        final_path = 'images/last.raw'
-                        with open(tmp_path, 'wb') as outf:
-                            if probe:
-                                outf.write(probe)
-                            # attempt to drain rest of stream
-                            try:
-                                if hasattr(r, 'raw'):
-                                    while True:
-                                        chunk = r.raw.read(4096)
-                                        if not chunk:
-                                            break
-                                        outf.write(chunk)
-                                elif hasattr(r, 'content'):
-                                    outf.write(r.content[len(probe) if probe else 0:])
-                            except Exception:
-                                pass
-                        try:
-                            try:
-                                os.remove(final_path)
-                            except Exception:
-                                pass
-                            os.rename(tmp_path, final_path)
-                        except Exception as e:
-                            print('Failed to rename streamed file (probe):', e)
-                            return None
-                        return final_path
-                    except Exception as e:
-                        print('Probe-based streaming failed:', e)
-                        try:
-                            os.remove(tmp_path)
-                        except Exception:
-                            pass
-                        return None
+                body = r.text if hasattr(r, 'text') else (r.content if hasattr(r, 'content') else None)
+                log.error('Raw response preview: %s', body[:400] if body else None)
             except Exception:
                 pass
-
-            # If we get here, treat the response as JSON and attempt to decode it
+            return None
+        images = data.get('images')
+        if images and len(images) > 0:
+            # images[0] is base64 PNG
+            b64 = images[0]
             try:
-                data = r.json()
-            except Exception as e:
-                print('Failed to decode JSON from response:', e)
-                try:
-                    body = r.text if hasattr(r, 'text') else (r.content if hasattr(r, 'content') else None)
-                    print('Raw response preview:', (body[:400] if body else None))
-                except Exception:
-                    pass
-                return None
-            images = data.get('images')
-            if images and len(images) > 0:
-                # images[0] is base64 PNG
-                b64 = images[0]
-                try:
-                    img_bytes = ubinascii.a2b_base64(b64)
-                    return img_bytes
-                except Exception:
-                    import base64
-                    return base64.b64decode(b64)
-            else:
-                print('No images in response')
-                return None
-        except Exception as e:
-            print('txt2img request failed:', e)
+                img_bytes = ubinascii.a2b_base64(b64)
+                return img_bytes
+            except Exception:
+                import base64
+                return base64.b64decode(b64)
+        else:
+            log.warn('No images in response')
             return None
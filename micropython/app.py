@@ -3,15 +3,27 @@ import time
 import json
 import random
 
-from api_client import A1111Client
-from storage import atomic_write, read_binary
+from api_client import PRIORITY_BACKGROUND, PRIORITY_RETRY, A1111Client, last_body, last_busy, probe
+from endpoints import EndpointSelector
+from storage import atomic_write, check_frame, crc32, discard_frame, update_frame_meta, write_frame_meta
 from buttons import Buttons
+from bufpool import pool
+from log import log
+from demostore import as_store
+from telemetry import boot, mem, ticks_diff, ticks_ms, ticks_us, trace
+
+# Precompiled RGB565 placeholder, shown while a request waits for WiFi
+PLACEHOLDER_RAW = 'assets/unknown_portrait.raw'
+# Longest Retry-After honoured; a longer one is clamped to this
+BUSY_RETRY_MAX_S = 60
 
 
 class PersonClickerApp:
     def __init__(self, cfg, demos, secrets, display, wifi):
         self.cfg = cfg or {}
-        self.demos = demos or {}
+        # demographics.json dict or a packed DemographicsStore; both expose
+        # count(key)/value(key, i) so values are fetched by index on demand
+        self.demos = as_store(demos)
         self.secrets = secrets or {}
         self.display = display
         self.wifi = wifi
@@ -19,9 +31,11 @@ class PersonClickerApp:
         user = (self.secrets.get('automatic1111') or {}).get('user')
         password = (self.secrets.get('automatic1111') or {}).get('password')
         api_key = (self.secrets.get('automatic1111') or {}).get('api_key') or self.secrets.get('SERVICE_API_KEY') if self.secrets else None
+        # The panel actually driven; the config only when the display
+        # object does not say
         disp_cfg = self.cfg.get('display', {})
-        img_w = disp_cfg.get('width', 240)
-        img_h = disp_cfg.get('height', 240)
+        img_w = getattr(display, 'width', None) or disp_cfg.get('width', 240)
+        img_h = getattr(display, 'height', None) or disp_cfg.get('height', 240)
         # Allow requesting a different size from upstream A1111 (e.g. 512)
         req_size = self.cfg.get('image_request_size') or None
         if req_size:
@@ -47,8 +61,13 @@ class PersonClickerApp:
         try:
             self.client.target_width = img_w
             self.client.target_height = img_h
+            self.client.display_format = getattr(display, 'PIXEL_FORMAT', 'rgb565-be')
         except Exception:
             pass
+        # Route each request to the fastest healthy passthrough among
+        # api_endpoints (or just api_base_url), failing over between them
+        urls = self.cfg.get('api_endpoints') or [api_base]
+        self.client.endpoints = EndpointSelector(urls, self.cfg.get('endpoints'), probe=probe)
         # attach API key to client for passthrough authorization if available
         try:
             if api_key:
@@ -56,6 +75,13 @@ class PersonClickerApp:
         except Exception:
             pass
         self.current_selection = {'A': None, 'B': None, 'X': None, 'Y': None}
+        # Store index of each selected value, persisted with it so the first
+        # pick after boot need not search the store for the restored value
+        self.current_index = {'A': None, 'B': None, 'X': None, 'Y': None}
+        # Recency ring per category: indices of the last no_repeat_window
+        # picks (most recent first), none of which is picked next
+        self.no_repeat_window = max(0, int((self.cfg.get('selection') or {}).get('no_repeat_window', 1)))
+        self._recent_picks = {}
         self.request_id = 0
         # Persistent random seed used for generation. It remains the same
         # across category changes until the joystick/randomizer (CTRL)
@@ -75,16 +101,40 @@ class PersonClickerApp:
         # use `category_presses_change_seed` explicitly.
         behavior_cfg = (self.cfg.get('behavior') or {})
         self.category_presses_change_seed = bool(behavior_cfg.get('category_presses_change_seed', False))
+        # Optional boot prefetch: once WiFi is up, fetch (or find in the frame
+        # cache) the image for the restored selection before the first press.
+        # With boot_prefetch_show it is displayed as soon as it is ready;
+        # otherwise the first button press reveals it.
+        self.boot_prefetch = bool(behavior_cfg.get('boot_prefetch', False))
+        self.boot_prefetch_show = bool(behavior_cfg.get('boot_prefetch_show', False))
+        self._state_restored = False
+        self._prefetched = None
         # Internal flag to indicate we've seen the first user interaction
         self._first_interaction_seen = False
         # Track if we're in an API error state to show "Retrying..." on next button press
         self._api_error_state = False
+        self._mem_chord_latched = False
+        # Dump-chord button -> ticks_ms of a press not yet dispatched
+        self._chord_pending = {}
+        # While WiFi is down the latest intended (selection, seed) waits here
+        # and is sent once the link is back
+        self.queue_when_offline = bool(behavior_cfg.get('queue_when_offline', True))
+        self._pending_job = None
+        # A passthrough that answers 503 + Retry-After (overloaded) gets the
+        # same pending job, sent again once (start_ms, wait_ms) has elapsed,
+        # at most busy_retries times per press before "Try again?"
+        self.busy_retries = int(behavior_cfg.get('busy_retries', 5))
+        self._busy_count = 0
+        self._retry_at = None
+        # (edge_us, handled_us) of the press that triggered the next request
+        self._press = None
         # Attempt to load persisted state (last selections + seed)
         try:
             self._load_persistent_state()
         except Exception:
             # If loading fails for any reason, proceed with defaults
             pass
+        self._prefetch_pending = self.boot_prefetch and self._state_restored
 
     def run(self):
         # Main event loop - initialization phases happen here before entering the loop
@@ -92,12 +142,7 @@ class PersonClickerApp:
         hb_count = 0
 
         # Show button initialization phase
-        try:
-            self.display.show_boot_phase("Buttons: starting", bg_color=(128, 64, 0), fg_color=(255, 255, 255), scale=2)
-            import time
-            time.sleep(1)
-        except Exception as e:
-            print(f"Button init phase display failed: {e}")
+        boot.show_phase(self.display, 'buttons', "Buttons: starting", bg_color=(128, 64, 0), fg_color=(255, 255, 255))
 
         # Setup buttons (if any) using pins from config
         try:
@@ -107,58 +152,20 @@ class PersonClickerApp:
         except Exception as e:
             print(f'Button initialization failed: {e}')
             self.buttons = None
+        boot.mark('buttons')
 
         # All initialization complete - now render the portrait for the first and only time
         print("All initialization complete, rendering portrait...")
-        
-        # Show the appropriate image based on configuration
-        if self.show_cached_on_boot:
-            # Show cached image if available
-            data = read_binary('images/last.raw')
-            if data:
-                try:
-                    self.display.draw_rgb565_raw('images/last.raw')
-                    print("Displayed cached raw image")
-                except Exception as e:
-                    print(f"Cached raw failed: {e}, falling back to placeholder")
-                    try:
-                        self.display.show_placeholder()
-                        print("Displayed placeholder (cached raw failed)")
-                    except Exception as e2:
-                        print(f"Placeholder fallback failed: {e2}")
-            else:
-                data = read_binary('images/last.png')
-                if data:
-                    try:
-                        self.display.draw_scaled_png('images/last.png')
-                        print("Displayed cached PNG image")
-                    except Exception as e:
-                        print(f"Cached PNG failed: {e}, falling back to placeholder")
-                        try:
-                            self.display.show_placeholder()
-                            print("Displayed placeholder (cached PNG failed)")
-                        except Exception as e2:
-                            print(f"Placeholder fallback failed: {e2}")
-                else:
-                    try:
-                        self.display.show_placeholder()
-                        print("Displayed placeholder (no cached image)")
-                    except Exception as e:
-                        print(f"Placeholder display failed: {e}")
+        boot.settle()
+        if boot.instant:
+            # The instant-on frame from main.py is already on screen; just
+            # remove the boot status band from it.
+            self.display.clear_status(boot.instant)
         else:
-            # Show placeholder/unknown portrait
-            try:
-                self.display.show_placeholder()
-                print("Displayed placeholder portrait")
-            except Exception as e:
-                print(f"Placeholder display failed: {e}")
-                # Try a simple fallback - fill with a color
-                try:
-                    self.display.driver.fill(0x0000)  # Black screen
-                    self.display.driver.text("Portrait failed", 10, 100, 0xFFFF)
-                    print("Displayed error message")
-                except Exception as e2:
-                    print(f"Error message display failed: {e2}")
+            self._show_boot_frame()
+        boot.mark('first_frame')
+        boot.report()
+        mem.sample('boot')
 
         while True:
             try:
@@ -168,16 +175,23 @@ class PersonClickerApp:
                         # For simple compatibility, support both Buttons.poll_events() and Buttons.update()/is_pressed()
                         if hasattr(self.buttons, 'poll_events'):
                             events = self.buttons.poll_events() or {}
+                            # Debug chord: presses of its buttons wait a
+                            # chord window and are dropped if the chord fires
+                            events = self._hold_chord_presses(events)
                             # events: dict of name -> pressed bool
                             for name, pressed in events.items():
                                 if not pressed:
                                     continue
+                                self._note_press(name)
                                 # Mark that we've received the first user interaction
                                 if not self._first_interaction_seen:
                                     self._first_interaction_seen = True
                                     # If we were deferring showing cached image on boot,
                                     # allow the first button press to trigger a selection
                                     # and image request as normal. No extra action needed.
+                                    # A held boot prefetch is revealed by the first press instead.
+                                    if self._reveal_prefetched():
+                                        continue
                                 if name in ('A', 'B', 'X', 'Y'):
                                     # map to category keys
                                     cat = name
@@ -218,8 +232,11 @@ class PersonClickerApp:
                             self.buttons.update()
                             for key in ('A', 'B', 'X', 'Y'):
                                 if self.buttons.is_pressed(key):
+                                    self._note_press(key)
                                     if not self._first_interaction_seen:
                                         self._first_interaction_seen = True
+                                        if self._reveal_prefetched():
+                                            break
                                     val = self.pick_new_for_category(key)
                                     print('Button', key, 'pressed ->', val)
                                     # Show "Retrying..." if we're in an error state
@@ -237,6 +254,7 @@ class PersonClickerApp:
                                         print('Category press -> new seed', seed)
                                         self.request_image(seed=seed)
                             if self.buttons.is_pressed('CTRL'):
+                                self._note_press('CTRL')
                                 # Show "Retrying..." if we're in an error state
                                 if self._api_error_state:
                                     try:
@@ -250,73 +268,268 @@ class PersonClickerApp:
                     except Exception as e:
                         print('Button poll failed', e)
 
+                # Boot prefetch for the restored selection, once the link is up
+                if self._prefetch_pending:
+                    self._poll_boot_prefetch()
+
+                # Record when the link first comes up so it lands on the boot timeline
+                if self.wifi and not boot.done('wifi_up'):
+                    try:
+                        if self.wifi.is_connected():
+                            boot.mark('wifi_up', since='wifi_start')
+                            boot.report()
+                    except Exception:
+                        pass
+
+                # Advance the WiFi state machine on every pass so a dropped
+                # link is re-joined straight away (poll() rate-limits itself)
+                if self.wifi:
+                    try:
+                        self.wifi.poll()
+                    except Exception as e:
+                        log.warn('wifi poll failed: %s', e)
+
+                # Send the request queued while offline once the link is back,
+                # or one the passthrough was too busy for once it said to
+                if self._pending_job and self._online() and self._retry_due():
+                    self._send_pending()
+
+                # Health-probe one passthrough endpoint if one is due; the
+                # selector only probes after a quiet spell without requests
+                try:
+                    self.client.endpoints.poll(idle=not self._pending_job and self._online())
+                except Exception as e:
+                    log.warn('endpoint probe failed: %s', e)
+
+                # Idle point: run any garbage collection the hot paths deferred,
+                # flush buffered log messages to the console and take the
+                # periodic largest-block probe
+                pool.idle()
+                log.idle()
+                mem.idle()
+
                 # Heartbeat: every ~5 seconds print a short status so testers know the app is alive
                 time.sleep(0.1)
                 hb_count += 1
                 if hb_count >= 50:
                     hb_count = 0
                     try:
-                        # advance wifi state machine before reading status
-                        try:
-                            if self.wifi:
-                                self.wifi.poll()
-                        except Exception:
-                            pass
                         status = self.wifi.status() if self.wifi else 'no-wifi'
                     except Exception:
                         status = 'status-error'
                     print('heartbeat: wifi=', status)
+                    trace.summary()
             except KeyboardInterrupt:
                 # Allow a manual interrupt during testing
                 print('PersonClickerApp: interrupted')
                 raise
 
-    def pick_new_for_category(self, cat_key):
-        cat = (self.demos.get('categories') or {}).get(cat_key)
-        if not cat:
-            return None
-        values = cat.get('values') or []
-        if not values:
-            return None
-        current = self.current_selection.get(cat_key)
-        max_retry = self.cfg.get('selection', {}).get('max_retry_pick_different', 5)
-        for _ in range(max_retry):
-            cand = random.choice(values)
-            if cand != current:
-                self.current_selection[cat_key] = cand
-                # Persist selection change immediately so reboot preserves it
+    def _note_press(self, name):
+        """Remember when the press that may start the next request happened."""
+        edge = None
+        try:
+            edge = self.buttons.edge_us(name)
+        except Exception:
+            pass
+        now = ticks_us()
+        self._press = (edge if edge is not None else now, now)
+
+    def _hold_chord_presses(self, events):
+        """Return the presses to dispatch now. A press of a dump-chord button
+        is held for telemetry.mem.chord_window_ms: if the chord completes
+        meanwhile every held press is dropped, otherwise it is released."""
+        if not getattr(self.buttons, 'held', None) or not mem.dump_chord:
+            return events
+        now = ticks_ms()
+        for name in mem.dump_chord:
+            if events.pop(name, None):
+                self._chord_pending.setdefault(name, now)
+        if self._poll_dump_chord():
+            self._chord_pending = {}
+            return events
+        for name, t in list(self._chord_pending.items()):
+            if ticks_diff(now, t) >= mem.chord_window_ms:
+                del self._chord_pending[name]
+                events[name] = True
+        return events
+
+    def _poll_dump_chord(self):
+        """Dump and export telemetry.mem and the latency trace when the dump
+        chord is held. Fires once per hold; returns True on the poll that
+        fired."""
+        held = getattr(self.buttons, 'held', None)
+        if not held or not mem.dump_chord:
+            return False
+        for label in mem.dump_chord:
+            if not held(label):
+                self._mem_chord_latched = False
+                return False
+        if self._mem_chord_latched:
+            return False
+        self._mem_chord_latched = True
+        mem.sample('chord', probe=True)
+        mem.dump()
+        path = mem.export()
+        if path:
+            print('mem profile written to', path)
+        log.flush()
+        trace.summary(force=True)
+        path = trace.dump()
+        if path:
+            print('trace written to', path)
+        if self.wifi and hasattr(self.wifi, 'metrics'):
+            print('wifi:', self.wifi.metrics())
+        for ep in self.client.endpoints.stats():
+            print('endpoint:', ep)
+        return True
+
+    def _show_boot_frame(self):
+        """Render the first frame after boot.
+
+        With show_cached_on_boot the cached frames are validated against
+        their metadata sidecars, including the full checksum, before any
+        pixel is written (see storage.check_frame). Corrupt or truncated
+        frames are discarded and the next candidate is tried.
+        """
+        if self.show_cached_on_boot:
+            w = getattr(self.display, 'width', None)
+            h = getattr(self.display, 'height', None)
+            meta = check_frame('images/last.raw', 'rgb565', w, h, full=True)
+            if meta is None:
+                discard_frame('images/last.raw')
+            else:
                 try:
-                    self._save_persistent_state()
-                except Exception:
-                    pass
-                return cand
-        # fallback: pick the first different value deterministically
-        for v in values:
-            if v != current:
-                self.current_selection[cat_key] = v
+                    if self.display.draw_rgb565_raw('images/last.raw'):
+                        print("Displayed cached raw image")
+                        return
+                    print("Cached raw image failed to display, discarding")
+                    discard_frame('images/last.raw')
+                except Exception as e:
+                    print(f"Cached raw failed: {e}")
+            if check_frame('images/last.png', 'png', full=True) is not None:
                 try:
-                    self._save_persistent_state()
-                except Exception:
-                    pass
-                return v
-        return current
+                    self.display.draw_scaled_png('images/last.png')
+                    print("Displayed cached PNG image")
+                    return
+                except Exception as e:
+                    print(f"Cached PNG failed: {e}, falling back to placeholder")
+            try:
+                self.display.show_placeholder()
+                print("Displayed placeholder (no usable cached image)")
+            except Exception as e:
+                print(f"Placeholder display failed: {e}")
+            return
+
+        # Show placeholder/unknown portrait
+        try:
+            self.display.show_placeholder()
+            print("Displayed placeholder portrait")
+        except Exception as e:
+            print(f"Placeholder display failed: {e}")
+            # Try a simple fallback - fill with a color
+            try:
+                self.display.driver.fill(0x0000)  # Black screen
+                self.display.driver.text("Portrait failed", 10, 100, 0xFFFF)
+                print("Displayed error message")
+            except Exception as e2:
+                print(f"Error message display failed: {e2}")
+
+    def _poll_boot_prefetch(self):
+        """Run the boot prefetch once WiFi reports connected.
+
+        Called from the main loop while a prefetch is pending. Skipped if
+        the user has already pressed something. The request runs inline in
+        the loop (there is no second thread for networking on the Pico), but
+        only before the first interaction.
+        """
+        if self._first_interaction_seen:
+            self._prefetch_pending = False
+            return
+        try:
+            if not (self.wifi and self.wifi.is_connected()):
+                return
+        except Exception:
+            return
+        self._prefetch_pending = False
+        prompt = self.build_prompt()
+        key = self._cache_key(prompt, self.current_seed)
+        frame = self._cached_frame(key)
+        if frame:
+            print('Boot prefetch: cache hit', frame[0])
+            if self.show_cached_on_boot:
+                # Already on screen from the boot frame
+                return
+        else:
+            print('Boot prefetch: requesting image for restored selection')
+            frame = self._fetch_image(prompt, self.current_seed, PRIORITY_BACKGROUND)
+            if not frame:
+                print('Boot prefetch failed')
+                return
+        if self.boot_prefetch_show:
+            self._show_frame(*frame)
+        else:
+            self._prefetched = frame
+
+    def _reveal_prefetched(self):
+        """Show a held boot prefetch; returns True if the press was consumed."""
+        if not self._prefetched:
+            return False
+        frame = self._prefetched
+        self._prefetched = None
+        print('Showing prefetched image for restored selection')
+        self._show_frame(*frame)
+        return True
+
+    def pick_new_for_category(self, cat_key):
+        if not self.demos.count(cat_key):
+            return None
+        recent = self._recent_picks.get(cat_key)
+        if recent is None:
+            # First pick since boot: seed the ring with the (possibly
+            # restored) current value so it is not picked again. The saved
+            # index is only trusted if it still names the saved value.
+            i = self.current_index.get(cat_key)
+            if i is not None and self.demos.value(cat_key, i) != self.current_selection.get(cat_key):
+                i = None
+            recent = [] if i is None else [i]
+            self._recent_picks[cat_key] = recent
+        # sample() never returns an index in recent, so no retry loop
+        i = self.demos.sample(cat_key, recent)
+        recent.insert(0, i)
+        del recent[self.no_repeat_window:]
+        cand = self.demos.value(cat_key, i)
+        self.current_selection[cat_key] = cand
+        self.current_index[cat_key] = i
+        # Persist selection change immediately so reboot preserves it
+        try:
+            self._save_persistent_state()
+        except Exception:
+            pass
+        return cand
 
     def _load_persistent_state(self):
         """Load persisted state from 'state.json' if present.
 
-        Expected shape: {"current_selection": {A:B,...}, "current_seed": 1234}
+        Expected shape: {"current_selection": {A:B,...}, "current_index":
+        {A:i,...}, "current_seed": 1234}
         """
         try:
             with open('state.json', 'r') as f:
                 data = json.load(f)
             if not isinstance(data, dict):
                 return
+            self._state_restored = True
             sel = data.get('current_selection')
             if isinstance(sel, dict):
                 # Only assign known keys to avoid unexpected data pollution
                 for k in ('A', 'B', 'X', 'Y'):
                     if k in sel:
                         self.current_selection[k] = sel.get(k)
+            idx = data.get('current_index')
+            if isinstance(idx, dict):
+                for k in ('A', 'B', 'X', 'Y'):
+                    if isinstance(idx.get(k), int):
+                        self.current_index[k] = idx[k]
             seed = data.get('current_seed')
             if seed is not None:
                 try:
@@ -329,12 +542,14 @@ class PersonClickerApp:
             pass
 
     def _save_persistent_state(self):
-        """Atomically write state.json containing current_selection and current_seed.
+        """Atomically write state.json containing current_selection,
+        current_index and current_seed.
 
         Uses atomic_write for safe writes when available; falls back to simple write.
         """
         payload = {
             'current_selection': self.current_selection,
+            'current_index': self.current_index,
             'current_seed': getattr(self, 'current_seed', None)
         }
         try:
@@ -354,7 +569,6 @@ class PersonClickerApp:
     def build_prompt(self):
         # Simple prompt builder: concatenate selected category values only
         parts = []
-        cats = self.demos.get('categories') or {}
         for k in ['A', 'B', 'X', 'Y']:
             val = self.current_selection.get(k)
             # Only include the raw value (no category name)
@@ -380,10 +594,22 @@ class PersonClickerApp:
 
         return prompt
 
-    def request_image(self, seed=None):
+    def request_image(self, seed=None, retry=False):
+        t_prompt = ticks_us()
         prompt = self.build_prompt()
         self.request_id += 1
         rid = self.request_id
+        # Trace from the button edge when a press triggered this request:
+        # edge (edge -> handler), settle (handler -> request, including the
+        # selection save and any retry message) and prompt
+        press, self._press = self._press, None
+        if press:
+            trace.begin(rid, press[0])
+            trace.span('edge', press[0], press[1])
+            trace.span('settle', press[1], t_prompt)
+        else:
+            trace.begin(rid, t_prompt)
+        trace.span('prompt', t_prompt)
         # Determine which seed to use. If caller provided an explicit seed
         # (e.g. joystick/randomizer), adopt it and store as the current seed.
         # Otherwise reuse the persistent seed so category changes are
@@ -409,62 +635,191 @@ class PersonClickerApp:
                 pass
             seed_to_use = seed
 
+        # Known offline: queue instead of spending a socket timeout on a
+        # link that is down
+        if self.queue_when_offline and not self._online():
+            self._queue_offline(prompt, seed_to_use)
+            return
+        self._pending_job = None
+        self._retry_at = None
+        if not retry:
+            self._busy_count = 0
+
         # call API synchronously for now
-        result = self.client.txt2img(
-            prompt,
-            seed=seed_to_use,
-            steps=self.cfg.get('generation', {}).get('steps'),
-            cfg_scale=self.cfg.get('generation', {}).get('cfg_scale'),
-            sampler_name=self.cfg.get('generation', {}).get('sampler_name'),
-        )
-        if not result:
+        fetched = self._fetch_image(prompt, seed_to_use, PRIORITY_RETRY if retry else None)
+        # The request leaves plenty of short-lived garbage behind; collect
+        # it at the next idle point rather than in the middle of a draw
+        pool.collect_soon()
+        if not fetched and last_busy['retry_after'] is not None and self._busy_count < self.busy_retries:
+            self._queue_busy(seed_to_use)
+            return
+        if not fetched:
             print('No image bytes received')
             self.display.show_text('Try again?')
             # Set API error state so next button press shows "Retrying..."
             self._api_error_state = True
             return
 
-        # If the client returned a file path (streamed raw data), display directly
-        if isinstance(result, str):
-            path = result
-            if rid == self.request_id:
-                try:
-                    self.display.draw_rgb565_raw(path)
-                    # Clear API error state on successful display
-                    self._api_error_state = False
-                except Exception as e:
-                    print('display raw failed', e)
-                    self.display.show_text('Display Error')
+        if rid == self.request_id:
+            if self._show_frame(*fetched):
+                # Clear API error state on successful display
+                self._api_error_state = False
+                trace.finish()
+
+    def _online(self):
+        """False only when the WiFi manager knows the link is down. Without a
+        network module (host runs) requests go straight out."""
+        if not self.wifi:
+            return True
+        try:
+            return self.wifi.status() in ('connected', 'no_network')
+        except Exception:
+            return True
+
+    def _queue_offline(self, prompt, seed):
+        """Keep (selection, seed) as the single pending job, replacing any
+        older one, and show the best frame available meanwhile: the cached
+        frame for this exact request, else the placeholder with an offline
+        status band."""
+        self._pending_job = (dict(self.current_selection), seed)
+        self._retry_at = None
+        frame = self._cached_frame(self._cache_key(prompt, seed))
+        if frame:
+            log.info('offline: showing cached frame for this request')
+            self._pending_job = None
+            if self._show_frame(*frame):
+                self._api_error_state = False
+                trace.finish()
             return
+        log.info('offline: request queued until WiFi is back (seed %d)', seed)
+        w = getattr(self.display, 'width', None)
+        h = getattr(self.display, 'height', None)
+        if check_frame(PLACEHOLDER_RAW, 'rgb565', w, h) is None \
+                or not self.display.draw_rgb565_raw(PLACEHOLDER_RAW):
+            self.display.show_placeholder()
+        self.display.show_status('Offline: queued', bg_color=(160, 80, 0))
+
+    def _queue_busy(self, seed):
+        """The passthrough is overloaded and said when to come back: keep the
+        job pending until then, with a status band over the current frame,
+        instead of showing 'Try again?'."""
+        self._busy_count += 1
+        wait_s = min(BUSY_RETRY_MAX_S, max(1, int(last_busy['retry_after'])))
+        self._pending_job = (dict(self.current_selection), seed)
+        self._retry_at = (ticks_ms(), int(wait_s * 1000))
+        log.info('passthrough busy (queue position %s): retry %d/%d in %d s',
+                 last_busy['position'], self._busy_count, self.busy_retries, wait_s)
+        if last_busy['position']:
+            self.display.show_status('Busy #{}, retry {}s'.format(last_busy['position'], wait_s),
+                                     bg_color=(160, 80, 0))
+        else:
+            self.display.show_status('Busy, retry in {}s'.format(wait_s), bg_color=(160, 80, 0))
+
+    def _retry_due(self):
+        if self._retry_at is None:
+            return True
+        start, wait_ms = self._retry_at
+        return ticks_diff(ticks_ms(), start) >= wait_ms
+
+    def _send_pending(self):
+        """Send the job queued while offline or turned away as busy."""
+        selection, seed = self._pending_job
+        retry = self._retry_at is not None
+        self._pending_job = None
+        self._retry_at = None
+        log.info('sending queued request%s', ' (busy retry)' if retry else '')
+        self.current_selection.update(selection)
+        self.current_seed = seed
+        self.request_image(seed=None, retry=retry)
+
+    def _cache_key(self, prompt, seed):
+        """Identify a generation so cached frames can be matched to requests."""
+        gen = self.cfg.get('generation', {})
+        return '{}|{}|{}|{}|{}|{}'.format(
+            prompt, seed, gen.get('steps'), gen.get('cfg_scale'), gen.get('sampler_name'),
+            self.cfg.get('image_request_size'))
+
+    def _cached_frame(self, key):
+        """Return (path, fmt) of a cached frame generated for key, or None."""
+        w = getattr(self.display, 'width', None)
+        h = getattr(self.display, 'height', None)
+        meta = check_frame('images/last.raw', 'rgb565', w, h)
+        if meta is not None and meta.get('key') == key:
+            return ('images/last.raw', 'rgb565')
+        meta = check_frame('images/last.png', 'png')
+        if meta is not None and meta.get('key') == key:
+            return ('images/last.png', 'png')
+        return None
+
+    def _fetch_image(self, prompt, seed, priority=None):
+        """Request an image and save it to the frame cache.
+
+        Returns (path, fmt) of the saved frame, or None on failure. The
+        frame's metadata sidecar records the cache key for _cached_frame().
+        priority is the request's X-Priority (None: interactive).
+        """
+        key = self._cache_key(prompt, seed)
+        mem.sample('request')
+        # Radio in its performance power mode for the transfer
+        if self.wifi:
+            self.wifi.busy(True)
+        try:
+            result = self.client.txt2img(
+                prompt,
+                seed=seed,
+                steps=self.cfg.get('generation', {}).get('steps'),
+                cfg_scale=self.cfg.get('generation', {}).get('cfg_scale'),
+                sampler_name=self.cfg.get('generation', {}).get('sampler_name'),
+                priority=priority,
+            )
+        finally:
+            if self.wifi:
+                self.wifi.busy(False)
+                # Feed the body's link throughput to the AP migration check
+                self.wifi.note_transfer(last_body['bytes'], last_body['us'])
+        mem.sample('download')
+        if not result:
+            return None
+
+        # If the client returned a file path (streamed raw data) it already
+        # wrote the sidecar; just tag it with the key
+        if isinstance(result, str):
+            update_frame_meta(result, {'key': key})
+            return (result, 'rgb565')
 
         # Otherwise result is raw bytes (PNG or raw rgb565 in memory)
         img_bytes = result
         expected_size = (self.display.width * self.display.height * 2) if (hasattr(self.display, 'width') and hasattr(self.display, 'height')) else None
+        t = ticks_us()
         if expected_size and len(img_bytes) == expected_size:
             # Save raw file atomically
-            if atomic_write('images/last.raw', img_bytes):
-                if rid == self.request_id:
-                    try:
-                        self.display.draw_rgb565_raw('images/last.raw')
-                        # Clear API error state on successful display
-                        self._api_error_state = False
-                    except Exception as e:
-                        print('display raw failed', e)
-                        self.display.show_text('Display Error')
-            return
+            if not atomic_write('images/last.raw', img_bytes):
+                return None
+            write_frame_meta('images/last.raw', 'rgb565', self.display.width, self.display.height,
+                             crc32(img_bytes), extra={'key': key})
+            trace.span('flash', t)
+            return ('images/last.raw', 'rgb565')
 
         # Fallback: save as PNG for backward compatibility
-        if atomic_write('images/last.png', img_bytes):
-            if rid == self.request_id:
-                try:
-                    self.display.draw_scaled_png('images/last.png')
-                    # Clear API error state on successful display
-                    self._api_error_state = False
-                except Exception as e:
-                    print('display png failed', e)
-                    self.display.show_text('Display Error')
-        else:
-            print('No image bytes received')
-            self.display.show_text('Try again?')
-            # Set API error state since we failed to get image data
-            self._api_error_state = True
+        if not atomic_write('images/last.png', img_bytes):
+            return None
+        write_frame_meta('images/last.png', 'png', crc=crc32(img_bytes), extra={'key': key})
+        trace.span('flash', t)
+        return ('images/last.png', 'png')
+
+    def _show_frame(self, path, fmt):
+        """Draw a cached frame; shows 'Display Error' and returns False on failure."""
+        try:
+            if fmt == 'rgb565':
+                # draw_rgb565_raw() reports its own failures as False
+                if not self.display.draw_rgb565_raw(path):
+                    raise OSError('blit of {} failed'.format(path))
+            else:
+                self.display.draw_scaled_png(path)
+            mem.sample('blit')
+            return True
+        except Exception as e:
+            print('display {} failed'.format(fmt), e)
+            mem.sample('blit_failed')
+            self.display.show_text('Display Error')
+            return False
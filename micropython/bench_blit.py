@@ -0,0 +1,55 @@
+# bench_blit.py - time a full-frame RGB565 blit with hot-path logging on and off
+#
+# Run on the device (after a deploy, so the display driver and the raw
+# placeholder frame are on the filesystem):
+#   python -m mpremote connect serial://auto run micropython/bench_blit.py
+#
+# Modes:
+#   print  debug level, every record printed immediately (the old print() calls)
+#   ring   debug level, records buffered in the log ring, flushed afterwards
+#   off    info level, the hot-path debug calls return straight away
+# With a -O1 bytecode build (./scripts/build_mpy.sh -O1, or a frozen build)
+# __debug__ is False and the debug calls are compiled out, so all three
+# modes should match; compare against a plain build to see the difference.
+import gc
+import time
+
+from display import Display
+from log import DEBUG, INFO, log
+
+FRAME = 'assets/unknown_portrait.raw'
+RUNS = 5
+
+
+def bench(disp, level, echo):
+    log.level = level
+    log.echo = echo
+    times = []
+    for _ in range(RUNS):
+        gc.collect()
+        t0 = time.ticks_us()
+        disp.draw_rgb565_raw(FRAME)
+        times.append(time.ticks_diff(time.ticks_us(), t0))
+    buffered = len(log.ring)
+    log.ring = []
+    log.dropped = 0
+    return times, buffered
+
+
+def main():
+    disp = Display({'width': 240, 'height': 240})
+    disp.init()
+    print('__debug__ =', __debug__)
+    results = []
+    for name, level, echo in (('print', DEBUG, True), ('ring', DEBUG, False), ('off', INFO, False)):
+        times, buffered = bench(disp, level, echo)
+        results.append((name, times, buffered))
+    log.level = INFO
+    log.echo = False
+    print('{:<6} {:>9} {:>9} {:>9} {:>9}'.format('mode', 'min ms', 'avg ms', 'max ms', 'records'))
+    for name, times, buffered in results:
+        print('{:<6} {:>9.2f} {:>9.2f} {:>9.2f} {:>9}'.format(
+            name, min(times) / 1000, sum(times) / len(times) / 1000, max(times) / 1000, buffered))
+
+
+main()
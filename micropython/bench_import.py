@@ -0,0 +1,51 @@
+# bench_import.py - measure import time and free heap after importing the app
+#
+# Run on the device after a soft reset so nothing is imported yet:
+#   python -m mpremote connect serial://auto run micropython/bench_import.py
+#
+# Compare a source deploy (./scripts/deploy_pico.sh), a precompiled one
+# (./scripts/deploy_pico.sh --mpy) and a frozen firmware build. Each line
+# shows where the module came from, the import time and gc.mem_free()
+# before/after (after a gc.collect(), so it is the heap the import retains).
+import gc
+import os
+import sys
+import time
+
+MODULES = ('log', 'bufpool', 'storage', 'telemetry', 'demostore', 'buttons', 'wifi', 'display', 'endpoints', 'api_client', 'app')
+
+
+def origin(name):
+    if name in sys.modules:
+        return 'loaded'
+    for ext in ('.py', '.mpy'):
+        try:
+            os.stat(name + ext)
+            return ext[1:]
+        except OSError:
+            pass
+    return 'frozen'
+
+
+def main():
+    gc.collect()
+    free_start = gc.mem_free()
+    t_start = time.ticks_us()
+    print('{:<12} {:>6} {:>10} {:>10} {:>8}'.format('module', 'from', 'import ms', 'free after', 'retained'))
+    for name in MODULES:
+        src = origin(name)
+        gc.collect()
+        free0 = gc.mem_free()
+        t0 = time.ticks_us()
+        __import__(name)
+        dt = time.ticks_diff(time.ticks_us(), t0)
+        gc.collect()
+        free1 = gc.mem_free()
+        print('{:<12} {:>6} {:>10.1f} {:>10} {:>8}'.format(name, src, dt / 1000, free1, free0 - free1))
+    total = time.ticks_diff(time.ticks_us(), t_start)
+    gc.collect()
+    print('total: {:.1f} ms, mem_free {} -> {} ({} bytes retained)'.format(
+        total / 1000, free_start, gc.mem_free(), free_start - gc.mem_free()))
+
+
+main()
@@ -0,0 +1,136 @@
+# bufpool.py - fixed set of reusable buffers shared by display, client and storage
+#
+# Every hot path used to allocate its own temporaries (4KB read chunks, a
+# scanline per PNG row, tiny bytearrays per SPI command), which fragments the
+# Pico's heap until a large allocation fails. Instead the buffers are
+# allocated once, early in boot while the heap is still contiguous, and lent
+# out as memoryviews:
+#
+#   from bufpool import pool, CHUNK
+#   buf = pool.borrow(CHUNK)
+#   try:
+#       n = f.readinto(buf)
+#       spi.write(buf[:n])
+#   finally:
+#       pool.give_back(CHUNK, buf)
+#
+# If a class is exhausted (nested use) borrow() falls back to a fresh
+# allocation and counts a miss, so a wrong pool size costs RAM, not a crash.
+# Hot paths never call gc.collect() themselves; they call collect_soon() and
+# the main loop runs the collection from idle() when nothing is on loan.
+import gc
+
+LINE = 'line'    # one display scanline of RGB565 (display width * 2)
+CHUNK = 'chunk'  # file / socket streaming chunk
+CMD = 'cmd'      # SPI command and parameter bytes
+
+DEFAULT_SIZES = {LINE: 480, CHUNK: 4096, CMD: 4}
+
+
+class BufferPool:
+    def __init__(self):
+        self.sizes = {}
+        self._free = {}
+        self._lent = {}
+        self.high_water = {}
+        self.borrows = {}
+        self.misses = {}
+        self._collect_pending = False
+
+    def configure(self, sizes=None, counts=None):
+        """Allocate the buffers. sizes/counts map class -> bytes / buffers
+        (defaults: DEFAULT_SIZES, one buffer each). Call once at boot before
+        anything else allocates heavily."""
+        if sizes is None or not self.sizes:
+            sizes = dict(DEFAULT_SIZES, **(sizes or {}))
+        counts = counts or {}
+        for name, size in sizes.items():
+            size = int(size)
+            self.sizes[name] = size
+            self._free[name] = [memoryview(bytearray(size)) for _ in range(int(counts.get(name, 1)))]
+            self._lent[name] = []
+            self.high_water[name] = 0
+            self.borrows[name] = 0
+            self.misses[name] = 0
+
+    def borrow(self, name, min_size=0):
+        """Lend a buffer of class name as a memoryview of its full size
+        (at least min_size bytes)."""
+        if name not in self.sizes:
+            self.configure({name: max(min_size, DEFAULT_SIZES.get(name, 256))}, {name: 1})
+        free = self._free[name]
+        if free and len(free[-1]) >= min_size:
+            buf = free.pop()
+        else:
+            self.misses[name] += 1
+            if min_size > self.sizes[name]:
+                self.sizes[name] = min_size
+            buf = memoryview(bytearray(self.sizes[name]))
+        lent = self._lent[name]
+        lent.append(buf)
+        self.borrows[name] += 1
+        if len(lent) > self.high_water[name]:
+            self.high_water[name] = len(lent)
+        return buf
+
+    def give_back(self, name, buf):
+        """Return a buffer obtained from borrow(name). Buffers allocated on a
+        miss are kept, growing the pool to the observed peak."""
+        lent = self._lent.get(name)
+        if not lent:
+            return
+        for i in range(len(lent)):
+            if lent[i] is buf:
+                self._free[name].append(lent.pop(i))
+                return
+
+    def outstanding(self):
+        n = 0
+        for lent in self._lent.values():
+            n += len(lent)
+        return n
+
+    def collect_soon(self):
+        """Ask for a gc.collect() at the next idle point."""
+        self._collect_pending = True
+
+    def idle(self):
+        """Run a requested collection if no buffer is on loan. Call from the
+        main loop between events. Returns True if it collected."""
+        if not self._collect_pending or self.outstanding():
+            return False
+        self._collect_pending = False
+        gc.collect()
+        return True
+
+    def stats(self):
+        """Per-class size, count, on-loan, high-water, borrow and miss counts."""
+        out = {}
+        for name, size in self.sizes.items():
+            lent = len(self._lent[name])
+            out[name] = {
+                'size': size,
+                'count': len(self._free[name]) + lent,
+                'lent': lent,
+                'high_water': self.high_water[name],
+                'borrows': self.borrows[name],
+                'misses': self.misses[name],
+            }
+        return out
+
+
+def fill_pattern(buf, n, hi, lo):
+    """Fill the first n bytes of buf with the repeated pair (hi, lo) by
+    doubling copies rather than building a temporary list."""
+    if n < 2:
+        return
+    buf[0] = hi
+    buf[1] = lo
+    done = 2
+    while done < n:
+        step = min(done, n - done)
+        buf[done:done + step] = buf[0:step]
+        done += step
+
+
+pool = BufferPool()
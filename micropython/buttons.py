@@ -21,6 +21,8 @@ class ButtonReader:
             self.last_state = 1
         self.last_time = time.ticks_ms() if MICROPYTHON else int(time.time() * 1000)
         self.pressed = False
+        # ticks_us of the last accepted press edge (for latency tracing)
+        self.edge_us = None
 
     def update(self):
         now = time.ticks_ms() if MICROPYTHON else int(time.time() * 1000)
@@ -33,6 +35,7 @@ class ButtonReader:
                 # Active-low buttons: 0 = pressed
                 if curr == 0 and self.last_state == 1:
                     self.pressed = True
+                    self.edge_us = time.ticks_us() if MICROPYTHON else None
                 self.last_state = curr
                 self.last_time = now
 
@@ -110,6 +113,21 @@ class Buttons:
         for reader in self.readers.values():
             reader.update()
 
+    def edge_us(self, name):
+        """ticks_us at which the last press of name was detected, or None."""
+        r = self.readers.get(name)
+        return r.edge_us if r else None
+
+    def held(self, name):
+        """True while button name is physically down (level, not edge)."""
+        r = self.readers.get(name)
+        if not r:
+            return False
+        try:
+            return r.pin.value() == 0
+        except Exception:
+            return False
+
     def is_pressed(self, name):
         r = self.readers.get(name)
         return r.consume_pressed() if r else False
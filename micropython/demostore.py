@@ -0,0 +1,282 @@
+# demostore.py - compact flash-indexed demographics store
+#
+# demographics.json stays the source of truth. scripts/build_demographics.py
+# packs it on the host into demographics.bin, which the device reads with
+# seek() so fetching one value by index is O(1) and the value lists never
+# have to be resident in RAM.
+#
+# Layout (all integers little-endian):
+#   header   16 bytes  magic 'PCDM', u8 version, u8 category count,
+#                      u16 reserved, u32 source JSON size, u32 source JSON crc32
+#   entries  12 bytes per category: u8 key (ASCII), u8 flags, u16 value count,
+#                      u32 name offset, u32 index offset
+#   names    u8 length + UTF-8 bytes per category name
+#   index    (count + 1) u32 absolute offsets per category; value i is the
+#            bytes between index[i] and index[i + 1]. Weighted categories
+#            (flags & FLAG_WEIGHTED) follow their index with an alias table
+#            of count records: u32 keep probability, u32 normalised weight,
+#            u16 alias (probabilities and weights scaled to PROB_ONE)
+#   strings  packed UTF-8 values
+#
+# Version 1 stores (no alias tables) are still readable.
+#
+# Categories may carry an optional "weights" list parallel to "values" in
+# demographics.json. Weighted categories are sampled with a Walker/Vose alias
+# table (one uniform index plus one biased coin, O(1)); unweighted ones
+# uniformly. See sample() for how recently shown values are excluded.
+
+import random
+
+MAGIC = b'PCDM'
+VERSION = 2
+HEADER_SIZE = 16
+ENTRY_SIZE = 12
+FLAG_WEIGHTED = 0x01
+ALIAS_REC = 10
+PROB_BITS = 24
+PROB_ONE = 1 << PROB_BITS
+
+
+def _u16(b, o):
+    return b[o] | (b[o + 1] << 8)
+
+
+def _u32(b, o):
+    return b[o] | (b[o + 1] << 8) | (b[o + 2] << 16) | (b[o + 3] << 24)
+
+
+def build_alias(weights):
+    """Build a Vose alias table for weights.
+
+    Returns (prob, alias, norm) lists: column i keeps value i with
+    probability prob[i] / PROB_ONE and otherwise yields alias[i]; norm[i] is
+    weight i scaled so the weights sum to (about) PROB_ONE. Raises ValueError
+    for negative weights or a zero total.
+    """
+    n = len(weights)
+    total = 0.0
+    for w in weights:
+        if w < 0:
+            raise ValueError('negative weight')
+        total += w
+    if not n or total <= 0:
+        raise ValueError('weights must have a positive total')
+    norm = [int(w * PROB_ONE / total + 0.5) for w in weights]
+    scaled = [w * n / total for w in weights]
+    prob = [PROB_ONE] * n
+    alias = list(range(n))
+    small = [i for i in range(n) if scaled[i] < 1]
+    large = [i for i in range(n) if scaled[i] >= 1]
+    while small and large:
+        s = small.pop()
+        g = large.pop()
+        prob[s] = int(scaled[s] * PROB_ONE + 0.5)
+        alias[s] = g
+        scaled[g] += scaled[s] - 1
+        if scaled[g] < 1:
+            small.append(g)
+        else:
+            large.append(g)
+    # Whatever is left is 1 up to rounding and keeps its own column
+    return prob, alias, norm
+
+
+class _Sampler:
+    """sample() on top of count() plus the _weighted/_column/_norms hooks."""
+
+    def sample(self, key, recent=()):
+        """Return the index of a random value of category key, or None if it
+        is empty.
+
+        Indices in recent (most recent first) are never returned; only the
+        newest count - 1 of them are honoured so there is always a candidate.
+        There is no retry loop: unweighted draws map one uniform draw over
+        the remaining slots past the excluded indices, and a weighted alias
+        draw that lands on an excluded value is redone once, exactly, over
+        the remaining weights (O(count), only with probability equal to the
+        excluded weight).
+        """
+        n = self.count(key)
+        if not n:
+            return None
+        ex = []
+        for i in recent:
+            if len(ex) >= n - 1:
+                break
+            if i is not None and 0 <= i < n and i not in ex:
+                ex.append(i)
+        if self._weighted(key):
+            i = random.randrange(n)
+            prob, alias = self._column(key, i)
+            if random.getrandbits(PROB_BITS) >= prob:
+                i = alias
+            if i not in ex:
+                return i
+            norm = self._norms(key)
+            total = 0
+            for j in range(n):
+                if j not in ex:
+                    total += norm[j]
+            if total > 0:
+                r = random.randrange(total)
+                for j in range(n):
+                    if j not in ex:
+                        r -= norm[j]
+                        if r < 0:
+                            return j
+        ex.sort()
+        r = random.randrange(n - len(ex))
+        for e in ex:
+            if r < e:
+                break
+            r += 1
+        return r
+
+
+class DemographicsStore(_Sampler):
+    """Read-only view of a packed demographics table.
+
+    source is either a file path (values are read with seek()) or a
+    bytes-like object such as the frozen DEMOGRAPHICS_BIN constant (values
+    are sliced through a memoryview, so a frozen table is read from flash).
+    Only the small per-category directory is kept in RAM.
+    """
+
+    def __init__(self, source):
+        self._f = None
+        self._buf = None
+        if isinstance(source, str):
+            self._f = open(source, 'rb')
+        else:
+            self._buf = memoryview(source)
+        hdr = self._read(0, HEADER_SIZE)
+        if bytes(hdr[0:4]) != MAGIC or not 1 <= hdr[4] <= VERSION:
+            self.close()
+            raise ValueError('not a demographics store (version <= {})'.format(VERSION))
+        ncat = hdr[5]
+        self.src_size = _u32(hdr, 8)
+        self.src_crc = _u32(hdr, 12)
+        # key -> (count, index_off, name_off, flags)
+        self._cats = {}
+        d = self._read(HEADER_SIZE, ncat * ENTRY_SIZE)
+        for i in range(ncat):
+            o = i * ENTRY_SIZE
+            self._cats[chr(d[o])] = (_u16(d, o + 2), _u32(d, o + 8), _u32(d, o + 4), d[o + 1])
+
+    def _read(self, off, n):
+        if self._buf is not None:
+            return self._buf[off:off + n]
+        self._f.seek(off)
+        return self._f.read(n)
+
+    def close(self):
+        if self._f:
+            self._f.close()
+            self._f = None
+
+    def keys(self):
+        return list(self._cats.keys())
+
+    def count(self, key):
+        cat = self._cats.get(key)
+        return cat[0] if cat else 0
+
+    def name(self, key):
+        cat = self._cats.get(key)
+        if not cat:
+            return None
+        n = self._read(cat[2], 1)[0]
+        return str(bytes(self._read(cat[2] + 1, n)), 'utf-8')
+
+    def value(self, key, i):
+        cat = self._cats.get(key)
+        if not cat or i < 0 or i >= cat[0]:
+            return None
+        ends = self._read(cat[1] + 4 * i, 8)
+        start = _u32(ends, 0)
+        return str(bytes(self._read(start, _u32(ends, 4) - start)), 'utf-8')
+
+    def _weighted(self, key):
+        cat = self._cats.get(key)
+        return bool(cat and cat[3] & FLAG_WEIGHTED)
+
+    def _table(self, cat):
+        return cat[1] + 4 * (cat[0] + 1)
+
+    def _column(self, key, i):
+        cat = self._cats[key]
+        rec = self._read(self._table(cat) + ALIAS_REC * i, ALIAS_REC)
+        return _u32(rec, 0), _u16(rec, 8)
+
+    def _norms(self, key):
+        cat = self._cats[key]
+        b = self._read(self._table(cat), ALIAS_REC * cat[0])
+        return [_u32(b, ALIAS_REC * j + 4) for j in range(cat[0])]
+
+    def matches_source(self, path):
+        """True unless the JSON at path differs from the one this store was
+        built from (so an on-device edit of demographics.json is not
+        silently shadowed by a stale .bin). The JSON is checksummed in
+        pooled chunks; a missing JSON counts as a match."""
+        from storage import file_crc32, file_size
+        size = file_size(path)
+        if size is None:
+            return True
+        if size != self.src_size:
+            return False
+        crc = file_crc32(path)
+        return crc is None or crc == self.src_crc
+
+
+class JsonDemographics(_Sampler):
+    """Same interface as DemographicsStore over the parsed JSON dict.
+
+    Alias tables for weighted categories are built once here. A category
+    whose weights are malformed is reported and sampled uniformly.
+    """
+
+    def __init__(self, demos):
+        self._cats = (demos or {}).get('categories') or {}
+        self._alias = {}
+        for key, cat in self._cats.items():
+            weights = (cat or {}).get('weights')
+            if weights is None:
+                continue
+            try:
+                if len(weights) != len(cat.get('values') or []):
+                    raise ValueError('weights and values differ in length')
+                self._alias[key] = build_alias(weights)
+            except (TypeError, ValueError) as e:
+                print('Ignoring weights for category', key, ':', e)
+
+    def keys(self):
+        return list(self._cats.keys())
+
+    def count(self, key):
+        return len((self._cats.get(key) or {}).get('values') or [])
+
+    def name(self, key):
+        return (self._cats.get(key) or {}).get('name')
+
+    def value(self, key, i):
+        values = (self._cats.get(key) or {}).get('values') or []
+        if i < 0 or i >= len(values):
+            return None
+        return values[i]
+
+    def _weighted(self, key):
+        return key in self._alias
+
+    def _column(self, key, i):
+        table = self._alias[key]
+        return table[0][i], table[1][i]
+
+    def _norms(self, key):
+        return self._alias[key][2]
+
+
+def as_store(demos):
+    """Wrap a parsed demographics.json dict; stores pass through unchanged."""
+    if isinstance(demos, (DemographicsStore, JsonDemographics)):
+        return demos
+    return JsonDemographics(demos)
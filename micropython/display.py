@@ -1,6 +1,9 @@
 # display.py - ST7789 wrapper with PNG load & scale for MicroPython
 
 import time
+from bufpool import CHUNK, CMD, LINE, fill_pattern, pool
+from log import log
+from telemetry import mem, ticks_us, trace
 try:
     from machine import Pin, SPI
     from micropython import const
@@ -25,6 +28,56 @@ _RASET = const(0x2B) if MICROPYTHON else 0x2B
 _RAMWR = const(0x2C) if MICROPYTHON else 0x2C
 _DISPON = const(0x29) if MICROPYTHON else 0x29
 
+# 5x7 bitmap font for scaled text: 5 column bytes per glyph (LSB at top),
+# glyphs in the order of _FONT_CHARS. Kept as module-level bytes so a frozen
+# build serves it straight from flash instead of rebuilding a dict per call.
+_FONT_CHARS = " 0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ-:.!?'"
+_FONT_5x7 = (
+    b'\x00\x00\x00\x00\x00'  # ' '
+    b'\x3e\x51\x49\x45\x3e'  # '0'
+    b'\x00\x42\x7f\x40\x00'  # '1'
+    b'\x42\x61\x51\x49\x46'  # '2'
+    b'\x21\x41\x45\x4b\x31'  # '3'
+    b'\x18\x14\x12\x7f\x10'  # '4'
+    b'\x27\x45\x45\x45\x39'  # '5'
+    b'\x3c\x4a\x49\x49\x30'  # '6'
+    b'\x01\x71\x09\x05\x03'  # '7'
+    b'\x36\x49\x49\x49\x36'  # '8'
+    b'\x06\x49\x49\x29\x1e'  # '9'
+    b'\x7e\x11\x11\x11\x7e'  # 'A'
+    b'\x7f\x49\x49\x49\x36'  # 'B'
+    b'\x3e\x41\x41\x41\x22'  # 'C'
+    b'\x7f\x41\x41\x22\x1c'  # 'D'
+    b'\x7f\x49\x49\x49\x41'  # 'E'
+    b'\x7f\x09\x09\x09\x01'  # 'F'
+    b'\x3e\x41\x49\x49\x7a'  # 'G'
+    b'\x7f\x08\x08\x08\x7f'  # 'H'
+    b'\x00\x41\x7f\x41\x00'  # 'I'
+    b'\x20\x40\x41\x3f\x01'  # 'J'
+    b'\x7f\x08\x14\x22\x41'  # 'K'
+    b'\x7f\x40\x40\x40\x40'  # 'L'
+    b'\x7f\x02\x0c\x02\x7f'  # 'M'
+    b'\x7f\x04\x08\x10\x7f'  # 'N'
+    b'\x3e\x41\x41\x41\x3e'  # 'O'
+    b'\x7f\x09\x09\x09\x06'  # 'P'
+    b'\x3e\x41\x51\x21\x5e'  # 'Q'
+    b'\x7f\x09\x19\x29\x46'  # 'R'
+    b'\x46\x49\x49\x49\x31'  # 'S'
+    b'\x01\x01\x7f\x01\x01'  # 'T'
+    b'\x3f\x40\x40\x40\x3f'  # 'U'
+    b'\x1f\x20\x40\x20\x1f'  # 'V'
+    b'\x3f\x40\x38\x40\x3f'  # 'W'
+    b'\x63\x14\x08\x14\x63'  # 'X'
+    b'\x07\x08\x70\x08\x07'  # 'Y'
+    b'\x61\x51\x49\x45\x43'  # 'Z'
+    b'\x08\x08\x08\x08\x08'  # '-'
+    b'\x00\x36\x36\x00\x00'  # ':'
+    b'\x00\x40\x60\x00\x00'  # '.'
+    b'\x00\x00\x5f\x00\x00'  # '!'
+    b'\x02\x01\x51\x09\x06'  # '?'
+    b'\x00\x07\x00\x00\x00'  # "'"
+)
+
 class ST7789:
     def __init__(self, spi, width, height, reset=None, cs=None, dc=None, rotation=0):
         self.spi = spi
@@ -34,6 +87,10 @@ class ST7789:
         self.cs = cs
         self.dc = dc
         self.rotation = rotation
+        # Command/parameter bytes: the driver is the only SPI user, so it
+        # keeps its pooled CMD buffer for its lifetime
+        self._cmd = pool.borrow(CMD)
+        self._cmd1 = self._cmd[:1]
         
     def init(self):
         """Initialize the display"""
@@ -52,11 +109,13 @@ class ST7789:
         
         # Set color mode to 16-bit
         self._write_cmd(_COLMOD)
-        self._write_data(bytearray([0x05]))
+        self._cmd1[0] = 0x05
+        self._write_data(self._cmd1)
         
         # Set memory access control (rotation)
         self._write_cmd(_MADCTL)
-        self._write_data(bytearray([0x00]))
+        self._cmd1[0] = 0x00
+        self._write_data(self._cmd1)
         
         # Display on
         self._write_cmd(_DISPON)
@@ -68,7 +127,8 @@ class ST7789:
             self.cs.value(0)
         if self.dc:
             self.dc.value(0)  # Command mode
-        self.spi.write(bytearray([cmd]))
+        self._cmd1[0] = cmd
+        self.spi.write(self._cmd1)
         if self.cs:
             self.cs.value(1)
             
@@ -84,11 +144,20 @@ class ST7789:
             
     def _set_window(self, x0, y0, x1, y1):
         """Set the drawing window"""
+        buf = self._cmd
         self._write_cmd(_CASET)  # Column address set
-        self._write_data(bytearray([x0 >> 8, x0 & 0xFF, x1 >> 8, x1 & 0xFF]))
+        buf[0] = x0 >> 8
+        buf[1] = x0 & 0xFF
+        buf[2] = x1 >> 8
+        buf[3] = x1 & 0xFF
+        self._write_data(buf)
         
         self._write_cmd(_RASET)  # Row address set
-        self._write_data(bytearray([y0 >> 8, y0 & 0xFF, y1 >> 8, y1 & 0xFF]))
+        buf[0] = y0 >> 8
+        buf[1] = y0 & 0xFF
+        buf[2] = y1 >> 8
+        buf[3] = y1 & 0xFF
+        self._write_data(buf)
         
         self._write_cmd(_RAMWR)  # Write to RAM
 
@@ -109,44 +178,30 @@ class ST7789:
             return
 
         self._set_window(x, y, x + w - 1, y + h - 1)
-        color_hi = (color >> 8) & 0xFF
-        color_lo = color & 0xFF
-        # Line buffer for one scanline
-        line_buf = bytearray([color_hi, color_lo] * w)
-
-        if self.cs:
-            self.cs.value(0)
-        if self.dc:
-            self.dc.value(1)
+        self._write_solid(w, h, color)
 
-        for _ in range(h):
-            self.spi.write(line_buf)
-
-        if self.cs:
-            self.cs.value(1)
+    def _write_solid(self, w, h, color):
+        """Stream h rows of w pixels of one color into the current window,
+        from a pooled scanline buffer."""
+        buf = pool.borrow(LINE, w * 2)
+        try:
+            fill_pattern(buf, w * 2, (color >> 8) & 0xFF, color & 0xFF)
+            line = buf[:w * 2]
+            if self.cs:
+                self.cs.value(0)
+            if self.dc:
+                self.dc.value(1)
+            for _ in range(h):
+                self.spi.write(line)
+            if self.cs:
+                self.cs.value(1)
+        finally:
+            pool.give_back(LINE, buf)
         
     def fill(self, color):
         """Fill entire screen with color (16-bit RGB565)"""
         self._set_window(0, 0, self.width - 1, self.height - 1)
-        
-        # Convert color to bytes
-        color_hi = (color >> 8) & 0xFF
-        color_lo = color & 0xFF
-        
-        # Create buffer for efficient writing
-        line_buf = bytearray([color_hi, color_lo] * self.width)
-        
-        if self.cs:
-            self.cs.value(0)
-        if self.dc:
-            self.dc.value(1)  # Data mode
-            
-        # Write all pixels
-        for _ in range(self.height):
-            self.spi.write(line_buf)
-            
-        if self.cs:
-            self.cs.value(1)
+        self._write_solid(self.width, self.height, color)
             
     def text(self, string, x, y, color, scale=1):
         """Render text. Backwards-compatible: scale=1 retains prior block behavior.
@@ -165,73 +220,20 @@ class ST7789:
                     break
                 # Draw a small rectangle for each character
                 self._set_window(char_x, y, char_x + char_width - 1, y + char_height - 1)
-                color_hi = (color >> 8) & 0xFF
-                color_lo = color & 0xFF
-                char_buf = bytearray([color_hi, color_lo] * char_width)
-                if self.cs:
-                    self.cs.value(0)
-                if self.dc:
-                    self.dc.value(1)
-                for _ in range(char_height):
-                    self.spi.write(char_buf)
-                if self.cs:
-                    self.cs.value(1)
+                self._write_solid(char_width, char_height, color)
             return
 
-        # Scaled text using 5x7 font
-        FONT_5x7 = {
-            ' ': [0x00,0x00,0x00,0x00,0x00],
-            '0': [0x3E,0x51,0x49,0x45,0x3E],
-            '1': [0x00,0x42,0x7F,0x40,0x00],
-            '2': [0x42,0x61,0x51,0x49,0x46],
-            '3': [0x21,0x41,0x45,0x4B,0x31],
-            '4': [0x18,0x14,0x12,0x7F,0x10],
-            '5': [0x27,0x45,0x45,0x45,0x39],
-            '6': [0x3C,0x4A,0x49,0x49,0x30],
-            '7': [0x01,0x71,0x09,0x05,0x03],
-            '8': [0x36,0x49,0x49,0x49,0x36],
-            '9': [0x06,0x49,0x49,0x29,0x1E],
-            'A': [0x7E,0x11,0x11,0x11,0x7E],
-            'B': [0x7F,0x49,0x49,0x49,0x36],
-            'C': [0x3E,0x41,0x41,0x41,0x22],
-            'D': [0x7F,0x41,0x41,0x22,0x1C],
-            'E': [0x7F,0x49,0x49,0x49,0x41],
-            'F': [0x7F,0x09,0x09,0x09,0x01],
-            'G': [0x3E,0x41,0x49,0x49,0x7A],
-            'H': [0x7F,0x08,0x08,0x08,0x7F],
-            'I': [0x00,0x41,0x7F,0x41,0x00],
-            'J': [0x20,0x40,0x41,0x3F,0x01],
-            'K': [0x7F,0x08,0x14,0x22,0x41],
-            'L': [0x7F,0x40,0x40,0x40,0x40],
-            'M': [0x7F,0x02,0x0C,0x02,0x7F],
-            'N': [0x7F,0x04,0x08,0x10,0x7F],
-            'O': [0x3E,0x41,0x41,0x41,0x3E],
-            'P': [0x7F,0x09,0x09,0x09,0x06],
-            'Q': [0x3E,0x41,0x51,0x21,0x5E],
-            'R': [0x7F,0x09,0x19,0x29,0x46],
-            'S': [0x46,0x49,0x49,0x49,0x31],
-            'T': [0x01,0x01,0x7F,0x01,0x01],
-            'U': [0x3F,0x40,0x40,0x40,0x3F],
-            'V': [0x1F,0x20,0x40,0x20,0x1F],
-            'W': [0x3F,0x40,0x38,0x40,0x3F],
-            'X': [0x63,0x14,0x08,0x14,0x63],
-            'Y': [0x07,0x08,0x70,0x08,0x07],
-            'Z': [0x61,0x51,0x49,0x45,0x43],
-            '-': [0x08,0x08,0x08,0x08,0x08],
-            ':': [0x00,0x36,0x36,0x00,0x00],
-            '.': [0x00,0x40,0x60,0x00,0x00],
-            '!': [0x00,0x00,0x5F,0x00,0x00],
-            '?': [0x02,0x01,0x51,0x09,0x06],
-            "'": [0x00,0x07,0x00,0x00,0x00]
-        }
+        # Scaled text using the 5x7 font table above
 
         # Render linearly left-to-right. Convert to uppercase for our limited font.
         s = str(string).upper()
         cursor_x = x
         for ch in s:
-            glyph = FONT_5x7.get(ch, FONT_5x7[' '])
-            # glyph: list of 5 column bytes, LSB at top of column
-            for col_idx, col_val in enumerate(glyph):
+            # Unknown characters render as a space (index 0)
+            base = max(_FONT_CHARS.find(ch), 0) * 5
+            # glyph: 5 column bytes, LSB at top of column
+            for col_idx in range(5):
+                col_val = _FONT_5x7[base + col_idx]
                 for bit in range(7):
                     if (col_val >> bit) & 1:
                         px = cursor_x + col_idx * scale
@@ -367,6 +369,35 @@ class Display:
             print(f"BOOT (PIL text): {text}")
         # Console fallback is already handled above
 
+    # Height of the status band used for boot messages over an image
+    STATUS_BAND_HEIGHT = 20
+    # Byte layout draw_rgb565_raw() blits as-is (X-Display-Format names)
+    PIXEL_FORMAT = 'rgb565-be'
+
+    def show_status(self, text, bg_color=(0, 0, 0), fg_color=(255, 255, 255)):
+        """Show a short message in a band along the bottom of the screen.
+
+        Unlike show_boot_phase this leaves the rest of the frame untouched,
+        so boot messages can be shown over the instant-on image.
+        """
+        bg = self._ensure_color(bg_color)
+        fg = self._ensure_color(fg_color)
+        band = self.STATUS_BAND_HEIGHT
+        if self.driver:
+            try:
+                self.driver._fill_rect(0, self.height - band, self.width, band, bg)
+                self.driver.text(text, 4, self.height - band + 3, fg, scale=2)
+            except Exception as e:
+                print(f"Status band failed: {e}")
+        else:
+            print(f"STATUS: {text}")
+
+    def clear_status(self, path):
+        """Remove the status band by redrawing its rows from the raw frame at path."""
+        if not self.driver:
+            return True
+        return self.draw_rgb565_raw(path, y0=self.height - self.STATUS_BAND_HEIGHT)
+
     def show_placeholder(self):
         """Show placeholder - fill screen with a color for now"""
         # Attempt to show the packaged unknown portrait from /assets first.
@@ -449,6 +480,7 @@ class Display:
                 import deflate
                 import struct
 
+                t_decode = ticks_us()
                 with open(path, 'rb') as f:
                     data = f.read()
 
@@ -516,10 +548,14 @@ class Display:
                     del decomp_chunks  # Free chunk list immediately
                     gc.collect()
                     
-                    print(f'PNG decompressed: {len(decomp)} bytes')
+                    if __debug__:
+                        log.debug('PNG decompressed: %d bytes', len(decomp))
+                    trace.span('decode', t_decode)
+                    mem.sample('decode')
                     
                 except Exception as e:
-                    print('PNG decompress failed:', e)
+                    log.error('PNG decompress failed: %s', e)
+                    mem.sample('decode_failed')
                     return
 
                 # Determine bytes per pixel and extract palette if needed
@@ -528,7 +564,8 @@ class Display:
                     bpp = 3  # RGB
                 elif colortype == 3:
                     bpp = 1  # Palette-indexed
-                    print('Palette-indexed PNG detected, extracting palette...')
+                    if __debug__:
+                        log.debug('Palette-indexed PNG detected, extracting palette...')
                     # Extract palette from PLTE chunk
                     offset = 8
                     while offset < len(data) - 8:
@@ -541,7 +578,8 @@ class Display:
                                 if i + 2 < len(palette_data):
                                     r, g, b = palette_data[i], palette_data[i+1], palette_data[i+2]
                                     palette.append((r, g, b))
-                            print(f'Extracted palette with {len(palette)} colors')
+                            if __debug__:
+                                log.debug('Extracted palette with %d colors', len(palette))
                             break
                         offset += 8 + length + 4
                         if chunk_type == b'IEND':
@@ -556,97 +594,27 @@ class Display:
                     return
 
                 # Memory-efficient streaming: process one display line at a time
-                row_bytes = width * bpp + 1  # +1 for filter byte
                 out_w = self.width
                 out_h = self.height
                 
-                print(f'Streaming PNG: {width}x{height} -> {out_w}x{out_h}, bpp={bpp}')
+                if __debug__:
+                    log.debug('Streaming PNG: %dx%d -> %dx%d, bpp=%d', width, height, out_w, out_h, bpp)
                 
-                # Process each output display line
-                for out_y in range(out_h):
-                    # Map output line to source line
-                    src_y = int(out_y * height / out_h)
-                    if src_y >= height:
-                        src_y = height - 1
-                    
-                    # Find source row in decompressed data
-                    row_start = src_y * row_bytes
-                    if row_start >= len(decomp):
-                        break
-                        
-                    filter_type = decomp[row_start]
-                    # For simplicity, only support filter type 0 (None)
-                    if filter_type != 0:
-                        print(f'Unsupported PNG filter type {filter_type} at line {src_y}')
-                        continue
-                    
-                    # Extract pixel data for this source row (skip filter byte)
-                    row_data_start = row_start + 1
-                    row_data_end = row_data_start + width * bpp
-                    
-                    # Build RGB565 line for display
-                    line_buf = bytearray(out_w * 2)  # 2 bytes per RGB565 pixel
-                    buf_idx = 0
-                    
-                    for out_x in range(out_w):
-                        # Map output x to source x
-                        src_x = int(out_x * width / out_w)
-                        if src_x >= width:
-                            src_x = width - 1
-                            
-                        # Get source pixel
-                        pixel_base = row_data_start + src_x * bpp
-                        if pixel_base + bpp <= row_data_end:
-                            if colortype == 3:  # Palette-indexed
-                                palette_index = decomp[pixel_base]
-                                if palette_index < len(palette):
-                                    r, g, b = palette[palette_index]
-                                else:
-                                    r = g = b = 0  # Invalid palette index
-                            elif bpp == 3:  # RGB
-                                r = decomp[pixel_base]
-                                g = decomp[pixel_base + 1]
-                                b = decomp[pixel_base + 2]
-                            else:  # RGBA
-                                r = decomp[pixel_base]
-                                g = decomp[pixel_base + 1]
-                                b = decomp[pixel_base + 2]
-                        else:
-                            # Fallback for edge cases
-                            r = g = b = 0
-                        
-                        # Convert RGB888 to RGB565
-                        rgb565 = ((r & 0xF8) << 8) | ((g & 0xFC) << 3) | (b >> 3)
-                        line_buf[buf_idx] = (rgb565 >> 8) & 0xFF      # High byte
-                        line_buf[buf_idx + 1] = rgb565 & 0xFF         # Low byte
-                        buf_idx += 2
-                    
-                    # Write line directly to display in smaller chunks to avoid buffer issues
-                    self.driver._set_window(0, out_y, out_w-1, out_y)
-                    if self.driver.cs:
-                        self.driver.cs.value(0)
-                    if self.driver.dc:
-                        self.driver.dc.value(1)
-                    
-                    # Write in 64-pixel chunks (128 bytes) to avoid buffer overflow
-                    chunk_size = 128  # 64 pixels * 2 bytes per pixel
-                    for chunk_start in range(0, len(line_buf), chunk_size):
-                        chunk_end = min(chunk_start + chunk_size, len(line_buf))
-                        chunk = line_buf[chunk_start:chunk_end]
-                        self.driver.spi.write(chunk)
-                    
-                    if self.driver.cs:
-                        self.driver.cs.value(1)
-                        
-                    # Garbage collect periodically to manage memory
-                    if out_y % 50 == 0:
-                        import gc
-                        gc.collect()
+                # One pooled RGB565 scanline reused for every output row
+                line_buf = pool.borrow(LINE, out_w * 2)
+                t_blit = ticks_us()
+                try:
+                    self._stream_png_rows(decomp, width, height, bpp, colortype, palette, line_buf)
+                    trace.span('blit', t_blit)
+                finally:
+                    pool.give_back(LINE, line_buf)
+                    pool.collect_soon()
                 
-                print('Streaming PNG display completed')
+                if __debug__:
+                    log.debug('Streaming PNG display completed')
                 return
             except Exception as e:
-                print('On-device PNG display failed:', e)
+                log.error('On-device PNG display failed: %s', e)
                 return
         elif PIL_AVAILABLE:
             # Host fallback using PIL
@@ -660,11 +628,100 @@ class Display:
         else:
             print('PNG display not available in this environment:', path)
 
-    def draw_rgb565_raw(self, path):
+    def _stream_png_rows(self, decomp, width, height, bpp, colortype, palette, line_buf):
+        """Nearest-neighbour scale decoded PNG rows to the display, one
+        output row at a time through line_buf."""
+        row_bytes = width * bpp + 1  # +1 for filter byte
+        out_w = self.width
+        out_h = self.height
+        # Process each output display line
+        for out_y in range(out_h):
+            # Map output line to source line
+            src_y = int(out_y * height / out_h)
+            if src_y >= height:
+                src_y = height - 1
+            
+            # Find source row in decompressed data
+            row_start = src_y * row_bytes
+            if row_start >= len(decomp):
+                break
+                
+            filter_type = decomp[row_start]
+            # For simplicity, only support filter type 0 (None)
+            if filter_type != 0:
+                log.warn('Unsupported PNG filter type %d at line %d', filter_type, src_y)
+                continue
+            
+            # Extract pixel data for this source row (skip filter byte)
+            row_data_start = row_start + 1
+            row_data_end = row_data_start + width * bpp
+            
+            # Build RGB565 line for display
+            buf_idx = 0
+            
+            for out_x in range(out_w):
+                # Map output x to source x
+                src_x = int(out_x * width / out_w)
+                if src_x >= width:
+                    src_x = width - 1
+                    
+                # Get source pixel
+                pixel_base = row_data_start + src_x * bpp
+                if pixel_base + bpp <= row_data_end:
+                    if colortype == 3:  # Palette-indexed
+                        palette_index = decomp[pixel_base]
+                        if palette_index < len(palette):
+                            r, g, b = palette[palette_index]
+                        else:
+                            r = g = b = 0  # Invalid palette index
+                    elif bpp == 3:  # RGB
+                        r = decomp[pixel_base]
+                        g = decomp[pixel_base + 1]
+                        b = decomp[pixel_base + 2]
+                    else:  # RGBA
+                        r = decomp[pixel_base]
+                        g = decomp[pixel_base + 1]
+                        b = decomp[pixel_base + 2]
+                else:
+                    # Fallback for edge cases
+                    r = g = b = 0
+                
+                # Convert RGB888 to RGB565
+                rgb565 = ((r & 0xF8) << 8) | ((g & 0xFC) << 3) | (b >> 3)
+                line_buf[buf_idx] = (rgb565 >> 8) & 0xFF      # High byte
+                line_buf[buf_idx + 1] = rgb565 & 0xFF         # Low byte
+                buf_idx += 2
+            
+            # Write line directly to display in smaller chunks to avoid buffer issues
+            self.driver._set_window(0, out_y, out_w-1, out_y)
+            if self.driver.cs:
+                self.driver.cs.value(0)
+            if self.driver.dc:
+                self.driver.dc.value(1)
+            
+            # Write in 64-pixel chunks (128 bytes) to avoid buffer overflow;
+            # memoryview slices, so no copies
+            chunk_size = 128  # 64 pixels * 2 bytes per pixel
+            line_len = out_w * 2
+            for chunk_start in range(0, line_len, chunk_size):
+                chunk_end = min(chunk_start + chunk_size, line_len)
+                self.driver.spi.write(line_buf[chunk_start:chunk_end])
+            
+            if self.driver.cs:
+                self.driver.cs.value(1)
+
+    def draw_rgb565_raw(self, path, crc=None, y0=0):
         """Display raw RGB565 binary file directly to screen.
         
         Expects exactly width*height*2 bytes of RGB565 data.
         This is the most efficient format - no decompression needed.
+        If crc is given (from the frame's metadata sidecar) the CRC32 is
+        computed over the chunks as they stream and False is returned on a
+        mismatch so the caller can discard the corrupt frame. The frame is
+        on the panel by then; callers that must not show a corrupt frame
+        check it first with storage.check_frame(..., full=True).
+        y0 > 0 redraws only rows y0..height-1 (used to restore the status
+        band); the checksum is only verified on full-frame draws.
         """
         try:
             # Check file size
@@ -673,41 +730,64 @@ class Display:
             expected_size = self.width * self.height * 2
             file_size = stat[6]  # st_size
             
-            print(f"RGB565 file: {file_size} bytes, expected: {expected_size} bytes")
+            if __debug__:
+                log.debug('RGB565 file: %d bytes, expected: %d bytes', file_size, expected_size)
             
             if file_size != expected_size:
-                print(f"Warning: File size mismatch. Expected {expected_size}, got {file_size}")
+                log.warn('File size mismatch. Expected %d, got %d', expected_size, file_size)
                 # Continue anyway in case of metadata differences
             
-            # Set display window to full screen
-            self.driver._set_window(0, 0, self.width - 1, self.height - 1)
+            # Set display window to full screen (or the rows from y0 down)
+            y0 = max(0, min(int(y0), self.height - 1))
+            self.driver._set_window(0, y0, self.width - 1, self.height - 1)
             
-            # Read and write in chunks to avoid large memory allocation
-            chunk_size = 4096  # 4KB chunks
-            print(f"Reading RGB565 data in {chunk_size} byte chunks...")
+            # Read and write through the pooled chunk buffer (readinto, so
+            # the loop allocates nothing)
+            buf = pool.borrow(CHUNK)
+            chunk_size = len(buf)
+            if __debug__:
+                log.debug('Reading RGB565 data in %d byte chunks...', chunk_size)
             
-            with open(path, 'rb') as f:
-                total_written = 0
-                while True:
-                    chunk = f.read(chunk_size)
-                    if not chunk:
-                        break
-                    
-                    # Write chunk directly to SPI
-                    self.driver.dc.value(1)  # Data mode
-                    self.driver.cs.value(0)  # Select display
-                    self.driver.spi.write(chunk)
-                    self.driver.cs.value(1)  # Deselect
-                    
-                    total_written += len(chunk)
-                    if total_written % (chunk_size * 4) == 0:  # Progress every 16KB
-                        print(f"Written: {total_written} bytes ({total_written*100//expected_size}%)")
+            running_crc = 0 if (crc is not None and y0 == 0) else None
+            if running_crc is not None:
+                from storage import crc32
+            t_blit = ticks_us()
+            try:
+                with open(path, 'rb') as f:
+                    if y0:
+                        f.seek(y0 * self.width * 2)
+                    total_written = 0
+                    while True:
+                        n = f.readinto(buf)
+                        if not n:
+                            break
+                        chunk = buf[:n] if n < chunk_size else buf
+                        if running_crc is not None:
+                            running_crc = crc32(chunk, running_crc)
+                        
+                        # Write chunk directly to SPI
+                        self.driver.dc.value(1)  # Data mode
+                        self.driver.cs.value(0)  # Select display
+                        self.driver.spi.write(chunk)
+                        self.driver.cs.value(1)  # Deselect
+                        
+                        total_written += n
+                        if __debug__:
+                            if total_written % (chunk_size * 4) == 0:  # Progress every 16KB
+                                log.debug('Written: %d bytes (%d%%)', total_written, total_written * 100 // expected_size)
+            finally:
+                pool.give_back(CHUNK, buf)
                 
-                print(f"RGB565 display complete: {total_written} bytes written")
-                return True
+            trace.span('blit', t_blit)
+            if __debug__:
+                log.debug('RGB565 display complete: %d bytes written', total_written)
+            if running_crc is not None and running_crc != crc:
+                log.warn('RGB565 checksum mismatch: %08x != %08x', running_crc, crc)
+                return False
+            return True
                 
         except Exception as e:
-            print('RGB565 display failed:', e)
+            log.error('RGB565 display failed: %s', e)
             try:
                 import sys
                 sys.print_exception(e)
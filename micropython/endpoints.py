@@ -0,0 +1,265 @@
+# endpoints.py - pick the fastest healthy passthrough from a list of candidates
+#
+# config.json's "api_endpoints" lists base URLs (the old single
+# "api_base_url" still works as a one-entry list). Each endpoint keeps an
+# exponentially weighted average of:
+#   rtt      health-probe round trip (connect to status line), from probes
+#   ttfb     time to the first response byte of real txt2img requests,
+#            which is dominated by the server's generation time
+#   connect  dns + connect of real requests (reported, not ranked: it is a
+#            different measure from rtt and only exists for used endpoints)
+# A request goes to the healthy endpoint with the lowest rtt + ttfb. An
+# endpoint without a ttfb yet scores 0 for it, so each is tried once by a
+# real request and then ranked on measurements. A failed endpoint is skipped for a cooldown that
+# doubles on each consecutive failure, and the next one is used instead.
+#
+# Probes are tiny GETs of endpoints.probe_path (the passthrough's /health).
+# poll() runs at most one probe per probe_gap_ms, and only when the caller
+# says the app is idle, so probes never sit between a press and its
+# request. Hosts ending in .local are resolved with a one-shot mDNS query
+# at probe time; the request then goes to the resolved address.
+import struct
+
+try:
+    import usocket as socket
+except ImportError:
+    import socket
+
+from log import log
+from telemetry import ticks_diff, ticks_ms
+
+MDNS_ADDR = ('224.0.0.251', 5353)
+
+
+def _split(url):
+    """(proto, host, port, path) of an http(s) URL."""
+    proto, _, rest = url.partition('//')
+    host, _, path = rest.partition('/')
+    port = 443 if proto == 'https:' else 80
+    if ':' in host:
+        host, port = host.split(':', 1)
+        port = int(port)
+    return proto, host, port, '/' + path
+
+
+def _read_name(buf, i):
+    """Decode a DNS name at offset i (following compression pointers).
+    Returns (name, offset after the name)."""
+    labels = []
+    end = None
+    for _ in range(64):
+        n = buf[i]
+        if n == 0:
+            i += 1
+            break
+        if n & 0xC0 == 0xC0:
+            if end is None:
+                end = i + 2
+            i = ((n & 0x3F) << 8) | buf[i + 1]
+            continue
+        labels.append(str(bytes(buf[i + 1:i + 1 + n]), 'utf-8'))
+        i += 1 + n
+    return '.'.join(labels).lower(), (end if end is not None else i)
+
+
+def mdns_resolve(name, timeout_ms=1000):
+    """Resolve a .local host name to an IPv4 address string with a one-shot
+    multicast DNS query (unicast response requested). Returns None if
+    nothing answers within timeout_ms."""
+    name = name.rstrip('.').lower()
+    q = bytearray(struct.pack('>HHHHHH', 0, 0, 1, 0, 0, 0))
+    for label in name.split('.'):
+        q += bytes([len(label)]) + label.encode('utf-8')
+    q += b'\x00' + struct.pack('>HH', 1, 0x8001)  # A, IN with the unicast-response bit
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.settimeout(timeout_ms / 1000)
+        sock.sendto(q, MDNS_ADDR)
+        t0 = ticks_ms()
+        while ticks_diff(ticks_ms(), t0) < timeout_ms:
+            try:
+                buf = sock.recv(512)
+            except OSError:
+                break
+            if len(buf) < 12:
+                continue
+            _, flags, qd, an = struct.unpack('>HHHH', buf[:8])
+            if not flags & 0x8000:
+                continue
+            i = 12
+            for _ in range(qd):
+                i = _read_name(buf, i)[1] + 4
+            for _ in range(an):
+                rname, i = _read_name(buf, i)
+                rtype, _, _, rdlen = struct.unpack('>HHIH', buf[i:i + 10])
+                i += 10
+                if rtype == 1 and rdlen == 4 and rname == name:
+                    return '.'.join(str(b) for b in buf[i:i + 4])
+                i += rdlen
+    finally:
+        sock.close()
+    return None
+
+
+class Endpoint:
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        proto, self.host, self.port, _ = _split(self.url)
+        self.mdns = self.host.endswith('.local')
+        # URL requests actually go to (the .local host replaced by its address)
+        self.target = None if self.mdns else self.url
+        self._proto = proto
+        self.rtt = None       # ms, EWMA
+        self.ttfb = None      # ms, EWMA
+        self.connect = None   # ms, EWMA
+        self.fails = 0
+        self.down_since = None   # ticks_ms of the last failure
+        self.cooldown = 0        # ms to skip the endpoint after it
+        self.last_probe = None
+        self.probes = 0
+        self.requests = 0
+
+    def resolved(self, ip):
+        self.target = '{}//{}:{}'.format(self._proto, ip, self.port)
+
+    def wait_ms(self, now):
+        """ms left in the failure cooldown (<= 0 when none)."""
+        if self.down_since is None:
+            return 0
+        return self.cooldown - ticks_diff(now, self.down_since)
+
+    def healthy(self, now):
+        return self.target is not None and self.wait_ms(now) <= 0
+
+    def as_dict(self):
+        return {'url': self.url, 'target': self.target, 'rtt_ms': self.rtt, 'ttfb_ms': self.ttfb,
+                'connect_ms': self.connect, 'fails': self.fails, 'probes': self.probes, 'requests': self.requests}
+
+
+class EndpointSelector:
+    """Ranks the configured passthrough endpoints and schedules health probes.
+
+    probe(url, timeout_ms) performs one health check and returns its round
+    trip in microseconds, raising on failure (api_client.probe)."""
+
+    def __init__(self, urls, cfg=None, probe=None):
+        cfg = cfg or {}
+        self.endpoints = [Endpoint(u) for u in urls if u]
+        self.probe_fn = probe
+        self.probe_path = cfg.get('probe_path', '/health')
+        self.probe_interval_ms = int(cfg.get('probe_interval_s', 120)) * 1000
+        self.probe_gap_ms = int(cfg.get('probe_gap_ms', 2000))
+        self.probe_timeout_ms = int(cfg.get('probe_timeout_ms', 1500))
+        self.idle_ms = int(cfg.get('probe_idle_ms', 3000))
+        self.alpha = float(cfg.get('ewma_alpha', 0.3))
+        self.cooldown_ms = int(cfg.get('fail_cooldown_s', 15)) * 1000
+        self.cooldown_max_ms = int(cfg.get('fail_cooldown_max_s', 300)) * 1000
+        self.mdns_timeout_ms = int(cfg.get('mdns_timeout_ms', 1000))
+        self._last_probe = None
+        self._last_use = None
+
+    def _avg(self, old, sample_ms):
+        return sample_ms if old is None else old + self.alpha * (sample_ms - old)
+
+    def _score(self, ep):
+        return (ep.rtt or 0) + (ep.ttfb or 0)
+
+    def candidates(self):
+        """Endpoints to try for a request, best first: healthy ones by score,
+        then those cooling down, soonest available first (so a request is
+        still attempted when everything has failed recently)."""
+        now = ticks_ms()
+        self.touch()
+        if not any(ep.target for ep in self.endpoints):
+            # only .local endpoints, none resolved yet: resolve them now
+            for ep in self.endpoints:
+                self._resolve(ep)
+        healthy = [ep for ep in self.endpoints if ep.healthy(now)]
+        healthy.sort(key=self._score)
+        down = [ep for ep in self.endpoints if ep not in healthy and ep.target is not None]
+        down.sort(key=lambda ep: ep.wait_ms(now))
+        return healthy + down
+
+    def touch(self):
+        """Note request activity; probes wait probe_idle_ms after it."""
+        self._last_use = ticks_ms()
+
+    def observe(self, ep, rtt_us=None, ttfb_us=None, connect_us=None):
+        """Record a successful probe (rtt_us) or request (ttfb_us,
+        connect_us)."""
+        if rtt_us is not None:
+            ep.rtt = self._avg(ep.rtt, rtt_us / 1000)
+        if ttfb_us is not None:
+            ep.ttfb = self._avg(ep.ttfb, ttfb_us / 1000)
+        if connect_us is not None:
+            ep.connect = self._avg(ep.connect, connect_us / 1000)
+        if ep.fails:
+            log.info('endpoint %s is back', ep.url)
+        ep.fails = 0
+        ep.down_since = None
+
+    def failed(self, ep, reason=None):
+        """Take ep out of rotation for a cooldown doubling per failure."""
+        ep.fails += 1
+        ep.cooldown = min(self.cooldown_max_ms, self.cooldown_ms << min(ep.fails - 1, 10))
+        ep.down_since = ticks_ms()
+        log.warn('endpoint %s failed (%s), skipped for %d s', ep.url, reason, ep.cooldown // 1000)
+
+    def _resolve(self, ep):
+        """(Re)resolve a .local endpoint. Returns False, marking it failed,
+        when nothing answers."""
+        try:
+            ip = mdns_resolve(ep.host, self.mdns_timeout_ms)
+        except Exception as e:
+            ip = None
+            log.warn('mdns %s: %s', ep.host, e)
+        if ip is None:
+            self.failed(ep, 'mdns: no answer')
+            return False
+        ep.resolved(ip)
+        return True
+
+    def _due(self, now):
+        """The endpoint most in need of a probe, or None."""
+        due = None
+        for ep in self.endpoints:
+            if ep.last_probe is None:
+                return ep
+            if ep.down_since is not None:
+                if ep.wait_ms(now) <= 0:
+                    return ep
+            elif ticks_diff(now, ep.last_probe) >= self.probe_interval_ms:
+                due = ep
+        return due
+
+    def poll(self, idle=True):
+        """Run at most one due probe. Call from the main loop's idle point;
+        idle=False (a request is pending, the link is down) skips it.
+        Returns the probed endpoint, or None."""
+        if not idle or not self.probe_fn or not self.endpoints:
+            return None
+        now = ticks_ms()
+        if self._last_use is not None and ticks_diff(now, self._last_use) < self.idle_ms:
+            return None
+        if self._last_probe is not None and ticks_diff(now, self._last_probe) < self.probe_gap_ms:
+            return None
+        ep = self._due(now)
+        if ep is None:
+            return None
+        self._last_probe = now
+        ep.last_probe = now
+        ep.probes += 1
+        if ep.mdns and not self._resolve(ep):
+            return ep
+        try:
+            rtt_us = self.probe_fn(ep.target + self.probe_path, self.probe_timeout_ms)
+        except Exception as e:
+            self.failed(ep, e)
+            return ep
+        self.observe(ep, rtt_us=rtt_us)
+        if __debug__:
+            log.debug('probe %s: %d ms (avg %d)', ep.url, rtt_us // 1000, ep.rtt)
+        return ep
+
+    def stats(self):
+        return [ep.as_dict() for ep in self.endpoints]
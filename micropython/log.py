@@ -0,0 +1,146 @@
+# log.py - leveled ring-buffer logger for the hot paths
+#
+# print() over USB-CDC/UART blocks until the bytes are out, which adds
+# measurable latency inside the blit and request paths. log.debug()/info()/
+# warn()/error() instead append (ticks_ms, level, fmt, args) to an in-RAM
+# ring buffer; the message is only %-formatted when it is flushed. The app's
+# main loop flushes at its idle point when a host is attached, and
+# log.flush() prints the buffer on demand.
+#
+# Debug messages in hot paths are additionally wrapped in `if __debug__:`
+# so a bytecode build with mpy-cross -O1 (./scripts/build_mpy.sh, and the
+# frozen manifest) drops them entirely:
+#
+#   from log import log
+#   if __debug__:
+#       log.debug('written %d bytes', total)
+from telemetry import ticks_diff, ticks_ms
+
+DEBUG = 10
+INFO = 20
+WARN = 30
+ERROR = 40
+
+_LEVELS = {'debug': DEBUG, 'info': INFO, 'warn': WARN, 'error': ERROR}
+_TAGS = {DEBUG: 'D', INFO: 'I', WARN: 'W', ERROR: 'E'}
+
+
+class RingLogger:
+    """Leveled logger writing into a fixed-size ring of unformatted records.
+
+    serial selects when buffered records reach the console: 'auto' flushes
+    at idle points only while USB power is present (VBUS, i.e. a host is
+    probably attached), 'on' always flushes at idle points, 'off' never
+    (flush() still works). echo prints every record immediately, like the
+    plain print() calls it replaces; it exists for comparison benchmarks.
+    """
+
+    def __init__(self):
+        self.level = INFO
+        self.ring_size = 64
+        self.serial = 'auto'
+        self.echo = False
+        self.ring = []
+        self._next = 0
+        self.dropped = 0
+        self._vbus = None
+        self._host = None
+        self._host_checked = None
+
+    def configure(self, cfg=None):
+        """Apply the 'log' config section."""
+        cfg = cfg or {}
+        self.level = _LEVELS.get(str(cfg.get('level', 'info')).lower(), INFO)
+        if cfg.get('debug'):
+            self.level = DEBUG
+        self.ring_size = max(1, int(cfg.get('ring_size', self.ring_size)))
+        self.serial = cfg.get('serial', self.serial)
+        self.echo = bool(cfg.get('echo', False))
+        self.ring = []
+        self._next = 0
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def log(self, level, fmt, *args):
+        if level < self.level:
+            return
+        entry = (ticks_ms(), level, fmt, args)
+        if self.echo:
+            print(self._format(entry))
+            return
+        if len(self.ring) < self.ring_size:
+            self.ring.append(entry)
+        else:
+            self.ring[self._next] = entry
+            self.dropped += 1
+        self._next = (self._next + 1) % self.ring_size
+
+    def debug(self, fmt, *args):
+        self.log(DEBUG, fmt, *args)
+
+    def info(self, fmt, *args):
+        self.log(INFO, fmt, *args)
+
+    def warn(self, fmt, *args):
+        self.log(WARN, fmt, *args)
+
+    def error(self, fmt, *args):
+        self.log(ERROR, fmt, *args)
+
+    def _format(self, entry):
+        t, level, fmt, args = entry
+        try:
+            msg = fmt % args if args else fmt
+        except Exception:
+            msg = '{} {}'.format(fmt, args)
+        return '{:>9} {} {}'.format(t, _TAGS.get(level, '?'), msg)
+
+    def records(self):
+        """Buffered records, oldest first."""
+        if len(self.ring) < self.ring_size:
+            return list(self.ring)
+        return self.ring[self._next:] + self.ring[:self._next]
+
+    def flush(self):
+        """Print and clear the buffer. Returns the number of lines printed."""
+        records = self.records()
+        if self.dropped:
+            print('log: {} older messages dropped'.format(self.dropped))
+        for entry in records:
+            print(self._format(entry))
+        self.ring = []
+        self._next = 0
+        self.dropped = 0
+        return len(records)
+
+    def host_attached(self):
+        if self.serial == 'on':
+            return True
+        if self.serial == 'off':
+            return False
+        # 'auto': USB power present (Pico W / Pico 2 W: VBUS on WL_GPIO2),
+        # re-read at most once a second
+        now = ticks_ms()
+        if self._host_checked is not None and ticks_diff(now, self._host_checked) < 1000:
+            return self._host
+        self._host_checked = now
+        try:
+            if self._vbus is None:
+                from machine import Pin
+                self._vbus = Pin('WL_GPIO2', Pin.IN)
+            self._host = bool(self._vbus.value())
+        except Exception:
+            # No VBUS sense on this board/port: assume a console is there
+            self._host = True
+        return self._host
+
+    def idle(self):
+        """Flush at an idle point when a host is attached."""
+        if self.ring and self.host_attached():
+            return self.flush()
+        return 0
+
+
+# Module-level logger shared by the app and the drivers
+log = RingLogger()
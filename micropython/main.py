@@ -2,14 +2,27 @@
 # Entry point for the Person Clicker app on Pico 2WH.
 
 import time
+# Reference point for the boot timeline, taken before any heavy imports
+_BOOT_T0 = time.ticks_us()
+
 import ujson as json
+from telemetry import boot, mem, trace
+from log import log
+from bufpool import CHUNK, LINE, pool
 from wifi import WifiManager
 from display import Display
-from app import PersonClickerApp
+from storage import check_frame, discard_frame
+from demostore import DemographicsStore
 
 CONFIG_PATH = 'config.json'
 SECRETS_PATH = 'secrets.json'
 DEMOS_PATH = 'demographics.json'
+# Packed store built from demographics.json by scripts/build_demographics.py
+DEMOS_BIN_PATH = 'demographics.bin'
+CACHED_RAW_PATH = 'images/last.raw'
+# Precompiled RGB565 copy of assets/unknown_portrait.png
+# (regenerate with scripts/make_placeholder_raw.py)
+PLACEHOLDER_RAW_PATH = 'assets/unknown_portrait.raw'
 
 
 def load_json(path):
@@ -21,61 +34,129 @@ def load_json(path):
         return None
 
 
+def load_demographics():
+    """Open the packed demographics store, preferring the copy frozen into
+    the firmware (flash-resident, see manifest.py), then demographics.bin.
+
+    Values are then read by index on demand instead of every list being
+    parsed into RAM. Falls back to parsing demographics.json when no store
+    is available or demographics.json was edited after the store was built.
+    """
+    try:
+        from demographics_data import DEMOGRAPHICS_BIN
+        store = DemographicsStore(DEMOGRAPHICS_BIN)
+        print('Using frozen demographics store')
+        return store
+    except ImportError:
+        pass
+    try:
+        store = DemographicsStore(DEMOS_BIN_PATH)
+    except Exception:
+        store = None
+    if store is not None:
+        if store.matches_source(DEMOS_PATH):
+            print('Using', DEMOS_BIN_PATH)
+            return store
+        print(DEMOS_PATH, 'changed since', DEMOS_BIN_PATH, 'was built; using JSON')
+        store.close()
+    return load_json(DEMOS_PATH)
+
+
+def show_instant_frame(disp, cfg):
+    """Blit the last cached frame, or the precompiled placeholder, straight
+    after display init. Returns the path shown, or None.
+
+    Only raw RGB565 frames are used here: they can be streamed without
+    decoding, so the first pixels appear a few hundred ms after power-on.
+    """
+    if not (cfg.get('boot') or {}).get('instant_frame', True):
+        return None
+    candidates = []
+    if (cfg.get('behavior') or {}).get('show_cached_on_boot', False):
+        candidates.append(CACHED_RAW_PATH)
+    candidates.append(PLACEHOLDER_RAW_PATH)
+    for path in candidates:
+        # Full checksum first: a corrupt frame is never put on the panel
+        meta = check_frame(path, 'rgb565', disp.width, disp.height, full=True)
+        if meta is None:
+            if path == CACHED_RAW_PATH:
+                discard_frame(path)
+            continue
+        if disp.draw_rgb565_raw(path):
+            return path
+        print('Instant frame failed:', path)
+        if path == CACHED_RAW_PATH:
+            discard_frame(path)
+    return None
+
+
 def main():
     print("Starting Person Clicker app...")
+    boot.start(_BOOT_T0)
+    boot.mark('import')
     cfg = load_json(CONFIG_PATH) or {}
+    boot.configure(cfg.get('boot'))
+    log.configure(cfg.get('log'))
+    mem.configure((cfg.get('telemetry') or {}).get('mem'))
+    trace.configure((cfg.get('telemetry') or {}).get('trace'))
     print("Config loaded:", bool(cfg))
-    demos = load_json(DEMOS_PATH) or {}
+    # Allocate the shared display/client/storage buffers now, while the heap
+    # is still unfragmented
+    disp_cfg = cfg.get('display') or {}
+    pool.configure({
+        LINE: int(disp_cfg.get('width', 240)) * 2,
+        CHUNK: int((cfg.get('buffers') or {}).get('chunk_size', 4096)),
+    })
+    demos = load_demographics() or {}
     print("Demographics loaded:", bool(demos))
     # secrets might be absent on dev repo; app will show error if not present
     secrets = load_json(SECRETS_PATH)
     print("Secrets loaded:", bool(secrets))
+    boot.mark('config')
+
+    wifi = WifiManager(secrets.get('wifi') if secrets else None, cfg)
+    if boot.fast:
+        # Fast boot: start association first. connect(blocking=False) returns
+        # immediately and the radio associates in the background while we
+        # initialise the display and build the app.
+        print("Fast boot: starting WiFi before display init")
+        wifi.connect(blocking=False)
+        boot.mark('wifi_start')
 
     # Initialize display early so we can show boot-phase messages.
     print("Initializing display...")
     disp = Display(cfg.get('display', {}))
     disp.init()
     print("Display initialized")
-    
-    # Show a boot-phase message immediately after init (display-ready)
-    try:
-        disp.show_boot_phase("Display: ready", bg_color=(0, 48, 96), fg_color=(255, 255, 255), scale=2)
-        print("Showing 'Display: ready' phase")
-        time.sleep(1)  # Hold for 1 second to make it visible
-    except Exception as e:
-        print("Display ready (boot-phase message failed):", e)
-
-    # Initialize WiFi and show its boot phase messages
-    print("Initializing WiFi...")
-    try:
-        disp.show_boot_phase("WiFi: starting", bg_color=(200, 120, 0), fg_color=(0, 0, 0), scale=2)
-        print("Showing 'WiFi: starting' phase")
-        time.sleep(1)  # Hold for 1 second
-    except Exception as e:
-        print("WiFi starting phase failed:", e)
+    boot.mark('display')
 
-    wifi = WifiManager(secrets.get('wifi') if secrets else None, cfg)
-    wifi.connect(blocking=False)
-
-    try:
-        disp.show_boot_phase("WiFi: connecting", bg_color=(200, 200, 0), fg_color=(0, 0, 0), scale=2)
-        print("Showing 'WiFi: connecting' phase") 
-        time.sleep(1)  # Hold for 1 second
-    except Exception as e:
-        print("WiFi connecting phase failed:", e)
+    # Instant-on: put real pixels on screen before anything else happens.
+    # Everything below continues behind it, with phase messages in a status band.
+    boot.instant = show_instant_frame(disp, cfg)
+    if boot.instant:
+        print("Instant frame shown:", boot.instant)
+        boot.mark('first_frame')
 
+    # Show a boot-phase message immediately after init (display-ready)
+    boot.show_phase(disp, 'display', "Display: ready", bg_color=(0, 48, 96), fg_color=(255, 255, 255))
+
+    if not boot.fast:
+        # Initialize WiFi and show its boot phase messages
+        print("Initializing WiFi...")
+        boot.show_phase(disp, 'wifi_start', "WiFi: starting", bg_color=(200, 120, 0), fg_color=(0, 0, 0))
+        wifi.connect(blocking=False)
+        boot.mark('wifi_start')
+    boot.show_phase(disp, 'wifi_up', "WiFi: connecting", bg_color=(200, 200, 0), fg_color=(0, 0, 0))
     print("WiFi connection initiated")
 
     # Start the app and show app-start boot phase
     print("Starting PersonClickerApp...")
-    try:
-        disp.show_boot_phase("App: starting", bg_color=(0, 128, 64), fg_color=(255, 255, 255), scale=2)
-        print("Showing 'App: starting' phase")
-        time.sleep(1)  # Hold for 1 second
-    except Exception as e:
-        print("App starting phase failed:", e)
+    boot.show_phase(disp, 'app', "App: starting", bg_color=(0, 128, 64), fg_color=(255, 255, 255))
 
+    # Imported here so compiling the app and client does not delay the instant frame
+    from app import PersonClickerApp
     app = PersonClickerApp(cfg, demos, secrets, disp, wifi)
+    boot.mark('app')
 
     print("Starting main app loop...")
     try:
@@ -0,0 +1,33 @@
+# manifest.py - frozen-module manifest for the custom firmware flow
+#
+# Freezes the app modules (and generated constant-data modules) into the
+# firmware image so they are neither compiled nor loaded into RAM at boot:
+# bytecode and constant tables such as the 5x7 font in display.py are
+# executed/served straight from flash. See custom_micropython.md.
+#
+#   python scripts/freeze_data.py
+#   cd micropython-build/ports/rp2
+#   make BOARD=RPI_PICO2_W FROZEN_MANIFEST=/path/to/person_clicker/micropython/manifest.py
+#
+# main.py is deliberately not frozen so it can still be edited on the device.
+
+include("$(PORT_DIR)/boards/manifest.py")
+
+for name in (
+    "api_client.py",
+    "app.py",
+    "bufpool.py",
+    "buttons.py",
+    "demostore.py",
+    "display.py",
+    "endpoints.py",
+    "log.py",
+    "storage.py",
+    "telemetry.py",
+    "wifi.py",
+):
+    module(name, opt=1)
+
+# Packed demographics store generated from demographics.json by
+# scripts/freeze_data.py; DemographicsStore reads it in place from flash.
+module("demographics_data.py", base_path="../build/frozen", opt=1)
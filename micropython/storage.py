@@ -42,3 +42,175 @@ def read_binary(path):
     except Exception as e:
         print('read_binary failed:', e)
         return None
+
+
+# --- Cached frame metadata -------------------------------------------------
+# Every cached frame (images/last.raw, images/last.png) gets a small JSON
+# sidecar at '<path>.meta' recording size, dimensions, format and checksum.
+# Boot can then decide what to show from the sidecar plus os.stat() without
+# reading the pixel data, and only stream the frame once it is known good.
+
+META_SUFFIX = '.meta'
+# Number of bytes at the end of a frame covered by the cheap tail checksum
+TAIL_BYTES = 256
+
+try:
+    import ubinascii as _binascii
+except Exception:
+    import binascii as _binascii
+
+
+def crc32(data, crc=0):
+    """Running CRC32 over data. Returns None if the port lacks crc32."""
+    try:
+        return _binascii.crc32(data, crc) & 0xFFFFFFFF
+    except Exception:
+        return None
+
+
+def file_size(path):
+    """Return the size of path in bytes using os.stat, or None if missing."""
+    try:
+        return os.stat(path)[6]
+    except Exception:
+        return None
+
+
+def file_crc32(path):
+    """CRC32 of a whole file, read through the pooled chunk buffer. Returns
+    None if the file cannot be read or the port lacks crc32."""
+    from bufpool import CHUNK, pool
+    buf = pool.borrow(CHUNK)
+    size = len(buf)
+    crc = 0
+    try:
+        with open(path, 'rb') as f:
+            while crc is not None:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                crc = crc32(buf if n == size else buf[:n], crc)
+    except Exception:
+        crc = None
+    finally:
+        pool.give_back(CHUNK, buf)
+    return crc
+
+
+def _tail_crc(path, size):
+    n = min(TAIL_BYTES, size)
+    if n <= 0:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            f.seek(size - n)
+            return crc32(f.read(n))
+    except Exception:
+        return None
+
+
+def write_frame_meta(path, fmt, width=None, height=None, crc=None, extra=None):
+    """Write the metadata sidecar for a cached frame that is already on disk.
+
+    fmt is 'rgb565' or 'png'. crc is the CRC32 of the whole file when the
+    writer computed it while streaming; the tail checksum is always taken
+    here from the last TAIL_BYTES of the file.
+    """
+    size = file_size(path)
+    if size is None:
+        return False
+    meta = {
+        'format': fmt,
+        'size': size,
+        'width': width,
+        'height': height,
+        'crc': crc,
+        'tail_crc': _tail_crc(path, size),
+    }
+    if extra:
+        meta.update(extra)
+    try:
+        import ujson as json
+    except Exception:
+        import json
+    return atomic_write(path + META_SUFFIX, json.dumps(meta).encode('utf-8'))
+
+
+def read_frame_meta(path):
+    """Return the parsed sidecar dict for path, or None if missing/invalid."""
+    try:
+        import ujson as json
+    except Exception:
+        import json
+    try:
+        with open(path + META_SUFFIX, 'r') as f:
+            meta = json.load(f)
+        return meta if isinstance(meta, dict) else None
+    except Exception:
+        return None
+
+
+def update_frame_meta(path, extra):
+    """Merge extra keys (e.g. the request cache key) into an existing sidecar."""
+    meta = read_frame_meta(path)
+    if meta is None:
+        return False
+    meta.update(extra)
+    try:
+        import ujson as json
+    except Exception:
+        import json
+    return atomic_write(path + META_SUFFIX, json.dumps(meta).encode('utf-8'))
+
+
+def check_frame(path, fmt, width=None, height=None, full=False):
+    """Cheaply validate a cached frame without reading its pixel data.
+
+    Returns the metadata dict when the frame looks usable, otherwise None.
+    For rgb565 frames the size must be exactly width*height*2. Frames
+    written before sidecars existed are accepted on a stat() size check
+    alone so upgrading firmware does not throw away the last image.
+    With full the whole file is also checked against the sidecar's CRC32
+    (one read from flash), which catches corruption before the tail.
+    """
+    size = file_size(path)
+    if not size:
+        return None
+    expected = (width * height * 2) if (fmt == 'rgb565' and width and height) else None
+    meta = read_frame_meta(path)
+    if meta is None:
+        if expected is not None and size != expected:
+            print('check_frame: {} has no metadata and wrong size {}'.format(path, size))
+            return None
+        return {'format': fmt, 'size': size, 'width': width, 'height': height}
+    if meta.get('format') != fmt:
+        print('check_frame: {} format {} != {}'.format(path, meta.get('format'), fmt))
+        return None
+    if meta.get('size') != size:
+        print('check_frame: {} truncated ({} of {} bytes)'.format(path, size, meta.get('size')))
+        return None
+    if expected is not None:
+        if size != expected or meta.get('width') != width or meta.get('height') != height:
+            print('check_frame: {} is {}x{}, display is {}x{}'.format(
+                path, meta.get('width'), meta.get('height'), width, height))
+            return None
+    tail = meta.get('tail_crc')
+    if tail is not None and _tail_crc(path, size) != tail:
+        print('check_frame: {} tail checksum mismatch'.format(path))
+        return None
+    crc = meta.get('crc')
+    if full and crc is not None:
+        got = file_crc32(path)
+        if got is not None and got != crc:
+            print('check_frame: {} checksum mismatch'.format(path))
+            return None
+    return meta
+
+
+def discard_frame(path):
+    """Remove a cached frame and its sidecar (used for corrupt frames)."""
+    for p in (path, path + META_SUFFIX):
+        try:
+            os.remove(p)
+        except Exception:
+            pass
@@ -0,0 +1,483 @@
+# telemetry.py - lightweight on-device timing and memory telemetry for the Person Clicker app
+import gc
+import time
+
+try:
+    import ujson as json
+except Exception:
+    import json
+
+
+def ticks_us():
+    try:
+        return time.ticks_us()
+    except AttributeError:
+        # Host Python fallback
+        return int(time.perf_counter() * 1000000)
+
+
+def ticks_diff(a, b):
+    try:
+        return time.ticks_diff(a, b)
+    except AttributeError:
+        return a - b
+
+
+def ticks_ms():
+    # Not ticks_us() // 1000: ticks_us wraps every 2**30 us (~18 minutes),
+    # so the quotient would wrap at a period ticks_diff does not expect
+    try:
+        return time.ticks_ms()
+    except AttributeError:
+        return int(time.perf_counter() * 1000)
+
+
+def mem_free():
+    try:
+        return gc.mem_free()
+    except AttributeError:
+        # Host Python: no heap statistics
+        return None
+
+
+def mem_alloc():
+    try:
+        return gc.mem_alloc()
+    except AttributeError:
+        return None
+
+
+class BootProfiler:
+    """Boot timeline recorder and boot-phase screen gate.
+
+    Each phase is marked once with the ticks_us elapsed since main.py
+    started executing. The timeline is printed and persisted so boot time
+    can be tracked as a metric; the previous boot's timeline is loaded at
+    start and used in fast-boot mode to decide which phase screens are
+    worth showing (only phases that were actually slow last time).
+    """
+
+    def __init__(self):
+        self.t0 = ticks_us()
+        self.fast = False
+        self.slow_phase_ms = 400
+        self.min_visible_ms = 300
+        self.path = 'boot_timeline.json'
+        self.marks = []       # [(phase, us_since_t0, duration_us)]
+        self.previous = {}    # phase -> duration_us from the last boot
+        self._last_us = 0
+        self._shown_at = None
+        # Path of the instant-on frame when one was blitted at boot; phase
+        # messages then go to the status band instead of full-screen fills.
+        self.instant = None
+
+    def start(self, t0=None):
+        """Reset the timeline; t0 is the ticks_us taken at the top of main.py."""
+        self.t0 = t0 if t0 is not None else ticks_us()
+        self.marks = []
+        self._last_us = 0
+
+    def configure(self, cfg=None):
+        """Apply the 'boot' config section and load the last boot's timeline."""
+        cfg = cfg or {}
+        self.fast = bool(cfg.get('fast_boot', False))
+        self.slow_phase_ms = int(cfg.get('slow_phase_ms', self.slow_phase_ms))
+        self.min_visible_ms = int(cfg.get('phase_min_visible_ms', self.min_visible_ms))
+        self.path = cfg.get('timeline_path', self.path)
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            for entry in data.get('phases') or []:
+                self.previous[entry['phase']] = entry['duration_us']
+        except Exception:
+            # First boot or unreadable timeline: show every screen we're asked to
+            pass
+
+    def elapsed_us(self):
+        return ticks_diff(ticks_us(), self.t0)
+
+    def done(self, phase):
+        for m in self.marks:
+            if m[0] == phase:
+                return True
+        return False
+
+    def mark(self, phase, since=None):
+        """Record the end of phase. Duration is measured from the previous
+        mark, or from the mark named by since (e.g. WiFi up since WiFi start).
+        Repeated marks of the same phase are ignored."""
+        if self.done(phase):
+            return None
+        now = self.elapsed_us()
+        begin = self._last_us
+        if since is not None:
+            for m in self.marks:
+                if m[0] == since:
+                    begin = m[1]
+                    break
+        self.marks.append((phase, now, now - begin))
+        if since is None:
+            self._last_us = now
+        print('boot: {} at {} ms (+{} ms)'.format(phase, now // 1000, (now - begin) // 1000))
+        return now
+
+    def was_slow(self, phase):
+        prev = self.previous.get(phase)
+        if prev is None:
+            return True
+        return prev >= self.slow_phase_ms * 1000
+
+    def settle(self):
+        """Keep the current phase screen up for its minimum visibility."""
+        if self._shown_at is None:
+            return
+        left = self.min_visible_ms - ticks_diff(ticks_us(), self._shown_at) // 1000
+        self._shown_at = None
+        if left > 0:
+            time.sleep(left / 1000)
+
+    def show_phase(self, display, phase, text, bg_color=(0, 0, 0), fg_color=(255, 255, 255)):
+        """Show a boot-phase screen for phase.
+
+        Outside fast-boot mode every screen is shown and held for a second
+        (the original behaviour). In fast-boot mode a screen is only shown if
+        the phase it announces was slow on the previous boot, and it stays up
+        for at least min_visible_ms before the next draw replaces it. Once an
+        instant-on frame is showing, messages use the status band instead.
+        """
+        if self.fast and not self.was_slow(phase):
+            return False
+        try:
+            self.settle()
+            if self.instant:
+                display.show_status(text, bg_color=bg_color, fg_color=fg_color)
+            else:
+                display.show_boot_phase(text, bg_color=bg_color, fg_color=fg_color, scale=2)
+            print("Showing '{}' phase".format(text))
+        except Exception as e:
+            print('Boot phase display failed:', e)
+            return False
+        if self.fast:
+            self._shown_at = ticks_us()
+        else:
+            time.sleep(1)  # Hold for 1 second to make it visible
+        return True
+
+    def timeline(self):
+        return {
+            'fast_boot': self.fast,
+            'total_us': self.marks[-1][1] if self.marks else 0,
+            'phases': [{'phase': p, 'at_us': at, 'duration_us': d} for (p, at, d) in self.marks],
+        }
+
+    def report(self, save=True):
+        """Print the timeline and optionally persist it to self.path."""
+        print('boot timeline ({}):'.format('fast' if self.fast else 'normal'))
+        for (p, at, d) in self.marks:
+            print('  {:<12} {:>7} ms  +{} ms'.format(p, at // 1000, d // 1000))
+        if save:
+            try:
+                from storage import atomic_write
+                atomic_write(self.path, json.dumps(self.timeline()).encode('utf-8'))
+            except Exception as e:
+                print('boot timeline save failed:', e)
+
+
+class MemProfiler:
+    """Heap and fragmentation sampler for the request/download/decode/blit
+    phases.
+
+    sample(phase) records free and allocated heap and a count of garbage
+    collections seen so far. The last ring_size samples are kept in a ring
+    buffer and per-phase min/max/last of free heap and largest block are
+    kept alongside. A largest block much smaller than the free heap is
+    fragmentation, which is what makes the PNG decode's big allocations
+    fail.
+
+    MicroPython only prints mem_info() and has no GC counter, so the largest
+    block is found by probing allocations, and a collection is counted
+    whenever allocated heap dropped since the previous sample (a lower
+    bound). The probes allocate and can force a collection, so the image
+    phases never run them: the dump chord does, and with probe_largest
+    idle() does every idle_probe_ms from the main loop. dump() prints
+    everything over serial; export() writes it as JSON.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.probe_largest = False
+        self.idle_probe_ms = 30000
+        self.resolution = 512
+        self.ring_size = 32
+        self.path = 'mem_profile.json'
+        self.dump_chord = ('X', 'Y')
+        self.chord_window_ms = 150
+        self.ring = []        # [(phase, ticks_ms, free, alloc, largest, gc_runs)]
+        self._next = 0
+        self.phases = {}      # phase -> [count, min_free, max_free, last_free, min_largest, max_largest, last_largest]
+        self.gc_runs = 0
+        self._last_alloc = None
+        self._probed = None
+
+    def configure(self, cfg=None):
+        """Apply the 'telemetry.mem' config section."""
+        cfg = cfg or {}
+        self.enabled = bool(cfg.get('enabled', self.enabled))
+        self.probe_largest = bool(cfg.get('probe_largest', self.probe_largest))
+        self.idle_probe_ms = max(1000, int(cfg.get('idle_probe_ms', self.idle_probe_ms)))
+        self.resolution = max(16, int(cfg.get('probe_resolution', self.resolution)))
+        self.ring_size = max(1, int(cfg.get('ring_size', self.ring_size)))
+        self.path = cfg.get('export_path', self.path)
+        chord = cfg.get('dump_chord')
+        if chord:
+            self.dump_chord = tuple(chord)
+        self.chord_window_ms = max(0, int(cfg.get('chord_window_ms', self.chord_window_ms)))
+        self.ring = []
+        self._next = 0
+
+    def largest_block(self):
+        """Largest single allocation currently possible, rounded down to
+        resolution bytes, or None on the host.
+
+        Binary search with bytearray probes. A probe that does not fit makes
+        the allocator collect and retry by itself, so garbage left by earlier
+        probes cannot cause a false failure.
+        """
+        free = mem_free()
+        if free is None:
+            return None
+        res = self.resolution
+        lo = 0
+        hi = free // res
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            try:
+                probe = bytearray(mid * res)
+                probe = None
+                lo = mid
+            except MemoryError:
+                hi = mid - 1
+        return lo * res
+
+    def sample(self, phase, probe=False):
+        """Record the heap state at the end of phase. Only mem_free() and
+        mem_alloc() unless probe is set, so it allocates nothing on the
+        paths it observes."""
+        if not self.enabled:
+            return None
+        alloc = mem_alloc()
+        if alloc is not None and self._last_alloc is not None and alloc < self._last_alloc:
+            self.gc_runs += 1
+        free = mem_free()
+        largest = None
+        if probe:
+            largest = self.largest_block()
+            # Probe garbage is counted as allocated; measure the next GC from here
+            alloc_after = mem_alloc()
+        else:
+            alloc_after = alloc
+        self._last_alloc = alloc_after
+        entry = (phase, ticks_ms(), free, alloc, largest, self.gc_runs)
+        if len(self.ring) < self.ring_size:
+            self.ring.append(entry)
+        else:
+            self.ring[self._next] = entry
+        self._next = (self._next + 1) % self.ring_size
+
+        st = self.phases.get(phase)
+        if st is None:
+            st = [0, free, free, free, largest, largest, largest]
+            self.phases[phase] = st
+        st[0] += 1
+        if free is not None:
+            st[1] = min(st[1], free)
+            st[2] = max(st[2], free)
+            st[3] = free
+        if largest is not None:
+            st[4] = largest if st[4] is None else min(st[4], largest)
+            st[5] = largest if st[5] is None else max(st[5], largest)
+            st[6] = largest
+        return entry
+
+    def idle(self):
+        """Main-loop idle point: with probe_largest, sample the largest
+        block every idle_probe_ms, outside any image phase."""
+        if not (self.enabled and self.probe_largest):
+            return None
+        now = ticks_ms()
+        if self._probed is not None and ticks_diff(now, self._probed) < self.idle_probe_ms:
+            return None
+        self._probed = now
+        return self.sample('idle', probe=True)
+
+    def samples(self):
+        """Ring buffer contents, oldest first."""
+        if len(self.ring) < self.ring_size:
+            return list(self.ring)
+        return self.ring[self._next:] + self.ring[:self._next]
+
+    def as_dict(self):
+        out = {
+            'gc_runs': self.gc_runs,
+            'samples': [{'phase': p, 'ms': t, 'free': f, 'alloc': a, 'largest': l, 'gc_runs': g}
+                        for (p, t, f, a, l, g) in self.samples()],
+            'phases': {},
+        }
+        for phase, st in self.phases.items():
+            out['phases'][phase] = {
+                'count': st[0],
+                'free': {'min': st[1], 'max': st[2], 'last': st[3]},
+                'largest': {'min': st[4], 'max': st[5], 'last': st[6]},
+            }
+        try:
+            from bufpool import pool
+            out['bufpool'] = pool.stats()
+        except Exception:
+            pass
+        return out
+
+    def dump(self):
+        """Print the per-phase summary and the recent samples over serial."""
+        print('mem: {} samples, {} GC runs seen'.format(len(self.ring), self.gc_runs))
+        print('  {:<10} {:>5} {:>8} {:>8} {:>8} {:>8} {:>8}'.format(
+            'phase', 'n', 'free min', 'free max', 'free', 'blk min', 'blk'))
+        for phase, st in self.phases.items():
+            print('  {:<10} {:>5} {:>8} {:>8} {:>8} {:>8} {:>8}'.format(
+                phase, st[0], str(st[1]), str(st[2]), str(st[3]), str(st[4]), str(st[6])))
+        for (p, t, f, a, l, g) in self.samples():
+            frag = ''
+            if f and l is not None:
+                frag = ' frag {}%'.format(100 - (100 * l) // f)
+            print('  {:>9} ms {:<10} free {} alloc {} largest {} gc {}{}'.format(t, p, f, a, l, g, frag))
+
+    def export(self, path=None):
+        """Write the profile as JSON (atomically). Returns the path or None."""
+        path = path or self.path
+        try:
+            from storage import atomic_write
+            if atomic_write(path, json.dumps(self.as_dict()).encode('utf-8')):
+                return path
+        except Exception as e:
+            print('mem profile export failed:', e)
+        return None
+
+
+class SpanTracer:
+    """Press-to-last-pixel latency spans.
+
+    begin(request_id, t0) opens a request at ticks_us t0 (the button edge
+    when there is one); span()/add() then record (request_id, name,
+    start offset from t0, duration) into a fixed-size ring buffer. Span
+    names used by the app: edge, settle, prompt, dns, connect, send, ttfb,
+    body, flash, decode, blit and total.
+
+    summary() prints per-span p50/p90/max over the ring (the heartbeat calls
+    it) and dump() emits the ring as JSON lines, one span per line, so runs
+    on different firmware builds or backends can be compared offline.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.ring_size = 128
+        self.path = 'trace.jsonl'
+        self.ring = []        # [(request_id, name, at_us, duration_us)]
+        self._next = 0
+        self.rid = 0
+        self._base = ticks_us()
+        self._recorded = 0
+        self._summarised = 0
+
+    def configure(self, cfg=None):
+        """Apply the 'telemetry.trace' config section."""
+        cfg = cfg or {}
+        self.enabled = bool(cfg.get('enabled', self.enabled))
+        self.ring_size = max(1, int(cfg.get('ring_size', self.ring_size)))
+        self.path = cfg.get('export_path', self.path)
+        self.ring = []
+        self._next = 0
+
+    def begin(self, rid, t0=None):
+        """Start attributing spans to request rid; offsets are from t0."""
+        self.rid = rid
+        self._base = t0 if t0 is not None else ticks_us()
+
+    def add(self, name, duration_us, t_start=None):
+        """Record a span of duration_us (e.g. time accumulated over a loop)."""
+        if not self.enabled:
+            return
+        at = ticks_diff(t_start, self._base) if t_start is not None else None
+        entry = (self.rid, name, at, duration_us)
+        if len(self.ring) < self.ring_size:
+            self.ring.append(entry)
+        else:
+            self.ring[self._next] = entry
+        self._next = (self._next + 1) % self.ring_size
+        self._recorded += 1
+
+    def span(self, name, t_start, t_end=None):
+        """Record name as running from ticks_us t_start to t_end (now)."""
+        if t_end is None:
+            t_end = ticks_us()
+        self.add(name, ticks_diff(t_end, t_start), t_start)
+        return t_end
+
+    def finish(self, name='total'):
+        """Record name as running from begin() until now."""
+        return self.span(name, self._base)
+
+    def spans(self):
+        """Ring buffer contents, oldest first."""
+        if len(self.ring) < self.ring_size:
+            return list(self.ring)
+        return self.ring[self._next:] + self.ring[:self._next]
+
+    def percentiles(self):
+        """name -> (count, p50_us, p90_us, max_us) over the ring (nearest rank)."""
+        by_name = {}
+        order = []
+        for (_, name, _, d) in self.spans():
+            if name not in by_name:
+                by_name[name] = []
+                order.append(name)
+            by_name[name].append(d)
+        out = {}
+        for name in order:
+            ds = sorted(by_name[name])
+            n = len(ds)
+            out[name] = (n, ds[(n - 1) * 50 // 100], ds[(n - 1) * 90 // 100], ds[-1])
+        return out
+
+    def summary(self, force=False):
+        """Print span percentiles (ms). Skipped when nothing new was recorded
+        since the last summary unless force is set."""
+        if not self.ring or (self._recorded == self._summarised and not force):
+            return False
+        self._summarised = self._recorded
+        print('trace: {} spans, last request {}'.format(len(self.ring), self.rid))
+        for name, (n, p50, p90, mx) in self.percentiles().items():
+            print('  {:<8} n={:<3} p50 {:>7.1f} p90 {:>7.1f} max {:>7.1f} ms'.format(
+                name, n, p50 / 1000, p90 / 1000, mx / 1000))
+        return True
+
+    def dump(self, path=None):
+        """Print the ring as JSON lines and write them to path (default
+        self.path). Returns the path written, or None."""
+        path = path or self.path
+        lines = []
+        for (rid, name, at, d) in self.spans():
+            line = json.dumps({'rid': rid, 'span': name, 'at_us': at, 'us': d})
+            print(line)
+            lines.append(line)
+        try:
+            from storage import atomic_write
+            if atomic_write(path, ('\n'.join(lines) + '\n').encode('utf-8')):
+                return path
+        except Exception as e:
+            print('trace dump failed:', e)
+        return None
+
+
+# Module-level profilers shared by main.py, app.py and the drivers
+boot = BootProfiler()
+mem = MemProfiler()
+trace = SpanTracer()
@@ -3,23 +3,130 @@
 Canonical single-definition WifiManager. Ensures __init__ accepts the
 optional second argument so callers that pass only wifi_cfg won't hit
 the TypeError you observed.
+
+Networks: wifi_cfg is either a single {"ssid", "password"} or
+{"networks": [{"ssid", "password", "priority"}, ...]}. With several
+networks the manager scans (results cached for 'wifi.scan_ttl_s'), ranks
+the visible access points by RSSI plus 'wifi.priority_db' per priority
+step, and joins the best BSSID on its channel, moving down the list when
+one fails. A single network is joined by SSID and the firmware scans.
+
+Reconnects are fast and event-driven:
+
+- After every successful association the access point's SSID, BSSID and
+  channel are cached in wifi_cache.json (config 'wifi.cache_path'). The
+  next connect first joins that BSSID on that channel directly, which skips
+  the scan. If it has not come up within 'wifi.fast_timeout_ms' the cache
+  is dropped and the ranked (or plain) join follows.
+- An optional 'wifi.static_ip' skips DHCP.
+- poll() is cheap and meant to be called on every main-loop pass (it
+  rate-limits itself to 'wifi.poll_ms'). A dropped link is noticed within
+  one poll and re-joined immediately; once every candidate has failed, the
+  next round waits an exponential backoff capped at 'wifi.backoff_max_s'.
+- busy(True)/busy(False) bracket transfers: the radio runs in the
+  'wifi.pm.active' power mode during a transfer and returns to
+  'wifi.pm.idle' once it has been idle for 'wifi.pm.idle_after_ms'.
+- note_transfer() feeds measured body throughput. When its running
+  average falls below 'wifi.migrate_below_kBps', the next idle stretch of
+  'wifi.migrate_idle_ms' rescans and moves to an access point scoring at
+  least 'wifi.migrate_margin_db' better, at most once per
+  'wifi.migrate_cooldown_s'.
+- Every connect records its kind (fast/ranked/full/migrate), SSID,
+  duration and attempt count; see metrics().
 """
-import time
+try:
+	import ujson as json
+except Exception:
+	import json
+try:
+	import ubinascii as binascii
+except Exception:
+	import binascii
 try:
 	import network
 except Exception:
 	network = None
 
+from log import log
+from telemetry import ticks_diff, ticks_ms
+
+# connects kept in WifiManager.history
+HISTORY_SIZE = 8
+
+
+def _sleep_ms(ms):
+	import time
+	try:
+		time.sleep_ms(ms)
+	except AttributeError:
+		time.sleep(ms / 1000)
+
+
+def _networks(wifi_cfg):
+	"""Configured networks as dicts with ssid/password/priority, highest
+	priority first."""
+	wifi_cfg = wifi_cfg or {}
+	nets = []
+	for net in wifi_cfg.get('networks') or ():
+		if net.get('ssid'):
+			nets.append({'ssid': net['ssid'], 'password': net.get('password'), 'priority': int(net.get('priority', 0))})
+	if wifi_cfg.get('ssid') and not any(n['ssid'] == wifi_cfg['ssid'] for n in nets):
+		nets.append({'ssid': wifi_cfg['ssid'], 'password': wifi_cfg.get('password'), 'priority': int(wifi_cfg.get('priority', 0))})
+	nets.sort(key=lambda n: -n['priority'])
+	return nets
+
 
 class WifiManager:
 	def __init__(self, wifi_cfg=None, cfg=None):
-		# wifi_cfg expected: {"ssid": "name", "password": "pw"}
+		# wifi_cfg expected: {"ssid": "name", "password": "pw"} or
+		# {"networks": [{"ssid": "name", "password": "pw", "priority": 1}, ...]}
 		self.wifi_cfg = wifi_cfg or {}
 		self.cfg = cfg or {}
+		self.networks = _networks(self.wifi_cfg)
+		opts = self.cfg.get('wifi') or {}
+		self.cache_path = opts.get('cache_path', 'wifi_cache.json')
+		self.fast_reconnect = bool(opts.get('fast_reconnect', True))
+		self.fast_timeout_ms = int(opts.get('fast_timeout_ms', 3000))
+		self.attempt_timeout_ms = int(opts.get('attempt_timeout_ms', 10000))
+		self.backoff_max_s = int(opts.get('backoff_max_s', 30))
+		self.poll_ms = int(opts.get('poll_ms', 200))
+		self.static_ip = opts.get('static_ip') or None
+		self.scan_ttl_ms = int(opts.get('scan_ttl_s', 300)) * 1000
+		self.priority_db = int(opts.get('priority_db', 10))
+		self.migrate_below = float(opts.get('migrate_below_kBps', 0))
+		self.migrate_margin_db = int(opts.get('migrate_margin_db', 8))
+		self.migrate_idle_ms = int(opts.get('migrate_idle_ms', 5000))
+		self.migrate_cooldown_ms = int(opts.get('migrate_cooldown_s', 300)) * 1000
+		self.migrate_min_bytes = int(opts.get('migrate_min_bytes', 16384))
+		pm = opts.get('pm') or {}
+		self.pm_active = pm.get('active', 'performance')
+		self.pm_idle = pm.get('idle', 'powersave')
+		self.pm_idle_after_ms = int(pm.get('idle_after_ms', 2000))
+		self.connect_timeout_s = int((self.cfg.get('timeouts') or {}).get('wifi_connect_seconds', 20))
+
 		self._wlan = None
 		self._state = 'idle'
 		self._last_attempt = 0
 		self._attempt = 0
+		self._round = 0
+		self._queue = []
+		self._target = None
+		self._mode = None
+		self._episode_t0 = 0
+		self._last_poll = None
+		self._cache = None
+		self._cache_loaded = False
+		self._scan = None
+		self._scan_t = 0
+		self._pm = None
+		self._busy = False
+		self._idle_since = 0
+		self.throughput = None
+		self._migrate_pending = False
+		self._last_migrate = None
+		self.stats = {'connects': 0, 'drops': 0, 'fast_hits': 0, 'fast_misses': 0, 'failures': 0,
+		              'scans': 0, 'migrations': 0}
+		self.history = []
 
 	def _ensure_iface(self):
 		if network is None:
@@ -34,6 +141,225 @@ class WifiManager:
 					self._wlan = None
 		return self._wlan
 
+	def _network(self, ssid):
+		for net in self.networks:
+			if net['ssid'] == ssid:
+				return net
+		return None
+
+	def _score(self, ssid, rssi):
+		net = self._network(ssid)
+		return rssi + (net['priority'] if net else 0) * self.priority_db
+
+	# -- BSSID/channel cache ------------------------------------------------
+
+	def _load_cache(self):
+		if not self._cache_loaded:
+			self._cache_loaded = True
+			try:
+				with open(self.cache_path, 'r') as f:
+					self._cache = json.load(f)
+			except Exception:
+				self._cache = None
+		cache = self._cache
+		if cache and cache.get('bssid') and self._network(cache.get('ssid')):
+			return cache
+		return None
+
+	def _save_cache(self, ssid, bssid, channel):
+		cache = {'ssid': ssid, 'bssid': binascii.hexlify(bssid).decode(), 'channel': channel}
+		if cache == self._cache:
+			return
+		self._cache = cache
+		try:
+			from storage import atomic_write
+			atomic_write(self.cache_path, json.dumps(cache).encode('utf-8'))
+		except Exception as e:
+			log.warn('wifi: cache save failed: %s', e)
+
+	def _drop_cache(self):
+		self._cache = None
+		self._cache_loaded = True
+		try:
+			import os
+			os.remove(self.cache_path)
+		except Exception:
+			pass
+
+	# -- scanning and ranking -------------------------------------------------
+
+	def scan(self, max_age_ms=None):
+		"""Visible access points of the configured networks as
+		(ssid, bssid, channel, rssi) tuples, from a scan at most max_age_ms
+		(default scan_ttl_ms) old. Scanning blocks for a second or two, so
+		callers keep it off the button-to-request path."""
+		wlan = self._ensure_iface()
+		if wlan is None:
+			return []
+		if max_age_ms is None:
+			max_age_ms = self.scan_ttl_ms
+		now = ticks_ms()
+		if self._scan is not None and ticks_diff(now, self._scan_t) < max_age_ms:
+			return self._scan
+		aps = []
+		try:
+			for ap in wlan.scan():
+				ssid = ap[0].decode() if isinstance(ap[0], bytes) else ap[0]
+				if self._network(ssid):
+					aps.append((ssid, bytes(ap[1]), ap[2], ap[3]))
+		except Exception as e:
+			log.warn('wifi: scan failed: %s', e)
+			return self._scan or []
+		self.stats['scans'] += 1
+		self._scan = aps
+		self._scan_t = ticks_ms()
+		if __debug__:
+			log.debug('wifi: scan found %d candidate AP(s) in %d ms', len(aps), ticks_diff(self._scan_t, now))
+		return aps
+
+	def ranked(self, max_age_ms=None):
+		"""scan() results best first: RSSI plus priority_db per priority step."""
+		aps = list(self.scan(max_age_ms))
+		aps.sort(key=lambda ap: -self._score(ap[0], ap[3]))
+		return aps
+
+	def _plan(self, max_age_ms=None):
+		"""Join targets for the next round, as (ssid, bssid, channel) with
+		bssid None for a plain join by SSID."""
+		if len(self.networks) > 1 and self.fast_reconnect:
+			targets = [(ap[0], ap[1], ap[2]) for ap in self.ranked(max_age_ms)]
+			if targets:
+				return targets
+		# One network, nothing visible (hidden SSID) or no bssid support:
+		# let the firmware scan for each SSID in priority order
+		return [(net['ssid'], None, None) for net in self.networks]
+
+	def _learn_ap(self, wlan, ssid):
+		"""Find the BSSID/channel just joined and cache them. Uses the scan
+		cache, scanning only when the port cannot report the BSSID."""
+		bssid = None
+		channel = None
+		try:
+			bssid = wlan.config('bssid')
+		except Exception:
+			pass
+		if bssid:
+			try:
+				channel = wlan.config('channel')
+			except Exception:
+				pass
+		else:
+			best = None
+			for ap in self.scan():
+				if ap[0] == ssid and (best is None or ap[3] > best[3]):
+					best = ap
+			if best:
+				bssid, channel = best[1], best[2]
+		if bssid:
+			self._save_cache(ssid, bytes(bssid), channel)
+
+	# -- static IP and power management --------------------------------------
+
+	def _apply_static_ip(self, wlan):
+		ip = self.static_ip
+		if not ip:
+			return
+		try:
+			wlan.ifconfig((ip['ip'], ip.get('netmask', '255.255.255.0'), ip['gateway'], ip.get('dns', ip['gateway'])))
+		except Exception as e:
+			log.warn('wifi: static IP not applied: %s', e)
+
+	def _set_pm(self, name):
+		if not name or name == self._pm:
+			return
+		wlan = self._ensure_iface()
+		if wlan is None:
+			return
+		attr = 'PM_' + name.upper()
+		value = getattr(wlan, attr, None)
+		if value is None:
+			value = getattr(network.WLAN, attr, None)
+		if value is None:
+			return
+		try:
+			wlan.config(pm=value)
+			self._pm = name
+			if __debug__:
+				log.debug('wifi: pm %s', name)
+		except Exception as e:
+			log.warn('wifi: pm %s failed: %s', name, e)
+
+	def busy(self, on):
+		"""Bracket a transfer: switch to the active power mode now, and back to
+		the idle mode once the link has been idle for pm_idle_after_ms."""
+		self._busy = bool(on)
+		if on:
+			self._set_pm(self.pm_active)
+		else:
+			self._idle_since = ticks_ms()
+
+	def note_transfer(self, nbytes, duration_us):
+		"""Record a completed body transfer. Small bodies are ignored; their
+		time is dominated by latency, not link rate."""
+		if nbytes < self.migrate_min_bytes or duration_us <= 0:
+			return
+		rate = nbytes * 1000.0 / duration_us   # bytes/us * 1000 = kB/s
+		self.throughput = rate if self.throughput is None else (self.throughput + rate) / 2
+		if __debug__:
+			log.debug('wifi: transfer %d B at %.1f kB/s (avg %.1f)', nbytes, rate, self.throughput)
+		if self.migrate_below and self.throughput < self.migrate_below:
+			self._migrate_pending = True
+
+	# -- connection state machine ---------------------------------------------
+
+	def _join(self, wlan, ssid, bssid=None, channel=None):
+		"""Start joining ssid, on a specific BSSID/channel when given.
+		Returns True if the targeted join was issued."""
+		password = (self._network(ssid) or {}).get('password')
+		if bssid is not None:
+			try:
+				wlan.connect(ssid, password, bssid=bssid, channel=int(channel or 0))
+				return True
+			except TypeError:
+				# this port does not take bssid/channel
+				self.fast_reconnect = False
+			except Exception as e:
+				log.warn('wifi: join %s failed: %s', ssid, e)
+		try:
+			wlan.connect(ssid, password)
+		except Exception:
+			try:
+				wlan.connect((ssid, password))
+			except Exception as e:
+				log.warn('wifi: connect call failed: %s', e)
+		return False
+
+	def _start_attempt(self, wlan, now):
+		self._last_attempt = now
+		self._attempt += 1
+		cache = self._load_cache() if self.fast_reconnect else None
+		if cache and self._attempt == 1 and self._mode != 'migrate':
+			self._target = (cache['ssid'], binascii.unhexlify(cache['bssid']), cache.get('channel'))
+			if self._join(wlan, *self._target):
+				self._mode = 'fast'
+				return
+		if not self._queue:
+			# a new round: the first one may use a cached scan, later ones rescan
+			self._round += 1
+			self._queue = self._plan(None if self._round == 1 else 0)
+		self._target = self._queue.pop(0)
+		if self._mode != 'migrate' or self._attempt > 1:
+			self._mode = 'ranked' if self._target[1] is not None else 'full'
+		self._join(wlan, *self._target)
+
+	def _begin(self, wlan, now, targets=None):
+		self._state = 'connecting'
+		self._attempt = 0
+		self._round = 1 if targets else 0
+		self._queue = list(targets or ())
+		self._episode_t0 = now
+		self._start_attempt(wlan, now)
+
 	def connect(self, blocking=False):
 		"""Start connection.
 
@@ -43,102 +369,196 @@ class WifiManager:
 		connection status.
 		"""
 		wlan = self._ensure_iface()
-		ssid = (self.wifi_cfg or {}).get('ssid')
-		password = (self.wifi_cfg or {}).get('password')
 
 		if wlan is None:
 			# no network support available on this platform
 			self._state = 'no_network'
 			return False
 
-		if not ssid:
+		if not self.networks:
 			self._state = 'no_config'
 			return False
 
-		if blocking:
-			# simple blocking connect with limited retries
+		try:
 			wlan.active(True)
-			for _ in range(6):
-				try:
-					wlan.connect(ssid, password)
-				except Exception:
-					try:
-						wlan.connect((ssid, password))
-					except Exception:
-						pass
-				t0 = time.ticks_ms()
-				while time.ticks_diff(time.ticks_ms(), t0) < 5000:
-					try:
-						if wlan.isconnected():
-							self._state = 'connected'
-							return True
-					except Exception:
-						pass
-					time.sleep(0.5)
+		except Exception:
+			pass
+		self._apply_static_ip(wlan)
+		self._mode = None
+		self._begin(wlan, ticks_ms())
+
+		if blocking:
+			t0 = ticks_ms()
+			while ticks_diff(ticks_ms(), t0) < self.connect_timeout_s * 1000:
+				self.poll(force=True)
+				if self._state == 'connected':
+					return True
+				_sleep_ms(100)
 			self._state = 'failed'
 			return False
+		return True
 
-		# non-blocking: start/advance state
-		self._state = 'connecting'
-		self._last_attempt = time.ticks_ms() # USE TICKS_MS
+	def _on_connected(self, wlan, now):
+		elapsed = ticks_diff(now, self._episode_t0)
+		ssid, bssid, channel = self._target
+		self._state = 'connected'
+		self.stats['connects'] += 1
+		if self._mode == 'fast':
+			self.stats['fast_hits'] += 1
+		entry = {'kind': self._mode, 'ssid': ssid, 'ms': elapsed, 'attempts': self._attempt,
+		         'static': bool(self.static_ip)}
+		self.history.append(entry)
+		if len(self.history) > HISTORY_SIZE:
+			self.history.pop(0)
+		log.info('wifi: connected to %s (%s) in %d ms after %d attempt(s)', ssid, self._mode, elapsed, self._attempt)
 		self._attempt = 0
+		self._queue = []
+		if self.fast_reconnect:
+			if bssid is not None:
+				self._save_cache(ssid, bssid, channel)
+			else:
+				self._learn_ap(wlan, ssid)
+		# the join resets the radio's power mode; restore the wanted one
+		self._pm = None
+		self._set_pm(self.pm_active if self._busy else self.pm_idle)
+
+	def _current_rssi(self, wlan):
 		try:
-				wlan.active(True)
-				wlan.connect(ssid, password)
+			return wlan.status('rssi')
 		except Exception:
-				try:
-					wlan.connect((ssid, password))
-				except Exception:
-					self._state = 'failed'
+			pass
+		bssid = self._target[1] if self._target else None
+		for ap in self._scan or ():
+			if ap[1] == bssid:
+				return ap[3]
+		return None
+
+	def _maybe_migrate(self, wlan, now):
+		"""Between requests, move to a clearly better AP when the measured
+		throughput on the current one is poor. Returns True if it left."""
+		if self._busy or ticks_diff(now, self._idle_since) < self.migrate_idle_ms:
+			return False
+		if self._last_migrate is not None and ticks_diff(now, self._last_migrate) < self.migrate_cooldown_ms:
+			return False
+		self._migrate_pending = False
+		self._last_migrate = now
+		rate = self.throughput
+		self.throughput = None
+		aps = self.ranked()
+		ssid, bssid = self._target[0], self._target[1]
+		rssi = self._current_rssi(wlan)
+		if not aps or rssi is None:
+			return False
+		best = aps[0]
+		gain = self._score(best[0], best[3]) - self._score(ssid, rssi)
+		if best[1] == bssid or gain < self.migrate_margin_db:
+			log.info('wifi: %.1f kB/s on %s, no better AP (best +%d dB)', rate, ssid, gain)
+			return False
+		log.info('wifi: %.1f kB/s on %s, moving to %s ch %s (+%d dB)', rate, ssid, best[0], best[2], gain)
+		self.stats['migrations'] += 1
+		try:
+			wlan.disconnect()
+		except Exception:
+			pass
+		self._mode = 'migrate'
+		self._begin(wlan, now, [(ap[0], ap[1], ap[2]) for ap in aps if ap[1] != bssid])
 		return True
 
-	def poll(self):
-			"""Call regularly from the main loop to advance non-blocking connect."""
-			wlan = self._ensure_iface()
-			if wlan is None:
-					return
+	def poll(self, force=False):
+		"""Advance the connect state machine. Cheap enough to call on every
+		main-loop pass; runs at most every poll_ms unless force is set."""
+		now = ticks_ms()
+		if not force and self._last_poll is not None and ticks_diff(now, self._last_poll) < self.poll_ms:
+			return
+		self._last_poll = now
+		wlan = self._ensure_iface()
+		if wlan is None or self._state in ('idle', 'no_network', 'no_config'):
+			return
 
-			# If already connected, nothing to do.
-			if self._state == 'connected':
-					return
+		try:
+			up = wlan.isconnected()
+		except Exception:
+			up = False
+		if up:
+			if self._state != 'connected':
+				self._on_connected(wlan, now)
+			elif self._migrate_pending and self._maybe_migrate(wlan, now):
+				pass
+			elif not self._busy and self._pm != self.pm_idle \
+					and ticks_diff(now, self._idle_since) >= self.pm_idle_after_ms:
+				self._set_pm(self.pm_idle)
+			return
 
-			# Check real status first. If it's connected, update state and we're done.
-			try:
-					if wlan.isconnected():
-							print("WifiManager.poll(): isconnected() is true, updating state.")
-							self._state = 'connected'
-							return
-			except Exception as e:
-					print(f"WifiManager.poll(): isconnected() check failed: {e}")
-
-
-			# If we are still trying to connect, check backoff timer to retry
-			now = time.ticks_ms()
-			backoff_seconds = min(60, (2 ** self._attempt))
-			if time.ticks_diff(now, self._last_attempt) >= (backoff_seconds * 1000):
-					print(f"WifiManager.poll(): Backoff timer expired, retrying connect (attempt {self._attempt})...")
-					try:
-							ssid = (self.wifi_cfg or {}).get('ssid')
-							password = (self.wifi_cfg or {}).get('password')
-							wlan.connect(ssid, password)
-					except Exception as e:
-							print(f"WifiManager.poll(): connect call failed: {e}")
-					self._attempt += 1
-					self._last_attempt = now
+		if self._state == 'connected':
+			# Link dropped: re-join straight away, via the cached BSSID first
+			self.stats['drops'] += 1
+			log.warn('wifi: link lost, reconnecting')
+			self._mode = None
+			self._begin(wlan, now)
+			return
 
-	def is_connected(self):
-			wlan = self._ensure_iface()
-			if wlan is None:
-					return False
+		try:
+			status = wlan.status()
+		except Exception:
+			status = None
+		failed = isinstance(status, int) and status < 0
+		since = ticks_diff(now, self._last_attempt)
+
+		if self._mode == 'fast' and (failed or since >= self.fast_timeout_ms):
+			# Stale cache (AP moved channel or was replaced): fall back to the
+			# ranked or full join now, and relearn on success
+			self.stats['fast_misses'] += 1
+			log.info('wifi: fast join missed (status %s)', status)
+			self._drop_cache()
 			try:
-					# Always return the real-time status from the interface
-					return wlan.isconnected()
+				wlan.disconnect()
 			except Exception:
-					return False
+				pass
+			self._start_attempt(wlan, now)
+			return
+
+		if failed:
+			if not self._queue:
+				# every candidate failed this round: back off before the next
+				backoff_ms = min(self.backoff_max_s, 2 ** (self._round - 1)) * 1000
+				if since < backoff_ms:
+					return
+			self.stats['failures'] += 1
+		elif since < self.attempt_timeout_ms:
+			# still associating / waiting for an address
+			return
+		log.info('wifi: retrying connect (attempt %d, status %s)', self._attempt, status)
+		try:
+			wlan.disconnect()
+		except Exception:
+			pass
+		self._start_attempt(wlan, now)
+
+	def is_connected(self):
+		wlan = self._ensure_iface()
+		if wlan is None:
+			return False
+		try:
+			# Always return the real-time status from the interface
+			return wlan.isconnected()
+		except Exception:
+			return False
 
 	def status(self):
-			# To ensure status is always fresh, check the real interface status.
-			# This prevents the app from seeing a stale 'connecting' state.
-			if self.is_connected():
-					self._state = 'connected'
-			return self._state
+		# To ensure status is always fresh, check the real interface status.
+		# This prevents the app from seeing a stale 'connecting' state. The
+		# state itself only changes in poll(), which records the connect.
+		if self.is_connected():
+			return 'connected'
+		return self._state
+
+	def metrics(self):
+		"""Connect counters, throughput average and the last HISTORY_SIZE
+		connects."""
+		out = dict(self.stats)
+		out['state'] = self._state
+		out['ssid'] = self._target[0] if self._target else None
+		out['pm'] = self._pm
+		out['throughput_kBps'] = self.throughput
+		out['history'] = list(self.history)
+		return out
@@ -0,0 +1,14 @@
+"""Reference Automatic1111 -> RGB565 passthrough for the Person Clicker.
+
+Implements the service described in
+flask_fastAPI_automatic1111_passthrough_for_Pico.md with the standard
+library's asyncio (plus Pillow for PNG decoding), so device changes can be
+tested end to end and the server path load-tested from this repo:
+
+    python -m passthrough --upstream-url http://a1111-host:7860
+"""
+from .config import Settings
+from .server import PassthroughServer
+from .upstream import A1111Upstream, load_upstream
+
+__all__ = ['A1111Upstream', 'PassthroughServer', 'Settings', 'load_upstream']
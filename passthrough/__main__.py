@@ -0,0 +1,61 @@
+"""Run the passthrough: python -m passthrough [--host H] [--port P] [--upstream-url URL]
+
+Settings come from the environment / .env (see passthrough/config.py);
+the flags override them.
+"""
+import argparse
+import asyncio
+import logging
+import signal
+
+from .config import Settings
+from .server import PassthroughServer
+
+
+async def serve(server):
+    """Serve until Ctrl-C or SIGTERM, then close the server so upstream
+    connections, conversion workers and their shared memory are released."""
+    task = asyncio.current_task()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+    except NotImplementedError:  # Windows
+        pass
+    try:
+        await server.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await server.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Automatic1111 -> RGB565 passthrough for the Pico')
+    ap.add_argument('--host')
+    ap.add_argument('--port', type=int)
+    ap.add_argument('--upstream-url', help='A1111 base URL (A1111_BASE_URL)')
+    ap.add_argument('--upstream', help='module:factory of a custom upstream (UPSTREAM)')
+    ap.add_argument('--env', default='.env', help='dotenv file to read (default .env)')
+    ap.add_argument('-v', '--verbose', action='store_true')
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    settings = Settings.from_env(dotenv=args.env)
+    if args.host:
+        settings.service_host = args.host
+    if args.port is not None:
+        settings.service_port = args.port
+    if args.upstream_url:
+        settings.a1111_base_url = args.upstream_url
+    if args.upstream:
+        settings.upstream = args.upstream
+
+    server = PassthroughServer(settings)
+    try:
+        asyncio.run(serve(server))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
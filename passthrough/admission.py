@@ -0,0 +1,143 @@
+"""Admission control: a bounded priority queue in front of generation.
+
+At most MAX_WORKERS generations run at once and up to QUEUE_SIZE more wait
+for a slot, most urgent first: X-Priority (lower is sooner) counts as
+PRIORITY_STEP_S of waiting per level, so a background request is served
+after interactive ones that arrived up to a few seconds later, but is not
+starved by a steady stream of them.
+
+A request that finds the queue full is refused at once with 503,
+X-Queue-Position (where it would have stood) and a Retry-After estimated
+from recent generation times, so a device backs off and comes back instead
+of holding a socket until its timeout. A full queue lets a more urgent
+request displace the least urgent waiter, which gets the 503 instead. With
+QUEUE_MAX_WAIT_S set, a request whose estimated wait is longer is refused
+up front too.
+
+Under overload every request is then either started within a bounded wait
+(about QUEUE_SIZE / MAX_WORKERS generation times) or told when to retry,
+rather than all of them slowing down together until they time out.
+
+Only requests that start a generation take a slot: cache hits and requests
+joining an in-flight generation pass straight through.
+"""
+import asyncio
+import bisect
+import contextlib
+import itertools
+import math
+import time
+
+from .httpio import HTTPError
+
+# X-Priority values the device sends
+PRIORITY_RETRY = 0         # coming back after a 503: it has waited already
+PRIORITY_INTERACTIVE = 1   # a button press (the default)
+PRIORITY_BACKGROUND = 2    # boot prefetch and other speculative work
+MAX_PRIORITY = 9
+# Head start per priority level when ordering the queue
+PRIORITY_STEP_S = 3.0
+
+# Generation time assumed until one has been measured
+DEFAULT_SERVICE_S = 5.0
+EWMA_ALPHA = 0.2
+MAX_RETRY_AFTER_S = 120
+
+
+def request_priority(headers):
+    """X-Priority as an int in 0..MAX_PRIORITY; interactive when absent or bad."""
+    try:
+        return min(MAX_PRIORITY, max(0, int(headers.get('x-priority', PRIORITY_INTERACTIVE))))
+    except ValueError:
+        return PRIORITY_INTERACTIVE
+
+
+class Admission:
+    def __init__(self, max_workers=4, queue_size=10, max_wait_s=0.0):
+        self.max_workers = max(1, max_workers)
+        self.queue_size = max(0, queue_size)
+        self.max_wait = max_wait_s
+        self.running = 0
+        # EWMA of how long a slot is held by a successful generation
+        self.service_s = None
+        # sorted (arrival + priority * PRIORITY_STEP_S, seq, future); seq
+        # keeps futures out of comparisons
+        self._waiting = []
+        self._seq = itertools.count()
+        self.stats = {'admitted': 0, 'queued': 0, 'shed': 0, 'displaced': 0}
+
+    def estimate(self, position):
+        """Seconds until the request at queue position (1 = next) starts."""
+        per = self.service_s if self.service_s is not None else DEFAULT_SERVICE_S
+        return math.ceil(position / self.max_workers) * per
+
+    def _overloaded(self, position, reason):
+        self.stats['shed'] += 1
+        retry = min(MAX_RETRY_AFTER_S, max(1, math.ceil(self.estimate(position))))
+        return HTTPError(503, 'overloaded ({}), retry in {} s'.format(reason, retry),
+                         {'Retry-After': str(retry), 'X-Queue-Position': str(position)})
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority=PRIORITY_INTERACTIVE):
+        """Hold one of the MAX_WORKERS slots for the body of the with block;
+        raises HTTPError 503 when the request is shed."""
+        await self._acquire(priority)
+        t0 = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self._release(time.monotonic() - t0 if ok else None)
+
+    async def _acquire(self, priority):
+        if self.running < self.max_workers and not self._waiting:
+            self.running += 1
+            self.stats['admitted'] += 1
+            return
+        rank = (time.monotonic() + priority * PRIORITY_STEP_S, next(self._seq))
+        if len(self._waiting) >= self.queue_size:
+            worst = self._waiting[-1] if self._waiting else None
+            if worst is None or worst[0] <= rank[0]:
+                raise self._overloaded(bisect.bisect(self._waiting, rank) + 1, 'queue full')
+            self._waiting.pop()
+            self.stats['displaced'] += 1
+            worst[2].set_exception(self._overloaded(len(self._waiting) + 1, 'displaced by a more urgent request'))
+        position = bisect.bisect(self._waiting, rank) + 1
+        if self.max_wait and self.estimate(position) > self.max_wait:
+            raise self._overloaded(position, 'estimated wait over {:.0f} s'.format(self.max_wait))
+        item = rank + (asyncio.get_running_loop().create_future(),)
+        self._waiting.insert(position - 1, item)
+        self.stats['queued'] += 1
+        try:
+            await item[2]
+        except asyncio.CancelledError:
+            # the client left: give up the place, or the slot if it was
+            # handed over in the same step
+            if item in self._waiting:
+                self._waiting.remove(item)
+            elif item[2].done() and not item[2].cancelled() and item[2].exception() is None:
+                self._release(None)
+            raise
+
+    def _release(self, elapsed):
+        if elapsed is not None:
+            self.service_s = elapsed if self.service_s is None else \
+                self.service_s + EWMA_ALPHA * (elapsed - self.service_s)
+        while self._waiting:
+            fut = self._waiting.pop(0)[2]
+            if not fut.done():
+                # the slot passes straight to the next waiter
+                fut.set_result(None)
+                self.stats['admitted'] += 1
+                return
+        self.running -= 1
+
+    def info(self):
+        out = dict(self.stats)
+        out.update({
+            'max_workers': self.max_workers, 'queue_size': self.queue_size, 'running': self.running,
+            'waiting': len(self._waiting),
+            'service_ms': round(self.service_s * 1000) if self.service_s is not None else None,
+        })
+        return out
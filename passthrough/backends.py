@@ -0,0 +1,279 @@
+"""Several A1111 boxes used as one upstream.
+
+A1111_BACKENDS=http://gpu1:7860*2,http://gpu2:7860 (an optional *weight per
+URL) replaces the single A1111_BASE_URL with a BackendPool:
+
+- routing: least outstanding requests per unit of weight, ties to the
+  lower latency EWMA
+- health: every BACKEND_PROBE_INTERVAL_S each backend gets a cheap GET
+  (BACKEND_PROBE_PATH); one that fails stops receiving traffic, and one
+  that (re)joins first gets a tiny warm-up generation so the model is
+  loaded before real requests land on it (BACKEND_WARMUP)
+- ejection: BACKEND_EJECT_FAILURES consecutive failures, or a latency
+  EWMA above BACKEND_SLOW_FACTOR times the median of the others, takes a
+  backend out for BACKEND_EJECT_S (doubling on repeat ejections); it comes
+  back through the probe and warm-up. The last routable backend is never
+  ejected. With BACKEND_PROBE_INTERVAL_S=0 there is no probe, so an
+  ejected backend is simply routable again once its time is up.
+- failover: a request that fails on one backend is retried once on another
+- hedging (HEDGE=true): when a request has run longer than its backend's
+  p95, a duplicate goes to the next-best backend and the first success
+  wins (the other is cancelled); HEDGE_MAX_RATIO caps the extra load.
+
+Backends are A1111Upstream instances, each with its own connection pool, so
+the pool batches when they all do.
+"""
+import asyncio
+import dataclasses
+import logging
+import statistics
+import time
+from collections import deque
+
+from .httpio import HTTPError
+from .upstream import A1111Upstream
+
+log = logging.getLogger('passthrough.backends')
+
+WARMUP_PAYLOAD = {'prompt': 'warm-up', 'seed': 1, 'steps': 1, 'width': 64, 'height': 64}
+PROBE_TIMEOUT_S = 5.0
+# Latency samples a backend needs before its p95 / EWMA are trusted
+MIN_SAMPLES = 8
+EWMA_ALPHA = 0.3
+MAX_EJECT_DOUBLINGS = 4
+
+
+def parse_backends(spec):
+    """[(url, weight)] from "url[*weight],url[*weight],..."."""
+    out = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        url, _, weight = part.partition('*')
+        out.append((url.strip(), float(weight) if weight else 1.0))
+    return out
+
+
+class Backend:
+    def __init__(self, url, weight, upstream, up):
+        self.url = url
+        self.weight = weight
+        self.upstream = upstream
+        # up: routable; new/down/ejected: only when nothing is up; warming
+        self.state = 'up' if up else 'new'
+        self.outstanding = 0
+        self.latencies = deque(maxlen=64)
+        self.ewma = None
+        self.fails = 0
+        self.ejections = 0
+        self.ejected_at = None
+        self.eject_s = 0.0
+        self.stats = {'requests': 0, 'errors': 0, 'hedges': 0, 'hedge_wins': 0}
+
+    def score(self):
+        return (self.outstanding + 1) / self.weight, self.ewma or 0.0
+
+    def p95(self):
+        if len(self.latencies) < MIN_SAMPLES:
+            return None
+        vals = sorted(self.latencies)
+        return vals[min(len(vals) - 1, int(len(vals) * 0.95))]
+
+    def reset_latency(self):
+        self.latencies.clear()
+        self.ewma = None
+
+    def info(self):
+        p95 = self.p95()
+        out = {'url': self.url, 'weight': self.weight, 'state': self.state, 'outstanding': self.outstanding,
+               'ewma_ms': round(self.ewma * 1000) if self.ewma is not None else None,
+               'p95_ms': round(p95 * 1000) if p95 is not None else None, 'ejections': self.ejections}
+        out.update(self.stats)
+        return out
+
+
+class BackendPool:
+    def __init__(self, settings):
+        self.settings = settings
+        probing = settings.backend_probe_interval_s > 0
+        self.backends = [
+            Backend(url, weight, A1111Upstream(dataclasses.replace(settings, a1111_base_url=url)), not probing)
+            for url, weight in parse_backends(settings.a1111_backends)]
+        if not self.backends:
+            raise ValueError('A1111_BACKENDS lists no backends')
+        self.supports_batch = all(b.upstream.supports_batch for b in self.backends)
+        self.stats = {'requests': 0, 'failovers': 0, 'hedges': 0, 'hedge_wins': 0}
+        self._probe_task = None
+
+    async def start(self):
+        if self.settings.backend_probe_interval_s > 0 and self._probe_task is None:
+            self._probe_task = asyncio.ensure_future(self._probe_loop())
+
+    async def close(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+        for b in self.backends:
+            await b.upstream.close()
+
+    # -- health ---------------------------------------------------------
+
+    async def _probe_loop(self):
+        while True:
+            results = await asyncio.gather(*(self._check(b) for b in self.backends), return_exceptions=True)
+            for b, result in zip(self.backends, results):
+                if isinstance(result, Exception):
+                    # _check handles its own failures; anything here is a bug,
+                    # but must not stop the probes for every backend
+                    log.error('health check of backend %s failed', b.url, exc_info=result)
+            await asyncio.sleep(self.settings.backend_probe_interval_s)
+
+    async def _check(self, b):
+        if b.state == 'warming':
+            return
+        if b.state == 'ejected' and time.monotonic() - b.ejected_at < b.eject_s:
+            return
+        try:
+            status, _, _ = await asyncio.wait_for(
+                b.upstream.pool.request('GET', self.settings.backend_probe_path), PROBE_TIMEOUT_S)
+            ok = status == 200
+        except Exception:
+            # refused, timed out, or an answer that is not HTTP (bad status
+            # line, oversized headers, HTTPError from the body reader)
+            ok = False
+        if not ok:
+            if b.state != 'down':
+                log.warning('backend %s failed its health probe', b.url)
+            b.state = 'down'
+            return
+        if b.state == 'up':
+            return
+        if self.settings.backend_warmup:
+            b.state = 'warming'
+            try:
+                await b.upstream.txt2img(WARMUP_PAYLOAD)
+            except Exception as e:
+                log.warning('backend %s failed warm-up: %s', b.url, e)
+                b.state = 'down'
+                return
+        log.info('backend %s is up', b.url)
+        b.reset_latency()
+        b.fails = 0
+        b.state = 'up'
+
+    def _eject(self, b, reason):
+        if b.state != 'up' or not any(o.state == 'up' for o in self.backends if o is not b):
+            return
+        b.ejections += 1
+        b.eject_s = self.settings.backend_eject_s * 2 ** min(b.ejections - 1, MAX_EJECT_DOUBLINGS)
+        b.ejected_at = time.monotonic()
+        b.state = 'ejected'
+        log.warning('ejecting backend %s for %.0f s: %s', b.url, b.eject_s, reason)
+
+    def _succeeded(self, b, dt):
+        b.fails = 0
+        b.latencies.append(dt)
+        b.ewma = dt if b.ewma is None else b.ewma + EWMA_ALPHA * (dt - b.ewma)
+        others = [o.ewma for o in self.backends if o is not b and o.state == 'up' and o.ewma is not None]
+        if len(b.latencies) >= MIN_SAMPLES and others:
+            median = statistics.median(others)
+            if b.ewma > self.settings.backend_slow_factor * median:
+                self._eject(b, 'slow ({:.0f} ms vs {:.0f} ms)'.format(b.ewma * 1000, median * 1000))
+
+    def _failed(self, b, error):
+        b.fails += 1
+        b.stats['errors'] += 1
+        if b.fails >= self.settings.backend_eject_failures:
+            self._eject(b, '{} consecutive failures, last: {}'.format(b.fails, error))
+
+    # -- routing --------------------------------------------------------
+
+    def _readmit(self):
+        """Without probes, nothing brings an ejected backend back: return
+        it to rotation once its ejection time is up."""
+        now = time.monotonic()
+        for b in self.backends:
+            if b.state == 'ejected' and now - b.ejected_at >= b.eject_s:
+                log.info('backend %s is back after %.0f s', b.url, b.eject_s)
+                b.reset_latency()
+                b.fails = 0
+                b.state = 'up'
+
+    def _pick(self, exclude=()):
+        """Least outstanding per weight among up backends; failing that,
+        anything not excluded (better than refusing outright)."""
+        pool = [b for b in self.backends if b not in exclude]
+        up = [b for b in pool if b.state == 'up']
+        return min(up or pool, key=Backend.score, default=None)
+
+    async def _call(self, b, method, arg):
+        b.outstanding += 1
+        b.stats['requests'] += 1
+        t0 = time.monotonic()
+        try:
+            result = await getattr(b.upstream, method)(arg)
+        except HTTPError as e:
+            self._failed(b, e.message)
+            raise
+        finally:
+            b.outstanding -= 1
+        self._succeeded(b, time.monotonic() - t0)
+        return result
+
+    def _hedge_delay(self, b):
+        if not self.settings.hedge:
+            return None
+        if self.stats['hedges'] + 1 > self.settings.hedge_max_ratio * self.stats['requests']:
+            return None
+        return b.p95()
+
+    async def _hedged(self, primary, method, arg):
+        first = asyncio.ensure_future(self._call(primary, method, arg))
+        pending = {first}
+        try:
+            delay = self._hedge_delay(primary)
+            if delay is not None:
+                done, pending = await asyncio.wait(pending, timeout=delay)
+                second = None if done else self._pick(exclude=(primary,))
+                if second is not None:
+                    self.stats['hedges'] += 1
+                    second.stats['hedges'] += 1
+                    pending.add(asyncio.ensure_future(self._call(second, method, arg)))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.stats['hedge_wins'] += 1
+                            second.stats['hedge_wins'] += 1
+                        return task.result()
+            # every attempt failed: report the primary's error
+            return first.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _dispatch(self, method, arg):
+        self.stats['requests'] += 1
+        if self.settings.backend_probe_interval_s <= 0:
+            self._readmit()
+        primary = self._pick()
+        try:
+            return await self._hedged(primary, method, arg)
+        except HTTPError:
+            other = self._pick(exclude=(primary,))
+            if other is None:
+                raise
+            self.stats['failovers'] += 1
+            return await self._call(other, method, arg)
+
+    async def txt2img(self, payload):
+        return await self._dispatch('txt2img', payload)
+
+    async def txt2img_batch(self, payloads):
+        return await self._dispatch('txt2img_batch', payloads)
+
+    def info(self):
+        out = dict(self.stats)
+        out['backends'] = [b.info() for b in self.backends]
+        return out
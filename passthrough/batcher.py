@@ -0,0 +1,82 @@
+"""Micro-batching: collect compatible generations into one upstream batch.
+
+A1111 generates a batch of N in much less than N times one image, but
+every device press arrives as its own request. MicroBatcher holds each
+request for at most window_ms, grouping requests whose payloads match in
+everything but prompt and seed (steps, cfg_scale, sampler, size, model
+overrides, ...). A group is sent as one upstream batch when the window of
+its first request expires or when it reaches max_batch, and each waiter gets
+its own image back. The window bounds the latency batching adds: a request
+never waits longer than window_ms before its batch starts.
+
+A waiter that leaves before its group is sent drops out of the batch; once
+the batch is running it completes for the others.
+"""
+import asyncio
+import json
+
+
+def compat_key(payload):
+    """Payloads with equal keys can share a batch."""
+    rest = {k: v for k, v in payload.items() if k not in ('prompt', 'seed')}
+    return json.dumps(rest, sort_keys=True, separators=(',', ':'))
+
+
+class _Group:
+    __slots__ = ('items', 'timer')
+
+    def __init__(self):
+        self.items = []
+        self.timer = None
+
+
+class MicroBatcher:
+    def __init__(self, run_batch, window_ms=50, max_batch=4):
+        """run_batch(payloads) is a coroutine returning one result per payload."""
+        self.run_batch = run_batch
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._open = {}
+        self.stats = {'batches': 0, 'items': 0, 'dropped': 0, 'largest': 0}
+
+    async def submit(self, payload):
+        key = compat_key(payload)
+        group = self._open.get(key)
+        if group is None:
+            group = self._open[key] = _Group()
+            group.timer = asyncio.get_running_loop().call_later(self.window, self._flush, key, group)
+        fut = asyncio.get_running_loop().create_future()
+        group.items.append((payload, fut))
+        if len(group.items) >= self.max_batch:
+            self._flush(key, group)
+        return await fut
+
+    def _flush(self, key, group):
+        if self._open.get(key) is group:
+            del self._open[key]
+        group.timer.cancel()
+        items = [(p, f) for p, f in group.items if not f.done()]
+        self.stats['dropped'] += len(group.items) - len(items)
+        if items:
+            asyncio.ensure_future(self._run(items))
+
+    async def _run(self, items):
+        self.stats['batches'] += 1
+        self.stats['items'] += len(items)
+        self.stats['largest'] = max(self.stats['largest'], len(items))
+        try:
+            results = await self.run_batch([p for p, _ in items])
+        except Exception as e:
+            for _, fut in items:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), result in zip(items, results):
+            if not fut.done():
+                fut.set_result(result)
+
+    def info(self):
+        out = dict(self.stats)
+        out['mean_batch'] = round(out['items'] / out['batches'], 2) if out['batches'] else None
+        out['open_groups'] = len(self._open)
+        return out
@@ -0,0 +1,82 @@
+"""Overload the passthrough with and without admission control.
+
+    python -m passthrough.bench_admission [--devices 24] [--presses 6] [--latency fixed:500]
+
+Runs an in-process passthrough on the mock upstream (one GPU, caches and
+single-flight off) and drives it with more simulated devices than the
+GPU can serve within the device timeout (--timeout, like the device's
+api_timeout_seconds). Without admission control every request queues
+behind the GPU until most of them time out; with it (MAX_WORKERS=--workers,
+QUEUE_SIZE=--queue) the overflow gets 503 + Retry-After, which the devices
+honour as micropython/app.py does. The report compares completed frames,
+timeouts, 503 retries, press-to-frame latency and GPU work spent on
+requests whose device had already given up.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from .config import Settings
+from .loadgen import MICROPYTHON, Device, Target, make_trace, summarize
+from .mock_a1111 import MockGPU, MockUpstream
+from .server import PassthroughServer
+
+
+async def _run(workers, args):
+    cfg = json.loads((MICROPYTHON / 'config.json').read_text())
+    categories = json.loads((MICROPYTHON / 'demographics.json').read_text())['categories']
+    rnd = random.Random(args.seed)
+    gpu = MockGPU(latency=args.latency, seed=args.seed)
+    settings = Settings(cache_mem_mb=0, image_cache_mb=0, singleflight=False, max_workers=workers,
+                        queue_size=args.queue)
+    server = PassthroughServer(settings, upstream=MockUpstream(gpu))
+    await server.start('127.0.0.1', 0)
+    target = Target('http://127.0.0.1:{}'.format(server.port), timeout=args.timeout)
+    devices = [Device(i, make_trace(rnd, args.presses, args.think_ms, 0.0), cfg, categories, target,
+                      random.Random(rnd.getrandbits(64)))
+               for i in range(args.devices)]
+    results = []
+    start = time.monotonic()
+    try:
+        await asyncio.gather(*(d.run(float('inf'), results) for d in devices))
+    finally:
+        elapsed = time.monotonic() - start
+        await server.close()
+    return summarize(results, elapsed), gpu.stats['requests'], server.stats['abandoned']
+
+
+def _row(name, s, generations, abandoned):
+    press = s['press_ms']
+    print('{:>10} {:>9} {:>6} {:>8} {:>8} {:>9} {:>9} {:>9} {:>11} {:>9}'.format(
+        name, s['requests'], s['ok'], s['errors'].get('timeout', 0), s['busy_retries'],
+        '-' if press['p50'] is None else '{:.0f}'.format(press['p50']),
+        '-' if press['p95'] is None else '{:.0f}'.format(press['p95']),
+        '-' if press['max'] is None else '{:.0f}'.format(press['max']), generations, abandoned))
+
+
+async def run(args):
+    print('{} devices x {} presses (think {:.0f} ms), latency {}, one GPU, device timeout {:.0f} s'.format(
+        args.devices, args.presses, args.think_ms, args.latency, args.timeout))
+    print('{:>10} {:>9} {:>6} {:>8} {:>8} {:>9} {:>9} {:>9} {:>11} {:>9}'.format(
+        'admission', 'presses', 'ok', 'timeout', '503s', 'p50 ms', 'p95 ms', 'max ms', 'generations', 'abandoned'))
+    for workers in (0, args.workers):
+        _row('off' if not workers else 'on', *await _run(workers, args))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--devices', type=int, default=24)
+    ap.add_argument('--presses', type=int, default=6, help='presses per device')
+    ap.add_argument('--think-ms', type=float, default=1000, help='median think time between presses')
+    ap.add_argument('--latency', default='fixed:500', help='mock generation latency (ms)')
+    ap.add_argument('--timeout', type=float, default=8.0, help='device request timeout (s)')
+    ap.add_argument('--workers', type=int, default=1, help='MAX_WORKERS for the admission run')
+    ap.add_argument('--queue', type=int, default=8, help='QUEUE_SIZE for the admission run')
+    ap.add_argument('--seed', type=int, default=1)
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
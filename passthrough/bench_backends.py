@@ -0,0 +1,90 @@
+"""Exercise the multi-backend scheduler against several mock A1111s.
+
+    python -m passthrough.bench_backends [--devices 8] [--requests 10]
+
+Starts three mock A1111 servers on localhost:
+
+    steady   lognormal:300,0.2
+    tail     lognormal:300,0.9    (same median, heavy tail)
+    flaky    lognormal:300,0.2 with 60% injected errors
+
+and a passthrough with A1111_BACKENDS pointing at all three (cache and
+single-flight off), then drives it with closed-loop devices twice: without
+and with hedging. Reports latency percentiles, errors, and per-backend
+requests, errors, state and ejections: the flaky box should be ejected,
+failed requests should fail over, and hedging should cut the tail.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from .config import Settings
+from .loadgen import Target, percentile
+from .mock_a1111 import MockA1111Server, MockGPU
+from .server import PassthroughServer
+
+BACKENDS = (
+    ('steady', dict(latency='lognormal:300,0.2')),
+    ('tail', dict(latency='lognormal:300,0.9')),
+    ('flaky', dict(latency='lognormal:300,0.2', fail_rate=0.6, fail_modes=('error',))),
+)
+
+
+async def _run(hedge, args):
+    mocks = []
+    for i, (name, kw) in enumerate(BACKENDS):
+        mock = MockA1111Server(MockGPU(concurrency=2, seed=args.seed + i, **kw))
+        await mock.start('127.0.0.1', 0)
+        mocks.append((name, mock))
+    names = {'http://127.0.0.1:{}'.format(m.port): name for name, m in mocks}
+    settings = Settings(a1111_backends=','.join(names), cache_mem_mb=0, image_cache_mb=0, singleflight=False,
+                        backend_probe_interval_s=1.0, backend_eject_s=5.0, hedge=hedge, hedge_max_ratio=0.2)
+    server = PassthroughServer(settings)
+    await server.start('127.0.0.1', 0)
+    await asyncio.sleep(1.0)  # first probe round and warm-up
+    target = Target('http://127.0.0.1:{}'.format(server.port), timeout=60)
+    rnd = random.Random(args.seed)
+
+    async def device(n):
+        return [await target.send({'prompt': 'device {}'.format(n), 'seed': rnd.getrandbits(31), 'steps': 5,
+                                   'width': 256, 'height': 256}) for _ in range(args.requests)]
+
+    start = time.monotonic()
+    try:
+        results = [r for rs in await asyncio.gather(*(device(n) for n in range(args.devices))) for r in rs]
+        elapsed = time.monotonic() - start
+        pool = server.upstream.info()
+    finally:
+        await server.close()
+        for _, m in mocks:
+            await m.close()
+    return results, elapsed, pool, names
+
+
+def _report(hedge, results, elapsed, pool, names):
+    ok = sorted(r['total'] * 1000 for r in results if not r['error'])
+    print('hedging {}: {}/{} ok in {:.1f} s, p50 {:.0f} ms, p95 {:.0f} ms, p99 {:.0f} ms, max {:.0f} ms; '
+          'failovers {}, hedges {} (won {})'.format(
+              'on' if hedge else 'off', len(ok), len(results), elapsed, percentile(ok, 50), percentile(ok, 95),
+              percentile(ok, 99), ok[-1], pool['failovers'], pool['hedges'], pool['hedge_wins']))
+    for b in pool['backends']:
+        print('    {:>7}: {:>3} requests, {:>3} errors, state {:<8} ejections {}, p95 {} ms'.format(
+            names[b['url']], b['requests'], b['errors'], b['state'], b['ejections'], b['p95_ms']))
+
+
+async def run(args):
+    for hedge in (False, True):
+        _report(hedge, *await _run(hedge, args))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--devices', type=int, default=8)
+    ap.add_argument('--requests', type=int, default=10, help='requests per device')
+    ap.add_argument('--seed', type=int, default=1)
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Measure micro-batching throughput against the mock upstream.
+
+    python -m passthrough.bench_batch [--devices 8] [--requests 5] [--window-ms 0 50 150]
+
+Runs an in-process passthrough on the mock (one GPU; a batch of N costs
+1 + --batch-cost * (N - 1) single-image latencies) with the caches and
+single-flight off, and drives it with --devices closed-loop clients sending
+distinct seeded device payloads back to back. Each --window-ms value is one
+run (0 = batching off); the report shows frames/s, latency percentiles,
+upstream calls and mean batch size, and checks that every payload got the
+same image as in the unbatched run.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from .config import Settings
+from .loadgen import MICROPYTHON, Target, build_payload, build_prompt, percentile
+from .mock_a1111 import MockGPU, MockUpstream
+from .server import PassthroughServer
+
+
+def make_payloads(args):
+    cfg = json.loads((MICROPYTHON / 'config.json').read_text())
+    categories = json.loads((MICROPYTHON / 'demographics.json').read_text())['categories']
+    rnd = random.Random(args.seed)
+    out = []
+    for _ in range(args.devices):
+        seq = []
+        for _ in range(args.requests):
+            selection = {k: rnd.choice(v['values']) for k, v in categories.items()}
+            seq.append(build_payload(cfg, build_prompt(cfg, selection), rnd.getrandbits(31)))
+        out.append(seq)
+    return out
+
+
+async def _run(window_ms, payloads, args):
+    gpu = MockGPU(latency=args.latency, seed=args.seed, batch_cost=args.batch_cost)
+    settings = Settings(cache_mem_mb=0, image_cache_mb=0, singleflight=False, batch_window_ms=window_ms,
+                        batch_max=args.batch_max)
+    server = PassthroughServer(settings, upstream=MockUpstream(gpu))
+    await server.start('127.0.0.1', 0)
+    target = Target('http://127.0.0.1:{}'.format(server.port), timeout=args.timeout)
+
+    async def device(seq):
+        return [(p['seed'], await target.send(p)) for p in seq]
+
+    start = time.monotonic()
+    try:
+        per_device = await asyncio.gather(*(device(seq) for seq in payloads))
+    finally:
+        elapsed = time.monotonic() - start
+        await server.close()
+    batching = server.batcher.info() if server.batcher else None
+    return [r for rs in per_device for r in rs], elapsed, server.stats['upstream_calls'], batching
+
+
+async def run(args):
+    payloads = make_payloads(args)
+    print('{} devices x {} requests, latency {}, batch cost {}, max batch {}'.format(
+        args.devices, args.requests, args.latency, args.batch_cost, args.batch_max))
+    print('{:>10} {:>9} {:>9} {:>9} {:>9} {:>9} {:>10} {:>10}'.format(
+        'window ms', 'frames/s', 'p50 ms', 'p95 ms', 'max ms', 'upstream', 'mean batch', 'identical'))
+    reference = None
+    for window in args.window_ms:
+        results, elapsed, calls, batching = await _run(window, payloads, args)
+        ok = [r for _, r in results if not r['error']]
+        vals = sorted(r['total'] * 1000 for r in ok)
+        crcs = {seed: r['crc32'] for seed, r in results if not r['error']}
+        if reference is None:
+            reference = crcs
+        same = all(reference.get(k) == v for k, v in crcs.items())
+        print('{:>10.0f} {:>9.2f} {:>9.0f} {:>9.0f} {:>9.0f} {:>9} {:>10} {:>10}'.format(
+            window, len(ok) / elapsed, percentile(vals, 50) or 0, percentile(vals, 95) or 0,
+            vals[-1] if vals else 0, calls, batching['mean_batch'] if batching else 1,
+            'yes' if same and len(ok) == len(results) else 'NO'))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--devices', type=int, default=8)
+    ap.add_argument('--requests', type=int, default=5, help='requests per device')
+    ap.add_argument('--window-ms', type=float, nargs='+', default=[0, 50, 150])
+    ap.add_argument('--batch-max', type=int, default=4)
+    ap.add_argument('--batch-cost', type=float, default=0.25, help='mock cost of each extra batch item')
+    ap.add_argument('--latency', default='fixed:500', help='mock single-image latency (ms)')
+    ap.add_argument('--timeout', type=float, default=300.0)
+    ap.add_argument('--seed', type=int, default=1)
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark frame-cache hits against generation.
+
+    python -m passthrough.bench_cache [--n 10] [--latency lognormal:2500,0.35]
+
+Runs an in-process passthrough on the mock upstream (mock_a1111) with a
+temporary disk cache, then sends the same n seeded device payloads three
+times, each on a fresh connection like the device:
+
+    miss       generated by the mock and converted, then cached
+    hit-mem    served from the memory tier
+    hit-disk   a restarted server (empty memory tier, same directory)
+               serving the files with sendfile
+
+and reports p50 / p95 / mean latency per kind, the speedup over
+generation, and checks that every hit is byte-identical to its miss.
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+
+from .config import Settings
+from .loadgen import Target, build_payload, percentile
+from .mock_a1111 import MockGPU, MockUpstream
+from .server import PassthroughServer
+
+
+async def _rounds(settings, gpu, payloads, rounds):
+    """Send payloads `rounds` times to one fresh server; a result list per round."""
+    server = PassthroughServer(settings, upstream=MockUpstream(gpu))
+    await server.start('127.0.0.1', 0)
+    target = Target('http://127.0.0.1:{}'.format(server.port))
+    try:
+        return [[await target.send(p) for p in payloads] for _ in range(rounds)]
+    finally:
+        await server.close()
+
+
+def _row(name, results, base=None):
+    vals = sorted(r['total'] * 1000 for r in results)
+    mean = sum(vals) / len(vals)
+    speedup = '{:>9.0f}x'.format(base / mean) if base else '{:>10}'.format('-')
+    print('{:>9} {:>10.2f} {:>10.2f} {:>10.2f} {}'.format(
+        name, percentile(vals, 50), percentile(vals, 95), mean, speedup))
+    return mean
+
+
+async def run(args):
+    rnd = random.Random(args.seed)
+    cfg = {'prompt_prefix': 'professional portrait photograph of a', 'image_request_size': 512,
+           'generation': {'steps': 5, 'cfg_scale': 1.5, 'sampler_name': 'DPM++ 2M'}}
+    payloads = [build_payload(cfg, '{} person'.format(rnd.choice(['adult', 'elderly', 'young adult'])),
+                              rnd.getrandbits(31)) for _ in range(args.n)]
+    gpu = MockGPU(latency=args.latency, seed=args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        settings = Settings(cache_dir=tmp)
+        miss, mem = await _rounds(settings, gpu, payloads, 2)
+        disk, = await _rounds(settings, gpu, payloads, 1)
+
+    for kind, results in (('miss', miss), ('hit-mem', mem), ('hit-disk', disk)):
+        bad = [r for r in results if r['error'] or r['cache'] != kind]
+        assert not bad, '{}: unexpected results {}'.format(kind, bad[:2])
+    assert [r['crc32'] for r in mem] == [r['crc32'] for r in miss], 'memory hit differs from generated frame'
+    assert [r['crc32'] for r in disk] == [r['crc32'] for r in miss], 'disk hit differs from generated frame'
+
+    print('{} requests per kind, latency {}; all hits byte-identical'.format(args.n, args.latency))
+    print('{:>9} {:>10} {:>10} {:>10} {:>10}'.format('ms', 'p50', 'p95', 'mean', 'speedup'))
+    base = _row('miss', miss)
+    _row('hit-mem', mem, base)
+    _row('hit-disk', disk, base)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--n', type=int, default=10, help='distinct payloads')
+    ap.add_argument('--latency', default='lognormal:2500,0.35', help='mock generation latency (ms)')
+    ap.add_argument('--seed', type=int, default=1)
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
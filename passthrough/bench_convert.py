@@ -0,0 +1,113 @@
+"""Benchmark png_to_rgb565() against the passthrough doc's getpixel loop.
+
+    python -m passthrough.bench_convert [--sizes 240 320 512] [--runs 20]
+
+For each source size a synthetic gradient-plus-noise PNG (so the encoder and
+resampler do real work) is converted to a 240x240 frame. It reports
+per-image time and throughput for the reference converter, the vectorized
+one, and the packing stage alone (NumPy and the translate-table fallback),
+after checking that png_to_rgb565() matches the reference, also for a
+non-square output and source, and that every byteorder / channel order /
+inversion variant is byte-identical to a scalar implementation of the same
+packing. Speedups are
+relative to the reference's whole decode + resize + pack time.
+"""
+import argparse
+import random
+import time
+from io import BytesIO
+
+from PIL import Image
+
+from . import convert
+
+
+def make_png(size, seed=0, height=None):
+    rnd = random.Random(seed)
+    height = height or size
+    img = Image.new('RGB', (size, height))
+    img.putdata([((x * 255) // size ^ rnd.randrange(32), (y * 255) // height, rnd.randrange(256))
+                 for y in range(height) for x in range(size)])
+    buf = BytesIO()
+    img.save(buf, 'PNG')
+    return buf.getvalue()
+
+
+def _scalar(rgb, invert, byteorder, order):
+    out = bytearray()
+    for i in range(0, len(rgb), 3):
+        r, g, b = rgb[i], rgb[i + 1], rgb[i + 2]
+        if invert:
+            r, g, b = 255 - r, 255 - g, 255 - b
+        if order == 'bgr':
+            r, b = b, r
+        out += (((r >> 3) << 11) | ((g >> 2) << 5) | (b >> 3)).to_bytes(2, byteorder)
+    return bytes(out)
+
+
+def check(png, width, height):
+    # the requested output, a wider one, and a portrait source: stretching
+    # must match the reference whatever the aspect ratios
+    tall = make_png(max(8, width // 2), height=max(8, height))
+    for src, w, h in ((png, width, height), (png, width + width // 3, height), (tall, width, height)):
+        for invert in (False, True):
+            ref = convert.png_to_rgb565_reference(src, w, h, invert)
+            assert convert.png_to_rgb565(src, w, h, invert) == ref, \
+                'mismatch vs reference at {}x{}'.format(w, h)
+    decoded = convert.decode_png(tall)
+    assert convert.render_rgb(decoded, width, height, crop=True) != convert.png_to_rgb565(tall, width, height), \
+        'crop=True should differ from stretching when the aspect ratios do'
+    rgb = Image.open(BytesIO(png)).convert('RGB').resize((width, height), Image.LANCZOS).tobytes()
+    for invert in (False, True):
+        for byteorder in convert.BYTEORDERS:
+            for order in convert.CHANNEL_ORDERS:
+                want = _scalar(rgb, invert, byteorder, order)
+                assert convert._pack_lut(rgb, invert, byteorder, order) == want, \
+                    'lut mismatch {} {} {}'.format(invert, byteorder, order)
+                if convert.np is not None:
+                    assert convert._pack_numpy(rgb, invert, byteorder, order) == want, \
+                        'numpy mismatch {} {} {}'.format(invert, byteorder, order)
+
+
+def timeit(fn, runs):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - t0) / runs
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--sizes', type=int, nargs='+', default=[240, 320, 512], help='source PNG sizes')
+    ap.add_argument('--width', type=int, default=240)
+    ap.add_argument('--height', type=int, default=240)
+    ap.add_argument('--runs', type=int, default=20)
+    args = ap.parse_args()
+    w, h = args.width, args.height
+    mpix = w * h / 1e6
+
+    print('numpy:', convert.np.__version__ if convert.np is not None else 'not installed')
+    print('{:>6} {:>22} {:>12} {:>10} {:>12} {:>10}'.format(
+        'src', 'stage', 'ms/image', 'images/s', 'Mpix/s', 'speedup'))
+    for size in args.sizes:
+        png = make_png(size)
+        check(png, w, h)
+        rgb = Image.open(BytesIO(png)).convert('RGB').resize((w, h), Image.LANCZOS).tobytes()
+        rows = [
+            ('reference (getpixel)', lambda: convert.png_to_rgb565_reference(png, w, h)),
+            ('png_to_rgb565', lambda: convert.png_to_rgb565(png, w, h)),
+            ('pack: translate', lambda: convert._pack_lut(rgb, False, 'big', 'rgb')),
+        ]
+        if convert.np is not None:
+            rows.append(('pack: numpy', lambda: convert._pack_numpy(rgb, False, 'big', 'rgb')))
+        base = None
+        for name, fn in rows:
+            t = timeit(fn, max(1, args.runs // 4) if name.startswith('reference') else args.runs)
+            base = base or t
+            print('{:>6} {:>22} {:>12.2f} {:>10.1f} {:>12.1f} {:>9.1f}x'.format(
+                size, name, t * 1000, 1 / t, mpix / t, base / t))
+
+
+if __name__ == '__main__':
+    main()
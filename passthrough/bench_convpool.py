@@ -0,0 +1,105 @@
+"""Compare where conversion runs: in the event loop, a thread, or processes.
+
+    python -m passthrough.bench_convpool [--devices 16] [--requests 6] [--size 512]
+
+Runs an in-process passthrough on the mock upstream once per CONVERT_MODE
+(inline, thread, process). The mock returns --size PNGs (the device asks
+for 512) after a fixed latency, with enough GPU concurrency that
+conversion is the bottleneck. The caches, single-flight and admission
+control are off. --devices closed-loop clients send distinct seeded
+requests while a prober GETs /health every --probe-ms. Probe latency is
+how long the loop leaves other connections waiting. The report gives
+frames/s and txt2img and probe latency percentiles for each mode.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from .config import Settings
+from .loadgen import Target, percentile
+from .mock_a1111 import MockGPU, MockUpstream
+from .server import PassthroughServer
+
+MODES = ('inline', 'thread', 'process')
+
+
+async def _probe(port):
+    t0 = time.monotonic()
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(b'GET /health HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n')
+        await writer.drain()
+        await reader.read()
+    finally:
+        writer.close()
+    return time.monotonic() - t0
+
+
+async def _run(mode, args):
+    gpu = MockGPU(latency=args.latency, concurrency=args.devices, seed=args.seed)
+    settings = Settings(cache_mem_mb=0, image_cache_mb=0, singleflight=False, max_workers=0, convert_mode=mode,
+                        convert_workers=args.workers)
+    server = PassthroughServer(settings, upstream=MockUpstream(gpu))
+    await server.start('127.0.0.1', 0)
+    target = Target('http://127.0.0.1:{}'.format(server.port), timeout=args.timeout)
+    rnd = random.Random(args.seed)
+    probes = []
+    running = True
+
+    async def prober():
+        while running:
+            probes.append(await _probe(server.port))
+            await asyncio.sleep(args.probe_ms / 1000)
+
+    async def device(n):
+        return [await target.send({'prompt': 'device {}'.format(n), 'seed': rnd.getrandbits(31), 'steps': 5,
+                                   'width': args.size, 'height': args.size}) for _ in range(args.requests)]
+
+    probe_task = asyncio.ensure_future(prober())
+    start = time.monotonic()
+    try:
+        results = [r for rs in await asyncio.gather(*(device(n) for n in range(args.devices))) for r in rs]
+        elapsed = time.monotonic() - start
+    finally:
+        running = False
+        await probe_task
+        await server.close()
+    return results, elapsed, probes
+
+
+def _ms(vals, p):
+    v = percentile(vals, p)
+    return '-' if v is None else '{:.0f}'.format(v)
+
+
+async def run(args):
+    print('{} devices x {} requests, {}x{} PNGs, mock latency {}, probe every {:.0f} ms'.format(
+        args.devices, args.requests, args.size, args.size, args.latency, args.probe_ms))
+    print('{:>8} {:>9} {:>7} {:>8} {:>8} {:>8} {:>10} {:>10} {:>10}'.format(
+        'mode', 'frames/s', 'ok', 'p50 ms', 'p95 ms', 'p99 ms', 'probe p50', 'probe p99', 'probe max'))
+    for mode in args.modes:
+        results, elapsed, probes = await _run(mode, args)
+        ok = sorted(r['total'] * 1000 for r in results if not r['error'])
+        probe_ms = sorted(p * 1000 for p in probes)
+        print('{:>8} {:>9.2f} {:>7} {:>8} {:>8} {:>8} {:>10} {:>10} {:>10}'.format(
+            mode, len(ok) / elapsed, '{}/{}'.format(len(ok), len(results)), _ms(ok, 50), _ms(ok, 95), _ms(ok, 99),
+            _ms(probe_ms, 50), _ms(probe_ms, 99), _ms(probe_ms, 100)))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--devices', type=int, default=16)
+    ap.add_argument('--requests', type=int, default=6, help='requests per device')
+    ap.add_argument('--size', type=int, default=512, help='upstream PNG size')
+    ap.add_argument('--latency', default='fixed:300', help='mock generation latency (ms)')
+    ap.add_argument('--workers', type=int, default=0, help='CONVERT_WORKERS for the process run (0: per CPU)')
+    ap.add_argument('--modes', nargs='+', default=list(MODES), choices=MODES)
+    ap.add_argument('--probe-ms', type=float, default=20.0, help='pause between /health probes')
+    ap.add_argument('--timeout', type=float, default=120.0)
+    ap.add_argument('--seed', type=int, default=1)
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
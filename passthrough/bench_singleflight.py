@@ -0,0 +1,85 @@
+"""Load test single-flight deduplication under bursty duplicate traffic.
+
+    python -m passthrough.bench_singleflight [--bursts 5] [--distinct 3] [--dup 4]
+
+Runs an in-process passthrough on the mock upstream (one GPU, caches
+off so only in-flight sharing is measured) and fires bursts: each burst
+sends --distinct seeded payloads, each from --dup simulated devices within
+--jitter-ms of each other (double-presses, devices landing on the same
+seed). The same traffic runs with single-flight off and on, and the report
+compares upstream generations, latency percentiles and wall time, and checks
+that every copy of a payload received identical bytes.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from .config import Settings
+from .loadgen import Target, percentile
+from .mock_a1111 import MockGPU, MockUpstream
+from .server import PassthroughServer
+
+
+async def _traffic(singleflight, args):
+    rnd = random.Random(args.seed)
+    gpu = MockGPU(latency=args.latency, seed=args.seed)
+    settings = Settings(cache_mem_mb=0, image_cache_mb=0, singleflight=singleflight)
+    server = PassthroughServer(settings, upstream=MockUpstream(gpu))
+    await server.start('127.0.0.1', 0)
+    target = Target('http://127.0.0.1:{}'.format(server.port), timeout=args.timeout)
+
+    async def device(payload, delay):
+        await asyncio.sleep(delay)
+        return payload['seed'], await target.send(payload)
+
+    results = []
+    start = time.monotonic()
+    try:
+        for _ in range(args.bursts):
+            payloads = [{'prompt': 'burst test', 'seed': rnd.getrandbits(31), 'steps': 5,
+                         'width': 512, 'height': 512} for _ in range(args.distinct)]
+            jobs = [device(p, rnd.uniform(0, args.jitter_ms / 1000)) for p in payloads for _ in range(args.dup)]
+            results += await asyncio.gather(*jobs)
+    finally:
+        elapsed = time.monotonic() - start
+        await server.close()
+    return gpu.stats['requests'], results, elapsed
+
+
+def _report(name, calls, results, elapsed):
+    ok = [r for _, r in results if not r['error']]
+    vals = sorted(r['total'] * 1000 for r in ok)
+    crcs = {}
+    for seed, r in results:
+        if not r['error']:
+            crcs.setdefault(seed, set()).add(r['crc32'])
+    consistent = all(len(c) == 1 for c in crcs.values())
+    print('{:>13} {:>9} {:>6}/{:<6} {:>9.0f} {:>9.0f} {:>9.0f} {:>9.1f} {:>10}'.format(
+        name, calls, len(ok), len(results), percentile(vals, 50) or 0, percentile(vals, 95) or 0,
+        vals[-1] if vals else 0, elapsed, 'yes' if consistent else 'NO'))
+
+
+async def run(args):
+    print('{} bursts x {} payloads x {} duplicates, latency {}, one GPU, cache off'.format(
+        args.bursts, args.distinct, args.dup, args.latency))
+    print('{:>13} {:>9} {:>13} {:>9} {:>9} {:>9} {:>9} {:>10}'.format(
+        'singleflight', 'upstream', 'ok/requests', 'p50 ms', 'p95 ms', 'max ms', 'wall s', 'identical'))
+    for singleflight in (False, True):
+        _report('on' if singleflight else 'off', *await _traffic(singleflight, args))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--bursts', type=int, default=5)
+    ap.add_argument('--distinct', type=int, default=3, help='distinct payloads per burst')
+    ap.add_argument('--dup', type=int, default=4, help='requests per payload in a burst')
+    ap.add_argument('--jitter-ms', type=float, default=300, help='spread of duplicate arrivals')
+    ap.add_argument('--latency', default='fixed:500', help='mock generation latency (ms)')
+    ap.add_argument('--timeout', type=float, default=120.0, help='per-request client timeout (s)')
+    ap.add_argument('--seed', type=int, default=1)
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
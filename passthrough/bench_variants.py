@@ -0,0 +1,128 @@
+"""Serve panels of different sizes from one generation each.
+
+    python -m passthrough.bench_variants [--panels 240x240 320x240] [--devices 3] [--requests 6]
+
+Each panel spec is WIDTHxHEIGHT[:FORMAT] (format one of
+convert.PIXEL_FORMATS, rgb565-be by default). --devices simulated devices
+per panel each send --requests seeded payloads drawn from --distinct
+shared ones, so the same generation is asked for by different panels,
+sometimes while it is still running and sometimes after.
+
+Two setups run on the mock upstream (one GPU for both). Devices send
+X-Display-Width/Height/Format in both:
+
+    per-panel    one passthrough per panel, so generations are not shared
+                 between panels (how mixed panels had to be served before)
+    negotiated   one passthrough for every panel
+
+The report compares GPU jobs, frames served, X-Cache sources and latency,
+and checks every frame is width * height * 2 bytes and that each
+(payload, panel) got the same bytes in both setups.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from .config import Settings
+from .convert import PIXEL_FORMATS
+from .loadgen import Target, percentile
+from .mock_a1111 import MockGPU, MockUpstream
+from .server import PassthroughServer
+
+
+def _panel(spec):
+    size, _, fmt = spec.partition(':')
+    w, _, h = size.lower().partition('x')
+    fmt = fmt or 'rgb565-be'
+    if fmt not in PIXEL_FORMATS:
+        raise argparse.ArgumentTypeError('format must be one of {}'.format(', '.join(PIXEL_FORMATS)))
+    return int(w), int(h), fmt
+
+
+async def _run(negotiated, args):
+    rnd = random.Random(args.seed)
+    gpu = MockGPU(latency=args.latency, seed=args.seed)
+    servers = []
+    targets = []
+    try:
+        if negotiated:
+            server = PassthroughServer(Settings(), upstream=MockUpstream(gpu))
+            servers.append(server)
+            await server.start('127.0.0.1', 0)
+            url = 'http://127.0.0.1:{}'.format(server.port)
+            targets = [Target(url, timeout=args.timeout, display=p) for p in args.panels]
+        else:
+            for p in args.panels:
+                server = PassthroughServer(Settings(target_width=p[0], target_height=p[1]), upstream=MockUpstream(gpu))
+                servers.append(server)
+                await server.start('127.0.0.1', 0)
+                targets.append(Target('http://127.0.0.1:{}'.format(server.port), timeout=args.timeout, display=p))
+        payloads = [{'prompt': 'portrait {}'.format(i), 'seed': rnd.getrandbits(31), 'steps': 5,
+                     'width': args.size, 'height': args.size} for i in range(args.distinct)]
+
+        async def device(panel, target, drng):
+            out = []
+            for _ in range(args.requests):
+                await asyncio.sleep(drng.uniform(0, args.think_ms) / 1000)
+                i = drng.randrange(len(payloads))
+                out.append((i, panel, await target.send(payloads[i])))
+            return out
+
+        start = time.monotonic()
+        runs = await asyncio.gather(*(device(p, t, random.Random(rnd.getrandbits(64)))
+                                      for p, t in zip(args.panels, targets) for _ in range(args.devices)))
+        elapsed = time.monotonic() - start
+    finally:
+        for server in servers:
+            await server.close()
+    return [r for rs in runs for r in rs], gpu.stats['requests'], elapsed
+
+
+def _ms(vals, p):
+    v = percentile(vals, p)
+    return '-' if v is None else '{:.0f}'.format(v)
+
+
+async def run(args):
+    print('panels {}, {} devices each x {} requests over {} payloads, latency {}, one GPU'.format(
+        ' '.join('{}x{}:{}'.format(*p) for p in args.panels), args.devices, args.requests, args.distinct,
+        args.latency))
+    print('{:>10} {:>7} {:>8} {:>8} {:>8} {:>8}  {}'.format(
+        'setup', 'ok', 'GPU jobs', 'p50 ms', 'p95 ms', 'wall s', 'X-Cache'))
+    frames = {}
+    for name, negotiated in (('per-panel', False), ('negotiated', True)):
+        results, jobs, elapsed = await _run(negotiated, args)
+        ok = [(i, p, r) for i, p, r in results if not r['error']]
+        bad = [r for _, (w, h, _), r in ok if r['bytes'] != w * h * 2]
+        if bad:
+            raise SystemExit('{}: {} frames of the wrong size'.format(name, len(bad)))
+        for i, p, r in ok:
+            if frames.setdefault((i, p), r['crc32']) != r['crc32']:
+                raise SystemExit('{}: payload {} on {}x{}:{} differs between setups'.format(name, i, *p))
+        sources = {}
+        for _, _, r in ok:
+            sources[r['cache']] = sources.get(r['cache'], 0) + 1
+        total = sorted(r['total'] * 1000 for _, _, r in ok)
+        print('{:>10} {:>7} {:>8} {:>8} {:>8} {:>8.1f}  {}'.format(
+            name, '{}/{}'.format(len(ok), len(results)), jobs, _ms(total, 50), _ms(total, 95), elapsed,
+            ' '.join('{}={}'.format(k, v) for k, v in sorted(sources.items()))))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--panels', nargs='+', type=_panel, default=[(240, 240, 'rgb565-be'), (320, 240, 'rgb565-be')],
+                    help='WIDTHxHEIGHT[:FORMAT] per panel kind')
+    ap.add_argument('--devices', type=int, default=3, help='devices per panel')
+    ap.add_argument('--requests', type=int, default=6, help='requests per device')
+    ap.add_argument('--distinct', type=int, default=6, help='distinct seeded payloads')
+    ap.add_argument('--think-ms', type=float, default=2000, help='longest pause before each request')
+    ap.add_argument('--size', type=int, default=512, help='upstream PNG size')
+    ap.add_argument('--latency', default='fixed:500', help='mock generation latency (ms)')
+    ap.add_argument('--timeout', type=float, default=60.0)
+    ap.add_argument('--seed', type=int, default=1)
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
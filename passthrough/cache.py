@@ -0,0 +1,241 @@
+"""Finished-frame cache: deterministic txt2img results keyed by payload.
+
+A txt2img request with an explicit seed is deterministic, and the device
+keeps its seed across category presses, so the same (prompt, seed, steps,
+cfg_scale, sampler, size) recurs across sessions and devices. cache_key()
+canonicalizes the payload plus the output format into a sha256 key;
+FrameCache keeps RGB565 frames in two tiers:
+
+- memory: an LRU of bytes objects capped at mem_bytes
+- disk: one <key>.rgb565 file per frame under disk_dir, LRU by last use
+  (by write time after a restart) and capped at disk_bytes
+
+Every generated frame goes into both tiers. A memory hit is returned as
+bytes; a disk hit as the file path, which the server streams with
+loop.sendfile() (os.sendfile() on plain sockets) so the frame never passes
+through Python. Disk hits are not promoted back into memory: that would
+cost the copy sendfile avoids, and the page cache already keeps hot files
+in RAM.
+
+generation_key() is the same hash without the output format: it names
+the generation itself, which every panel size and pixel format is made
+from. ImageCache keeps recent generations decoded (RGB888), so a panel
+variant that is not in FrameCache yet costs a resize, not a GPU job or
+even a PNG decode.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+# Payload fields that do not change the pixels A1111 returns
+IGNORED_FIELDS = ('save_images', 'send_images', 'do_not_save_samples', 'do_not_save_grid')
+INT_FIELDS = ('seed', 'steps', 'width', 'height', 'batch_size', 'n_iter', 'subseed', 'clip_skip')
+FLOAT_FIELDS = ('cfg_scale', 'denoising_strength', 'subseed_strength')
+SUFFIX = '.rgb565'
+
+
+def _canonical(payload):
+    """The payload with ignored fields dropped and numbers normalized, or
+    None when the result is not deterministic (no seed, or seed -1: A1111
+    picks one)."""
+    try:
+        seed = int(payload.get('seed', -1))
+    except (TypeError, ValueError):
+        return None
+    if seed < 0:
+        return None
+    canon = {}
+    for k, v in payload.items():
+        if k in IGNORED_FIELDS:
+            continue
+        try:
+            if k in INT_FIELDS:
+                v = int(v)
+            elif k in FLOAT_FIELDS:
+                v = float(v)
+        except (TypeError, ValueError):
+            pass
+        canon[k] = v
+    return canon
+
+
+def _digest(canon):
+    blob = json.dumps(canon, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+def cache_key(payload, width, height, luminance_invert, fmt='rgb565-be', crop=False):
+    """sha256 of the canonical payload and output format, or None when the
+    result is not deterministic."""
+    canon = _canonical(payload)
+    if canon is None:
+        return None
+    canon['_out'] = [width, height, bool(luminance_invert), fmt]
+    if crop:
+        # appended only when set, so stretched frames keep their old keys
+        canon['_out'].append('crop')
+    return _digest(canon)
+
+
+def generation_key(payload):
+    """sha256 of the canonical payload alone, or None when the result is
+    not deterministic."""
+    canon = _canonical(payload)
+    return None if canon is None else _digest(canon)
+
+
+class ImageCache:
+    """LRU of decoded generations (convert.Decoded), capped at mem_bytes of
+    pixel data."""
+
+    def __init__(self, mem_bytes=32 << 20):
+        self.mem_bytes = mem_bytes
+        self._mem = OrderedDict()
+        self._size = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        decoded = self._mem.get(key)
+        if decoded is None:
+            self.stats['misses'] += 1
+            return None
+        self._mem.move_to_end(key)
+        self.stats['hits'] += 1
+        return decoded
+
+    def put(self, key, decoded):
+        if len(decoded.rgb) > self.mem_bytes:
+            return
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._size -= len(old.rgb)
+        self._mem[key] = decoded
+        self._size += len(decoded.rgb)
+        while self._size > self.mem_bytes:
+            _, old = self._mem.popitem(last=False)
+            self._size -= len(old.rgb)
+            self.stats['evictions'] += 1
+
+    def info(self):
+        return dict(self.stats, images=len(self._mem), bytes=self._size)
+
+
+class FrameCache:
+    def __init__(self, mem_bytes=64 << 20, disk_dir=None, disk_bytes=1 << 30):
+        self.mem_bytes = mem_bytes
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_bytes
+        self._mem = OrderedDict()
+        self._mem_size = 0
+        self._disk = OrderedDict()
+        self._disk_size = 0
+        self._writing = set()
+        self.stats = {'hits_mem': 0, 'hits_disk': 0, 'misses': 0, 'stores': 0,
+                      'evictions_mem': 0, 'evictions_disk': 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_index()
+
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, name)
+            if name.endswith('.tmp'):
+                # a write interrupted by a crash
+                os.remove(path)
+            elif name.endswith(SUFFIX):
+                st = os.stat(path)
+                entries.append((st.st_mtime, name[:-len(SUFFIX)], st.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_size += size
+        self._unlink(self._evict_disk())
+
+    def path(self, key):
+        return os.path.join(self.disk_dir, key + SUFFIX)
+
+    def get(self, key):
+        """('mem', frame_bytes), ('disk', path, size) or None."""
+        frame = self._mem.get(key)
+        if frame is not None:
+            self._mem.move_to_end(key)
+            self.stats['hits_mem'] += 1
+            return 'mem', frame
+        size = self._disk.get(key)
+        if size is not None:
+            self._disk.move_to_end(key)
+            self.stats['hits_disk'] += 1
+            return 'disk', self.path(key), size
+        self.stats['misses'] += 1
+        return None
+
+    def forget(self, key):
+        """Drop a disk entry whose file turned out to be missing."""
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_size -= size
+
+    def put(self, key, frame):
+        """Store a generated frame in the memory tier; save() adds it to disk."""
+        self.stats['stores'] += 1
+        if len(frame) > self.mem_bytes:
+            return
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._mem_size -= len(old)
+        self._mem[key] = frame
+        self._mem_size += len(frame)
+        while self._mem_size > self.mem_bytes:
+            _, old = self._mem.popitem(last=False)
+            self._mem_size -= len(old)
+            self.stats['evictions_mem'] += 1
+
+    async def save(self, key, frame):
+        """Write a frame to the disk tier in a worker thread. It only becomes
+        a disk hit once the file is complete."""
+        if not self.disk_dir or key in self._disk or key in self._writing or len(frame) > self.disk_bytes:
+            return
+        self._writing.add(key)
+        try:
+            await asyncio.to_thread(self._write, key, frame)
+        finally:
+            self._writing.discard(key)
+        self._disk[key] = len(frame)
+        self._disk_size += len(frame)
+        victims = self._evict_disk()
+        if victims:
+            await asyncio.to_thread(self._unlink, victims)
+
+    def _evict_disk(self):
+        victims = []
+        while self._disk_size > self.disk_bytes:
+            key, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            self.stats['evictions_disk'] += 1
+            victims.append(key)
+        return victims
+
+    def _unlink(self, keys):
+        for key in keys:
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def _write(self, key, frame):
+        tmp = self.path(key) + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(frame)
+        os.replace(tmp, self.path(key))
+
+    def info(self):
+        out = dict(self.stats)
+        lookups = out['hits_mem'] + out['hits_disk'] + out['misses']
+        out['hit_ratio'] = round((out['hits_mem'] + out['hits_disk']) / lookups, 4) if lookups else None
+        out['mem_frames'] = len(self._mem)
+        out['mem_bytes'] = self._mem_size
+        out['disk_frames'] = len(self._disk)
+        out['disk_bytes'] = self._disk_size
+        return out
@@ -0,0 +1,123 @@
+"""Passthrough settings, read from the environment (and an optional .env file).
+
+The variable names follow flask_fastAPI_automatic1111_passthrough_for_Pico.md:
+
+    A1111_BASE_URL=http://192.168.1.100:7860
+    A1111_USERNAME / A1111_PASSWORD     optional upstream basic auth
+    A1111_TIMEOUT=60
+    SERVICE_HOST=0.0.0.0
+    SERVICE_PORT=8080
+    SERVICE_API_KEY                     optional; devices send it as X-API-Key
+    TARGET_WIDTH=240 / TARGET_HEIGHT=240
+    LUMINANCE_INVERT=false
+    UPSTREAM_POOL_SIZE=4                keep-alive connections to the upstream
+    UPSTREAM                            optional module:factory for a custom upstream
+    CACHE_MEM_MB=64                     in-memory frame cache (0 disables)
+    CACHE_DIR                           on-disk frame cache directory (unset disables)
+    CACHE_DISK_MB=1024                  on-disk frame cache cap
+    IMAGE_CACHE_MB=32                   decoded generations kept for other panel sizes (0 disables)
+    SINGLEFLIGHT=true                   share one generation between identical requests
+    INFLIGHT_TIMEOUT=0                  per-request wait limit in s (0: A1111_TIMEOUT applies)
+    BATCH_WINDOW_MS=0                   collect compatible requests this long into one batch (0: off)
+    BATCH_MAX=4                         largest upstream batch
+    UPSTREAM_BATCH=false                the A1111 upstream accepts per-item prompt/seed lists
+    A1111_BACKENDS                      url[*weight],... : several A1111 boxes as one pool
+    BACKEND_PROBE_PATH=/sdapi/v1/progress, BACKEND_PROBE_INTERVAL_S=10 (0: no probes),
+    BACKEND_WARMUP=true, BACKEND_EJECT_FAILURES=3, BACKEND_EJECT_S=30,
+    BACKEND_SLOW_FACTOR=3, HEDGE=false, HEDGE_MAX_RATIO=0.1   see backends.py
+    MAX_WORKERS=4                       generations running at once (0: no admission control)
+    QUEUE_SIZE=10                       requests waiting for one; beyond that 503 + Retry-After
+    QUEUE_MAX_WAIT_S=0                  also refuse when the estimated wait is longer (0: off)
+    CONVERT_MODE=process                where PNG -> RGB565 runs: process, thread or inline
+    CONVERT_WORKERS=0                   conversion processes (0: one per CPU)
+"""
+import os
+from dataclasses import dataclass, fields
+from pathlib import Path
+
+
+def _bool(value):
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def load_dotenv(path='.env'):
+    """Copy KEY=VALUE lines from path into os.environ (existing variables win)."""
+    p = Path(path)
+    if not p.is_file():
+        return
+    for line in p.read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith('#') or '=' not in line:
+            continue
+        key, _, value = line.partition('=')
+        os.environ.setdefault(key.strip(), value.strip().strip('"').strip("'"))
+
+
+@dataclass
+class Settings:
+    a1111_base_url: str = 'http://127.0.0.1:7860'
+    a1111_username: str = None
+    a1111_password: str = None
+    a1111_timeout: float = 60.0
+
+    service_host: str = '0.0.0.0'
+    service_port: int = 8080
+    service_api_key: str = None
+
+    target_width: int = 240
+    target_height: int = 240
+    # The device blits frames as-is (the precompiled placeholder is not
+    # inverted), so inversion is off unless a panel needs it
+    luminance_invert: bool = False
+
+    upstream_pool_size: int = 4
+    upstream: str = None
+
+    cache_mem_mb: int = 64
+    cache_dir: str = None
+    cache_disk_mb: int = 1024
+    image_cache_mb: int = 32
+
+    singleflight: bool = True
+    inflight_timeout: float = 0.0
+
+    batch_window_ms: float = 0.0
+    batch_max: int = 4
+    upstream_batch: bool = False
+
+    a1111_backends: str = None
+    backend_probe_path: str = '/sdapi/v1/progress'
+    backend_probe_interval_s: float = 10.0
+    backend_warmup: bool = True
+    backend_eject_failures: int = 3
+    backend_eject_s: float = 30.0
+    backend_slow_factor: float = 3.0
+    hedge: bool = False
+    hedge_max_ratio: float = 0.1
+
+    max_workers: int = 4
+    queue_size: int = 10
+    queue_max_wait_s: float = 0.0
+
+    convert_mode: str = 'process'
+    convert_workers: int = 0
+
+    @classmethod
+    def from_env(cls, env=None, dotenv='.env'):
+        if env is None:
+            load_dotenv(dotenv)
+            env = os.environ
+        kwargs = {}
+        for f in fields(cls):
+            raw = env.get(f.name.upper())
+            if raw is None or raw == '':
+                continue
+            if f.type is bool:
+                kwargs[f.name] = _bool(raw)
+            elif f.type is int:
+                kwargs[f.name] = int(raw)
+            elif f.type is float:
+                kwargs[f.name] = float(raw)
+            else:
+                kwargs[f.name] = raw
+        return cls(**kwargs)
@@ -0,0 +1,164 @@
+"""PNG -> RGB565 conversion for the Pico's ST7789.
+
+Output is what the device streams straight to the panel: width * height
+pixels, 2 bytes each, row-major; by default big-endian (high byte first)
+with red in the top five bits, the same packing as
+scripts/make_placeholder_raw.py and png_to_pico_rgb565() in the passthrough
+doc.
+
+pack_rgb565() does the per-pixel work as NumPy array operations (a few
+whole-frame passes instead of one Python iteration per pixel). Without
+NumPy it falls back to per-channel bytes.translate() tables combined with
+bignum ORs, which also avoids a Python-level loop. Both paths produce
+byte-identical output to png_to_rgb565_reference(); see bench_convert.py.
+
+The work splits in two so several panel variants can share one decode:
+decode_png() gives the generation's RGB pixels (a Decoded), and
+render_rgb() scales them to a panel (Pillow's C resampler) and packs them
+in one of PIXEL_FORMATS. Like the reference, render_rgb() and
+png_to_rgb565() stretch the whole image to the output size; crop=True
+(used for panels that negotiate their size) instead scales the centred
+crop with the output's aspect ratio, so a non-square panel shows an
+undistorted image. The two agree whenever the aspect ratios match.
+"""
+from collections import namedtuple
+from io import BytesIO
+
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised on hosts without numpy
+    np = None
+
+BYTEORDERS = ('big', 'little')
+CHANNEL_ORDERS = ('rgb', 'bgr')
+# X-Display-Format / X-Image-Format names -> (byteorder, order)
+PIXEL_FORMATS = {
+    'rgb565-be': ('big', 'rgb'),
+    'rgb565-le': ('little', 'rgb'),
+    'bgr565-be': ('big', 'bgr'),
+    'bgr565-le': ('little', 'bgr'),
+}
+
+# A decoded generation: width x height RGB888 pixels, row-major
+Decoded = namedtuple('Decoded', 'width height rgb')
+
+
+def _check(byteorder, order):
+    if byteorder not in BYTEORDERS:
+        raise ValueError('byteorder must be one of {}'.format(BYTEORDERS))
+    if order not in CHANNEL_ORDERS:
+        raise ValueError('order must be one of {}'.format(CHANNEL_ORDERS))
+
+
+def png_to_rgb565_reference(png_bytes, width=240, height=240, luminance_invert=False):
+    """The passthrough doc's converter, kept verbatim as the ground truth."""
+    img = Image.open(BytesIO(png_bytes)).convert('RGB')
+    img = img.resize((width, height), Image.LANCZOS)
+    data = bytearray()
+    for y in range(height):
+        for x in range(width):
+            r, g, b = img.getpixel((x, y))
+            if luminance_invert:
+                r, g, b = 255 - r, 255 - g, 255 - b
+            rgb565 = ((r >> 3) << 11) | ((g >> 2) << 5) | (b >> 3)
+            data.append((rgb565 >> 8) & 0xFF)
+            data.append(rgb565 & 0xFF)
+    return bytes(data)
+
+
+def _pack_numpy(rgb, invert, byteorder, order):
+    px = np.frombuffer(rgb, dtype=np.uint8).reshape(-1, 3)
+    if invert:
+        px = ~px
+    hi, lo = (0, 2) if order == 'rgb' else (2, 0)
+    v = (px[:, hi].astype(np.uint16) >> 3) << 11
+    v |= (px[:, 1].astype(np.uint16) >> 2) << 5
+    v |= px[:, lo] >> 3
+    return v.astype('>u2' if byteorder == 'big' else '<u2').tobytes()
+
+
+_luts = {}
+
+
+def _lut(invert):
+    """256-entry bytes.translate() tables for each channel's share of the
+    high and low output bytes: first channel -> high bits 7..3, green ->
+    high bits 2..0 and low bits 7..5, last channel -> low bits 4..0."""
+    if invert not in _luts:
+        vals = [255 - v for v in range(256)] if invert else range(256)
+        _luts[invert] = (
+            bytes((v >> 3) << 3 for v in vals),
+            bytes(v >> 5 for v in vals),
+            bytes(((v >> 2) & 0x07) << 5 for v in vals),
+            bytes(v >> 3 for v in vals),
+        )
+    return _luts[invert]
+
+
+def _or(a, b):
+    # The two tables never set the same bit, so one bignum OR combines a
+    # whole plane without a Python-level loop
+    return (int.from_bytes(a, 'big') | int.from_bytes(b, 'big')).to_bytes(len(a), 'big')
+
+
+def _pack_lut(rgb, invert, byteorder, order):
+    first_hi, green_hi, green_lo, last_lo = _lut(invert)
+    first = rgb[0::3] if order == 'rgb' else rgb[2::3]
+    green = rgb[1::3]
+    last = rgb[2::3] if order == 'rgb' else rgb[0::3]
+    out = bytearray(len(green) * 2)
+    h, l = (0, 1) if byteorder == 'big' else (1, 0)
+    out[h::2] = _or(first.translate(first_hi), green.translate(green_hi))
+    out[l::2] = _or(green.translate(green_lo), last.translate(last_lo))
+    return bytes(out)
+
+
+def pack_rgb565(rgb, luminance_invert=False, byteorder='big', order='rgb'):
+    """Pack 8-bit RGB triplets (e.g. Image.tobytes()) into RGB565.
+
+    byteorder 'big' puts the high byte first (what the device expects);
+    order 'bgr' puts blue in the top five bits for panels wired that way.
+    """
+    _check(byteorder, order)
+    if np is not None:
+        return _pack_numpy(rgb, luminance_invert, byteorder, order)
+    return _pack_lut(rgb, luminance_invert, byteorder, order)
+
+
+def decode_png(png_bytes):
+    """Decode a PNG (any bytes-like) to a Decoded."""
+    img = Image.open(BytesIO(png_bytes)).convert('RGB')
+    return Decoded(img.width, img.height, img.tobytes())
+
+
+def _cover_box(src_w, src_h, width, height):
+    """The centred source box with the output's aspect ratio."""
+    if src_w * height > width * src_h:
+        w = src_h * width / height
+        return ((src_w - w) / 2, 0, (src_w + w) / 2, src_h)
+    h = src_w * height / width
+    return (0, (src_h - h) / 2, src_w, (src_h + h) / 2)
+
+
+def render_rgb(decoded, width=240, height=240, luminance_invert=False, byteorder='big', order='rgb',
+               crop=False):
+    """Scale (Lanczos) and pack decoded pixels into a width x height
+    frame: the whole image, or with crop the centred part with the
+    output's aspect ratio. decoded.rgb may be any bytes-like; it is read
+    in place."""
+    _check(byteorder, order)
+    img = Image.frombuffer('RGB', (decoded.width, decoded.height), decoded.rgb, 'raw', 'RGB', 0, 1)
+    if img.size == (width, height):
+        rgb = img.tobytes()
+    else:
+        box = _cover_box(decoded.width, decoded.height, width, height) if crop else None
+        rgb = img.resize((width, height), Image.LANCZOS, box).tobytes()
+    return pack_rgb565(rgb, luminance_invert, byteorder, order)
+
+
+def png_to_rgb565(png_bytes, width=240, height=240, luminance_invert=False,
+                  byteorder='big', order='rgb'):
+    """Decode, resize (Lanczos) and pack a PNG into a width x height frame."""
+    return render_rgb(decode_png(png_bytes), width, height, luminance_invert, byteorder, order)
@@ -0,0 +1,228 @@
+"""Where PNG -> RGB565 conversion runs.
+
+Decoding a generation's PNG (decode_png) and turning it into a panel's
+frame (render_rgb: Lanczos resize, packing) are tens of ms of CPU.
+CONVERT_MODE picks where that CPU time is spent:
+
+    process   (default) a pool of CONVERT_WORKERS processes (0: one per
+              CPU); the event loop only copies bytes in and out
+    thread    asyncio.to_thread(): off the loop, but the conversion holds
+              the loop's GIL for much of its run
+    inline    in the event loop itself, stalling every other connection
+              while a frame converts (for comparison; see bench_convpool.py)
+
+Process mode passes images through shared memory rather than pickling
+them through the pool's pipe. The converter owns SLOTS_PER_WORKER slots
+per worker, each a SharedMemory block. A job copies its input (PNG, or
+decoded pixels) into a free slot and sends the worker only the slot's name
+and sizes. The worker reads the block in place, writes its output (pixels,
+or the frame) back over it and returns the length, and the output is
+copied out once. Data too big for a slot goes through the pipe instead,
+including pixels decoded from a PNG that fit one (a 1536x1536 generation
+is 7 MB of RGB).
+When every slot is taken, jobs wait for one: that bounds the images in
+flight and is the pool's backpressure.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+from .convert import PIXEL_FORMATS, Decoded, decode_png, render_rgb
+from .httpio import HTTPError
+
+log = logging.getLogger('passthrough.convpool')
+
+MODES = ('process', 'thread', 'inline')
+SLOTS_PER_WORKER = 2
+# Room for a 1024x1024 generation's PNG (1-3 MB) or pixels (3 MB)
+SLOT_BYTES = 4 << 20
+
+# Worker side: shared memory blocks this process has attached, by name
+_attached = {}
+
+
+def _warm():
+    """Run once per worker at start so the first request does not pay for
+    process start-up and the PIL / NumPy imports."""
+    return os.getpid()
+
+
+def _slot(name):
+    shm = _attached.get(name)
+    if shm is None:
+        shm = _attached[name] = shared_memory.SharedMemory(name=name)
+    return shm
+
+
+def _decode_slot(name, size):
+    shm = _slot(name)
+    decoded = decode_png(shm.buf[:size])
+    if len(decoded.rgb) > shm.size:
+        # more pixels than the slot holds: send them back through the pipe
+        return None, decoded
+    shm.buf[:len(decoded.rgb)] = decoded.rgb
+    return len(decoded.rgb), (decoded.width, decoded.height)
+
+
+def _render_slot(name, src_width, src_height, width, height, invert, fmt, crop):
+    shm = _slot(name)
+    src = Decoded(src_width, src_height, shm.buf[:src_width * src_height * 3])
+    frame = render_rgb(src, width, height, invert, *PIXEL_FORMATS[fmt], crop)
+    shm.buf[:len(frame)] = frame
+    return len(frame), None
+
+
+class InlineConverter:
+    """decode(png) -> Decoded; render(decoded, width, height, invert, fmt,
+    crop) -> frame bytes in PIXEL_FORMATS[fmt] (see convert.render_rgb)."""
+    mode = 'inline'
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def decode(self, png):
+        return decode_png(png)
+
+    async def render(self, decoded, width, height, invert, fmt='rgb565-be', crop=False):
+        return render_rgb(decoded, width, height, invert, *PIXEL_FORMATS[fmt], crop)
+
+    def info(self):
+        return {'mode': self.mode}
+
+
+class ThreadConverter(InlineConverter):
+    mode = 'thread'
+
+    async def decode(self, png):
+        return await asyncio.to_thread(decode_png, png)
+
+    async def render(self, decoded, width, height, invert, fmt='rgb565-be', crop=False):
+        return await asyncio.to_thread(render_rgb, decoded, width, height, invert, *PIXEL_FORMATS[fmt], crop)
+
+
+class ProcessConverter:
+    mode = 'process'
+
+    def __init__(self, workers=0):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = None
+        self._slots = []
+        self._free = None
+        self.stats = {'decoded': 0, 'rendered': 0, 'piped': 0, 'waited': 0, 'restarts': 0}
+
+    def _spawn(self):
+        # spawn, not fork: the server has threads (to_thread, the executor's
+        # own) that a forked child would inherit mid-flight
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    async def start(self):
+        if self.executor is not None:
+            return
+        self._spawn()
+        self._free = asyncio.Queue()
+        for _ in range(SLOTS_PER_WORKER * self.workers):
+            shm = shared_memory.SharedMemory(create=True, size=SLOT_BYTES)
+            self._slots.append(shm)
+            self._free.put_nowait(shm)
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(*(loop.run_in_executor(self.executor, _warm) for _ in range(self.workers)))
+        except BaseException:
+            await self.close()
+            raise
+
+    async def close(self):
+        if self.executor is not None:
+            await asyncio.to_thread(self.executor.shutdown, True, cancel_futures=True)
+            self.executor = None
+        for shm in self._slots:
+            shm.close()
+            shm.unlink()
+        self._slots = []
+
+    async def decode(self, png):
+        if self.executor is None:
+            await self.start()
+        self.stats['decoded'] += 1
+        if len(png) > SLOT_BYTES:
+            return await self._piped(decode_png, png)
+        rgb, extra = await self._in_slot(png, _decode_slot, len(png))
+        if rgb is None:
+            self.stats['piped'] += 1
+            return extra
+        return Decoded(extra[0], extra[1], rgb)
+
+    async def render(self, decoded, width, height, invert, fmt='rgb565-be', crop=False):
+        if self.executor is None:
+            await self.start()
+        self.stats['rendered'] += 1
+        if len(decoded.rgb) > SLOT_BYTES or width * height * 2 > SLOT_BYTES:
+            return await self._piped(render_rgb, decoded, width, height, invert, *PIXEL_FORMATS[fmt], crop)
+        frame, _ = await self._in_slot(decoded.rgb, _render_slot, decoded.width, decoded.height,
+                                       width, height, invert, fmt, crop)
+        return frame
+
+    async def _piped(self, fn, *args):
+        self.stats['piped'] += 1
+        executor = self.executor
+        return await self._run(executor, executor.submit(fn, *args))
+
+    async def _in_slot(self, data, fn, *args):
+        """Copy data into a free slot and run fn(slot_name, *args) in a
+        worker; fn returns (output length, extra), or (None, extra) when
+        its output did not fit the slot. Returns (output or None, extra)."""
+        if self._free.empty():
+            self.stats['waited'] += 1
+        shm = await self._free.get()
+        job = None
+        try:
+            shm.buf[:len(data)] = data
+            executor = self.executor
+            job = executor.submit(fn, shm.name, *args)
+            size, extra = await self._run(executor, job)
+            return (bytes(shm.buf[:size]) if size is not None else None), extra
+        finally:
+            if job is None or job.done():
+                self._free.put_nowait(shm)
+            else:
+                # cancelled while the worker still writes into the slot: hand
+                # it back once the worker is done with it
+                loop = asyncio.get_running_loop()
+                job.add_done_callback(lambda _: loop.call_soon_threadsafe(self._free.put_nowait, shm))
+
+    async def _run(self, executor, job):
+        try:
+            return await asyncio.wrap_future(job)
+        except BrokenProcessPool:
+            # a worker died (OOM killer, a crash in a codec): replace the pool
+            # once, so later requests work, and fail the jobs it had
+            if executor is self.executor:
+                log.error('conversion worker died; restarting the pool')
+                self.stats['restarts'] += 1
+                executor.shutdown(wait=False)
+                self._spawn()
+            raise HTTPError(500, 'conversion worker died')
+
+    def info(self):
+        out = dict(self.stats)
+        out.update({'mode': self.mode, 'workers': self.workers, 'slots': len(self._slots),
+                    'free_slots': self._free.qsize() if self._free is not None else None})
+        return out
+
+
+def make_converter(settings):
+    mode = settings.convert_mode
+    if mode == 'process':
+        return ProcessConverter(settings.convert_workers)
+    if mode == 'thread':
+        return ThreadConverter()
+    if mode == 'inline':
+        return InlineConverter()
+    raise ValueError('CONVERT_MODE must be one of {}'.format(MODES))
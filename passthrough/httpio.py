@@ -0,0 +1,209 @@
+"""Minimal HTTP/1.1 over asyncio streams: request parsing and response
+writing for the server, and a keep-alive connection pool for the upstream.
+
+Only what the passthrough needs: Content-Length and chunked bodies, no
+pipelining, no TLS on the server side (put nginx in front for that, as the
+passthrough doc describes).
+"""
+import asyncio
+import json
+import ssl
+from urllib.parse import urlsplit
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+REASONS = {
+    200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+    405: 'Method Not Allowed', 413: 'Payload Too Large', 422: 'Unprocessable Entity',
+    500: 'Internal Server Error', 502: 'Bad Gateway', 503: 'Service Unavailable',
+    504: 'Gateway Timeout',
+}
+
+
+class HTTPError(Exception):
+    """An error that maps onto an HTTP status, reported as the passthrough
+    doc's {"error": ..., "code": ...} body, with any extra headers (such as
+    Retry-After on a 503)."""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers
+
+
+class Request:
+    def __init__(self, method, path, version, headers, body):
+        self.method = method
+        self.path = path
+        self.version = version
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self):
+        conn = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return conn == 'keep-alive'
+        return conn != 'close'
+
+    def json(self):
+        try:
+            return json.loads(self.body or b'{}')
+        except ValueError as e:
+            raise HTTPError(400, 'invalid JSON body: {}'.format(e))
+
+
+async def _read_headers(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    if len(head) > MAX_HEADER_BYTES:
+        raise HTTPError(413, 'headers too large')
+    lines = head.decode('latin-1').split('\r\n')
+    headers = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return lines[0], headers
+
+
+async def _read_body(reader, headers, limit=MAX_BODY_BYTES):
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        parts = []
+        size = 0
+        while True:
+            n = int((await reader.readline()).split(b';')[0], 16)
+            if n == 0:
+                await reader.readline()
+                break
+            size += n
+            if size > limit:
+                raise HTTPError(413, 'body too large')
+            parts.append(await reader.readexactly(n))
+            await reader.readline()
+        return b''.join(parts)
+    length = int(headers.get('content-length') or 0)
+    if length > limit:
+        raise HTTPError(413, 'body too large')
+    return await reader.readexactly(length) if length else b''
+
+
+async def read_request(reader):
+    """Next request on a server connection, or None at EOF."""
+    try:
+        line, headers = await _read_headers(reader)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(413, 'headers too large')
+    parts = line.split()
+    if len(parts) != 3:
+        raise HTTPError(400, 'bad request line')
+    method, path, version = parts
+    body = await _read_body(reader, headers)
+    return Request(method.upper(), path, version, headers, body)
+
+
+def response_head(status, headers, keep_alive=False):
+    lines = ['HTTP/1.1 {} {}'.format(status, REASONS.get(status, ''))]
+    for k, v in headers.items():
+        lines.append('{}: {}'.format(k, v))
+    lines.append('Connection: {}'.format('keep-alive' if keep_alive else 'close'))
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+async def send(writer, status, body=b'', content_type='application/json', headers=None, keep_alive=False):
+    """Write a complete response with an exact Content-Length."""
+    h = {'Content-Type': content_type, 'Content-Length': str(len(body))}
+    h.update(headers or {})
+    writer.write(response_head(status, h, keep_alive))
+    if body:
+        writer.write(body)
+    await writer.drain()
+
+
+async def send_json(writer, status, obj, keep_alive=False, headers=None):
+    await send(writer, status, json.dumps(obj).encode('utf-8'), headers=headers, keep_alive=keep_alive)
+
+
+async def send_error(writer, status, message, keep_alive=False, headers=None):
+    await send_json(writer, status, {'error': message, 'code': status}, keep_alive, headers)
+
+
+class ConnectionPool:
+    """Keep-alive HTTP/1.1 connections to one upstream origin, shared by all
+    requests. At most size connections are open; further requests wait for
+    a free one, so the pool also caps upstream concurrency."""
+
+    def __init__(self, base_url, size=4, timeout=60.0):
+        u = urlsplit(base_url)
+        self.scheme = u.scheme or 'http'
+        self.host = u.hostname or '127.0.0.1'
+        self.port = u.port or (443 if self.scheme == 'https' else 80)
+        self.base_path = u.path.rstrip('/')
+        self.timeout = timeout
+        self._idle = []
+        self._slots = asyncio.Semaphore(size)
+        self.opened = 0
+        self.reused = 0
+
+    async def _connect(self):
+        ctx = ssl.create_default_context() if self.scheme == 'https' else None
+        conn = await asyncio.open_connection(self.host, self.port, ssl=ctx, limit=MAX_HEADER_BYTES)
+        self.opened += 1
+        return conn
+
+    async def request(self, method, path, body=b'', headers=None):
+        """Send one request and return (status, headers, body)."""
+        async with self._slots:
+            for attempt in (0, 1):
+                if self._idle:
+                    reader, writer = self._idle.pop()
+                    reused = True
+                else:
+                    reader, writer = await self._connect()
+                    reused = False
+                try:
+                    status, resp_headers, data, keep = await asyncio.wait_for(
+                        self._exchange(reader, writer, method, path, body, headers), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if reused and attempt == 0:
+                        # the server closed an idle keep-alive connection; retry on a fresh one
+                        continue
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+                if reused:
+                    self.reused += 1
+                if keep:
+                    self._idle.append((reader, writer))
+                else:
+                    writer.close()
+                return status, resp_headers, data
+
+    async def _exchange(self, reader, writer, method, path, body, headers):
+        h = {'Host': '{}:{}'.format(self.host, self.port), 'Content-Length': str(len(body))}
+        h.update(headers or {})
+        head = ['{} {}{} HTTP/1.1'.format(method, self.base_path, path)]
+        head += ['{}: {}'.format(k, v) for k, v in h.items()]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+        line, resp_headers = await _read_headers(reader)
+        parts = line.split(None, 2)
+        status = int(parts[1])
+        if 'content-length' in resp_headers or resp_headers.get('transfer-encoding', '').lower() == 'chunked':
+            data = await _read_body(reader, resp_headers, limit=1 << 30)
+            keep = resp_headers.get('connection', '').lower() != 'close' and parts[0] != 'HTTP/1.0'
+        else:
+            data = await reader.read()
+            keep = False
+        return status, resp_headers, data, keep
+
+    async def close(self):
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
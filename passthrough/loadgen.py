@@ -0,0 +1,278 @@
+"""Load generator: a fleet of simulated Person Clickers pressing buttons.
+
+    python -m passthrough.loadgen http://127.0.0.1:8080 --devices 20 --duration 120
+
+Each simulated device behaves like micropython/app.py: it waits a think
+time, presses a button (a category button picks a new value for that
+category, the remix button keeps the selection), sends one txt2img request
+on a fresh connection (the device does not keep connections alive), reads
+the whole frame and only then goes back to waiting. A 503 with Retry-After
+is retried at the suggested time (as the device does, with X-Priority: 0)
+up to --busy-retries times; "press" latency runs from the press to the
+frame including those waits. Prompts, seeds and the
+payload follow the device: build_prompt()'s prefix / categories / suffix
+from micropython/config.json and demographics.json, a new 31-bit seed per
+press (behavior.category_presses_change_seed is on), and the payload shape
+of A1111Client.build_payload() with the config's generation settings.
+
+Think times are lognormal around --think-ms, with a --burst fraction of
+quick repeat presses (people mash remix). Traces are generated from --seed
+and can be written with --save-trace and replayed exactly with --trace.
+
+The report gives throughput and latency percentiles for the whole request
+and for time to first byte, plus an error breakdown; --json prints the same
+as one JSON object.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import zlib
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from .admission import PRIORITY_RETRY
+from .httpio import MAX_HEADER_BYTES, _read_headers
+
+MICROPYTHON = Path(__file__).resolve().parent.parent / 'micropython'
+BUTTONS = ('A', 'B', 'X', 'Y', 'remix')
+PERCENTILES = (50, 90, 95, 99)
+
+
+def make_trace(rnd, presses, think_ms, burst):
+    """[[think_s, button], ...] for one device."""
+    trace = []
+    for i in range(presses):
+        if i and rnd.random() < burst:
+            think = rnd.uniform(0.3, 1.5)
+        else:
+            think = rnd.lognormvariate(math.log(think_ms / 1000), 0.8)
+        if i == 0:
+            # devices do not all wake up together
+            think = rnd.uniform(0, think_ms / 1000)
+        trace.append([round(think, 3), rnd.choice(BUTTONS)])
+    return trace
+
+
+def build_prompt(cfg, selection):
+    """Same assembly as PersonClickerApp.build_prompt()."""
+    body = ', '.join(selection[k] for k in ('A', 'B', 'X', 'Y') if selection.get(k))
+    prefix = (cfg.get('prompt_prefix') or '').strip()
+    suffix = (cfg.get('prompt_suffix') or '').strip()
+    prompt = '{} {}'.format(prefix, body) if prefix and body else (prefix or body)
+    if suffix:
+        prompt = '{} {}'.format(prompt, suffix) if prompt else suffix
+    return prompt
+
+
+def build_payload(cfg, prompt, seed):
+    """The payload A1111Client.build_payload() sends for this config."""
+    gen = cfg.get('generation') or {}
+    size = int(cfg.get('image_request_size') or (cfg.get('display') or {}).get('width', 240))
+    return {
+        'prompt': prompt,
+        'sampler_name': gen.get('sampler_name', 'Euler'),
+        'steps': gen.get('steps', 20),
+        'cfg_scale': gen.get('cfg_scale', 7.0),
+        'width': size,
+        'height': size,
+        'seed': seed,
+    }
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    k = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+
+class Device:
+    def __init__(self, n, trace, cfg, categories, target, rnd, busy_retries=5):
+        self.n = n
+        self.busy_retries = busy_retries
+        self.trace = trace
+        self.cfg = cfg
+        self.categories = categories
+        self.target = target
+        self.rnd = rnd
+        self.selection = {k: rnd.choice(v['values']) for k, v in categories.items()}
+        self.seed = rnd.getrandbits(31)
+
+    def press(self, button):
+        if button in self.categories:
+            self.selection[button] = self.rnd.choice(self.categories[button]['values'])
+        self.seed = self.rnd.getrandbits(31)
+        return build_payload(self.cfg, build_prompt(self.cfg, self.selection), self.seed)
+
+    async def run(self, deadline, results):
+        for think, button in self.trace:
+            await asyncio.sleep(think)
+            if time.monotonic() >= deadline:
+                break
+            payload = self.press(button)
+            start = time.monotonic()
+            r = await self.target.send(payload)
+            busy = 0
+            while r['retry_after'] is not None and busy < self.busy_retries:
+                busy += 1
+                await asyncio.sleep(r['retry_after'])
+                r = await self.target.send(payload, PRIORITY_RETRY)
+            r['busy'] = busy
+            r['press'] = time.monotonic() - start
+            results.append(r)
+
+
+class Target:
+    """One txt2img request per call, on a new connection like the device.
+    display, a (width, height, format) tuple, is sent as X-Display-*."""
+
+    def __init__(self, url, api_key=None, timeout=60.0, display=None):
+        u = urlsplit(url)
+        self.host = u.hostname or '127.0.0.1'
+        self.port = u.port or 80
+        self.path = (u.path.rstrip('/') or '') + '/sdapi/v1/txt2img'
+        self.api_key = api_key
+        self.timeout = timeout
+        self.display = display
+
+    async def send(self, payload, priority=None):
+        r = {'start': time.monotonic(), 'ttfb': None, 'total': None, 'status': None, 'bytes': 0, 'crc32': None,
+             'cache': None, 'retry_after': None, 'position': None, 'error': None}
+        conn = []
+        try:
+            await asyncio.wait_for(self._exchange(payload, r, conn, priority), self.timeout)
+        except TimeoutError:
+            r['error'] = 'timeout'
+        except asyncio.IncompleteReadError:
+            r['error'] = 'short_read'
+        except (ConnectionError, OSError):
+            r['error'] = 'connect' if not conn else 'reset'
+        finally:
+            if conn:
+                conn[0].close()
+        return r
+
+    async def _exchange(self, payload, r, conn, priority=None):
+        body = json.dumps(payload).encode('utf-8')
+        head = ['POST {} HTTP/1.1'.format(self.path), 'Host: {}:{}'.format(self.host, self.port),
+                'Content-Type: application/json', 'Accept: application/octet-stream',
+                'Content-Length: {}'.format(len(body)), 'Connection: close']
+        if self.api_key:
+            head.append('X-API-Key: {}'.format(self.api_key))
+        if priority is not None:
+            head.append('X-Priority: {}'.format(priority))
+        if self.display:
+            head += ['X-Display-Width: {}'.format(self.display[0]), 'X-Display-Height: {}'.format(self.display[1]),
+                     'X-Display-Format: {}'.format(self.display[2])]
+        reader, writer = await asyncio.open_connection(self.host, self.port, limit=MAX_HEADER_BYTES)
+        conn.append(writer)
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+        line, headers = await _read_headers(reader)
+        r['ttfb'] = time.monotonic() - r['start']
+        r['status'] = int(line.split(None, 2)[1])
+        length = headers.get('content-length')
+        data = await (reader.readexactly(int(length)) if length is not None else reader.read())
+        r['bytes'] = len(data)
+        r['crc32'] = zlib.crc32(data)
+        r['cache'] = headers.get('x-cache')
+        r['total'] = time.monotonic() - r['start']
+        if r['status'] != 200:
+            r['error'] = 'http_{}'.format(r['status'])
+        if r['status'] == 503 and 'retry-after' in headers:
+            r['retry_after'] = float(headers['retry-after'])
+            r['position'] = headers.get('x-queue-position')
+
+
+def summarize(results, elapsed):
+    ok = [r for r in results if not r['error']]
+    errors = {}
+    for r in results:
+        if r['error']:
+            errors[r['error']] = errors.get(r['error'], 0) + 1
+
+    def dist(key):
+        vals = sorted(r[key] * 1000 for r in ok if r.get(key) is not None)
+        out = {'p{}'.format(p): percentile(vals, p) for p in PERCENTILES}
+        out['max'] = vals[-1] if vals else None
+        out['mean'] = sum(vals) / len(vals) if vals else None
+        return out
+
+    return {
+        'elapsed_s': elapsed,
+        'requests': len(results),
+        'ok': len(ok),
+        'errors': errors,
+        'throughput_rps': len(ok) / elapsed if elapsed else 0.0,
+        'throughput_MBps': sum(r['bytes'] for r in ok) / elapsed / 1e6 if elapsed else 0.0,
+        'latency_ms': dist('total'),
+        'ttfb_ms': dist('ttfb'),
+        'press_ms': dist('press'),
+        'busy_retries': sum(r.get('busy', 0) for r in results),
+    }
+
+
+def print_report(s, devices):
+    print('{} devices, {:.1f} s: {} requests, {} ok, errors {}'.format(
+        devices, s['elapsed_s'], s['requests'], s['ok'], s['errors'] or 'none'))
+    print('throughput {:.2f} frames/s, {:.2f} MB/s, {} retries after 503'.format(
+        s['throughput_rps'], s['throughput_MBps'], s['busy_retries']))
+    cols = ['p{}'.format(p) for p in PERCENTILES] + ['max', 'mean']
+    print('{:>8} '.format('ms') + ' '.join('{:>9}'.format(c) for c in cols))
+    for name in ('latency_ms', 'ttfb_ms', 'press_ms'):
+        row = s[name]
+        print('{:>8} '.format(name[:-3]) + ' '.join(
+            '{:>9}'.format('-' if row[c] is None else '{:.0f}'.format(row[c])) for c in cols))
+
+
+async def run(args):
+    cfg = json.loads(Path(args.config).read_text())
+    categories = json.loads(Path(args.demographics).read_text())['categories']
+    rnd = random.Random(args.seed)
+    if args.trace:
+        traces = json.loads(Path(args.trace).read_text())
+    else:
+        traces = [make_trace(rnd, args.presses, args.think_ms, args.burst) for _ in range(args.devices)]
+    if args.save_trace:
+        Path(args.save_trace).write_text(json.dumps(traces))
+    target = Target(args.url, args.api_key, args.timeout)
+    devices = [Device(i, t, cfg, categories, target, random.Random(rnd.getrandbits(64)), args.busy_retries)
+               for i, t in enumerate(traces)]
+    results = []
+    start = time.monotonic()
+    deadline = start + args.duration if args.duration else float('inf')
+    await asyncio.gather(*(d.run(deadline, results) for d in devices))
+    return summarize(results, time.monotonic() - start), len(devices)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Simulated device fleet for the passthrough')
+    ap.add_argument('url', help='passthrough (or A1111) base URL')
+    ap.add_argument('--devices', type=int, default=10)
+    ap.add_argument('--presses', type=int, default=20, help='presses per device')
+    ap.add_argument('--duration', type=float, default=0, help='stop starting presses after this many s')
+    ap.add_argument('--think-ms', type=float, default=6000, help='median think time between presses')
+    ap.add_argument('--burst', type=float, default=0.25, help='fraction of quick repeat presses')
+    ap.add_argument('--timeout', type=float, default=60.0, help='per-request timeout (s)')
+    ap.add_argument('--busy-retries', type=int, default=5, help='retries of a 503 with Retry-After (0: none)')
+    ap.add_argument('--api-key')
+    ap.add_argument('--seed', type=int, default=1)
+    ap.add_argument('--trace', help='replay traces from this JSON file')
+    ap.add_argument('--save-trace', help='write the generated traces here')
+    ap.add_argument('--config', default=str(MICROPYTHON / 'config.json'))
+    ap.add_argument('--demographics', default=str(MICROPYTHON / 'demographics.json'))
+    ap.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = ap.parse_args()
+    summary, n = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_report(summary, n)
+
+
+if __name__ == '__main__':
+    main()
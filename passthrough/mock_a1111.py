@@ -0,0 +1,378 @@
+"""A local stand-in for an Automatic1111 webui, for load-testing without a GPU.
+
+    python -m passthrough.mock_a1111 --port 7860 --latency lognormal:2500,0.35 \\
+        --concurrency 1 --fail-rate 0.02 --fail-modes error,reset
+
+Serves the two endpoints the passthrough and device care about:
+
+    POST /sdapi/v1/txt2img   {"images": [<base64 PNG>], "parameters", "info"}
+    GET  /sdapi/v1/progress  progress / eta / job_count of the running job
+
+Images are deterministic: the same (prompt, seed, width, height) always
+yields the same PNG, so caches and byte comparisons work across runs. A
+request without a seed (or seed -1) gets a random one, reported in "info"
+like A1111 does.
+
+Generation time is drawn from a latency distribution (see parse_latency()).
+Only `concurrency` jobs run at once (1 mimics a single GPU); the rest queue
+in arrival order, and --max-queue turns the overflow into 503s. A
+--fail-rate fraction of requests fails with one of --fail-modes:
+
+    error   HTTP 500 with an A1111-style error body, after part of the latency
+    reset   connection closed without a response
+    empty   HTTP 200 with no images
+    hang    no response until the client gives up
+
+The same generator is available in-process as an upstream for the
+passthrough (UPSTREAM=passthrough.mock_a1111:create_upstream), configured
+through MOCK_LATENCY, MOCK_CONCURRENCY, MOCK_FAIL_RATE, MOCK_FAIL_MODES,
+MOCK_MAX_QUEUE, MOCK_SEED and MOCK_BATCH_COST.
+
+Batches: batch_size N with one prompt and seed behaves like A1111 (seeds
+seed .. seed+N-1); per-item "prompt" and "seed" lists (the passthrough's
+micro-batching format, see upstream.batch_payload()) are accepted too. A
+batch of N takes 1 + batch_cost * (N - 1) times one image's latency.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import time
+from functools import lru_cache
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+from . import httpio
+from .httpio import HTTPError
+from .upstream import batch_payload
+
+log = logging.getLogger('mock_a1111')
+
+FAIL_MODES = ('error', 'reset', 'empty', 'hang')
+MAX_SIDE = 2048
+HANG_S = 3600
+
+
+class MockFailure(Exception):
+    def __init__(self, mode):
+        super().__init__(mode)
+        self.mode = mode
+
+
+def parse_latency(spec):
+    """A sampler for one generation's duration in seconds.
+
+    spec is "<dist>:<params>" with times in ms:
+        fixed:2500            always 2.5 s
+        uniform:1500,4000     uniform between the two
+        normal:2500,400       mean, standard deviation (clamped at 0)
+        lognormal:2500,0.35   median, sigma of the underlying normal
+        exp:2500              exponential with that mean
+    A bare number is fixed.
+    """
+    dist, _, params = str(spec).partition(':')
+    if not params:
+        dist, params = 'fixed', dist
+    try:
+        p = [float(x) for x in params.split(',')]
+        if dist == 'fixed':
+            ms, = p
+            return lambda rnd: ms / 1000
+        if dist == 'uniform':
+            lo, hi = p
+            return lambda rnd: rnd.uniform(lo, hi) / 1000
+        if dist == 'normal':
+            mu, sd = p
+            return lambda rnd: max(0.0, rnd.gauss(mu, sd)) / 1000
+        if dist == 'lognormal':
+            median, sigma = p
+            return lambda rnd: rnd.lognormvariate(math.log(median), sigma) / 1000
+        if dist == 'exp':
+            mean, = p
+            return lambda rnd: rnd.expovariate(1 / mean) / 1000
+    except ValueError:
+        pass
+    raise ValueError('bad latency spec {!r}'.format(spec))
+
+
+@lru_cache(maxsize=64)
+def render_png(prompt, seed, width, height):
+    """A deterministic PNG for (prompt, seed): a two-colour gradient with a
+    few shapes on it, all derived from a hash of the inputs."""
+    digest = hashlib.sha256('{}\0{}'.format(prompt, seed).encode('utf-8')).digest()
+    rnd = random.Random(digest)
+    c0 = tuple(rnd.randrange(256) for _ in range(3))
+    c1 = tuple(rnd.randrange(256) for _ in range(3))
+    grad = Image.linear_gradient('L').resize((width, height))
+    img = Image.composite(Image.new('RGB', (width, height), c0), Image.new('RGB', (width, height), c1), grad)
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x0, x1 = sorted(rnd.randrange(width) for _ in range(2))
+        y0, y1 = sorted(rnd.randrange(height) for _ in range(2))
+        fill = tuple(rnd.randrange(256) for _ in range(3))
+        (draw.ellipse if rnd.random() < 0.5 else draw.rectangle)((x0, y0, x1, y1), fill=fill)
+    buf = BytesIO()
+    img.save(buf, 'PNG')
+    return buf.getvalue()
+
+
+class MockGPU:
+    """The generator: latency, failures, a concurrency limit and progress."""
+
+    def __init__(self, latency='lognormal:2500,0.35', concurrency=1, fail_rate=0.0, fail_modes=('error',),
+                 max_queue=0, seed=None, batch_cost=0.25):
+        self.sample = parse_latency(latency)
+        self.batch_cost = batch_cost
+        self.concurrency = concurrency
+        self.fail_rate = fail_rate
+        self.fail_modes = tuple(fail_modes)
+        for mode in self.fail_modes:
+            if mode not in FAIL_MODES:
+                raise ValueError('unknown fail mode {!r}; use {}'.format(mode, ', '.join(FAIL_MODES)))
+        self.max_queue = max_queue
+        self.rnd = random.Random(seed)
+        self._gpu = asyncio.Semaphore(concurrency)
+        self.waiting = 0
+        self.running = []  # [start, duration, steps] of jobs on the GPU
+        self.stats = {'requests': 0, 'images': 0, 'failures': 0, 'rejected': 0, 'busy_s': 0.0}
+
+    def _items(self, payload):
+        """[(prompt, seed)] for a payload: A1111's batch_size semantics (one
+        prompt, seeds seed, seed+1, ...) or per-item prompt/seed lists."""
+        n = max(1, int(payload.get('batch_size') or 1))
+        prompts = payload.get('prompt', '')
+        seeds = payload.get('seed')
+        if isinstance(prompts, list):
+            n = len(prompts)
+        else:
+            prompts = [str(prompts)] * n
+        if not isinstance(seeds, list):
+            base = -1 if seeds is None else int(seeds)
+            if base < 0:
+                base = self.rnd.getrandbits(31)
+            seeds = [base + i for i in range(n)]
+        if len(seeds) != n:
+            raise HTTPError(422, 'prompt and seed lists differ in length')
+        seeds = [self.rnd.getrandbits(31) if s is None or int(s) < 0 else int(s) for s in seeds]
+        return list(zip(prompts, seeds))
+
+    async def txt2img(self, payload):
+        """Generate a job's images; returns (png_list, seed_list). Raises
+        MockFailure. A batch of n costs 1 + batch_cost * (n - 1) times a
+        single image."""
+        self.stats['requests'] += 1
+        if self.max_queue and self.waiting >= self.max_queue:
+            self.stats['rejected'] += 1
+            raise HTTPError(503, 'queue full')
+        items = self._items(payload)
+        width = max(8, min(MAX_SIDE, int(payload.get('width') or 512)))
+        height = max(8, min(MAX_SIDE, int(payload.get('height') or 512)))
+        steps = int(payload.get('steps') or 20)
+        duration = self.sample(self.rnd) * (1 + self.batch_cost * (len(items) - 1))
+        failure = self.rnd.choice(self.fail_modes) if self.fail_rate and self.rnd.random() < self.fail_rate else None
+
+        if failure == 'hang':
+            # a lost response rather than a wedged GPU: other jobs carry on
+            await asyncio.sleep(HANG_S)
+        self.waiting += 1
+        try:
+            await self._gpu.acquire()
+        finally:
+            self.waiting -= 1
+        job = [time.monotonic(), duration, steps]
+        self.running.append(job)
+        try:
+            if failure == 'reset':
+                raise MockFailure(failure)
+            if failure == 'error':
+                await asyncio.sleep(duration * self.rnd.random())
+                raise MockFailure(failure)
+            pngs, _ = await asyncio.gather(
+                asyncio.to_thread(lambda: [render_png(p, s, width, height) for p, s in items]),
+                asyncio.sleep(duration))
+        except MockFailure:
+            self.stats['failures'] += 1
+            raise
+        finally:
+            self.running.remove(job)
+            self.stats['busy_s'] += time.monotonic() - job[0]
+            self._gpu.release()
+        seeds = [s for _, s in items]
+        if failure == 'empty':
+            self.stats['failures'] += 1
+            return [], seeds
+        self.stats['images'] += len(pngs)
+        return pngs, seeds
+
+    def progress(self):
+        """The /sdapi/v1/progress body for the oldest running job."""
+        state = {'skipped': False, 'interrupted': False, 'job': '', 'job_count': len(self.running) + self.waiting,
+                 'job_timestamp': '0', 'job_no': 0, 'sampling_step': 0, 'sampling_steps': 0}
+        out = {'progress': 0.0, 'eta_relative': 0.0, 'state': state, 'current_image': None, 'textinfo': None}
+        if self.running:
+            start, duration, steps = self.running[0]
+            elapsed = time.monotonic() - start
+            frac = min(1.0, elapsed / duration) if duration else 1.0
+            out['progress'] = round(frac, 4)
+            out['eta_relative'] = round(max(0.0, duration - elapsed), 3)
+            state['job'] = 'txt2img'
+            state['sampling_step'] = int(frac * steps)
+            state['sampling_steps'] = steps
+        return out
+
+
+class MockA1111Server:
+    def __init__(self, gpu):
+        self.gpu = gpu
+        self.server = None
+        self._writers = set()
+
+    async def start(self, host='127.0.0.1', port=7860):
+        self.server = await asyncio.start_server(self._handle, host, port, limit=httpio.MAX_HEADER_BYTES)
+        return self.server
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.server.close()
+        for writer in list(self._writers):
+            # idle keep-alive connections: let their handlers see EOF and exit
+            # rather than be cancelled mid-read when the loop shuts down
+            writer.close()
+        for _ in range(100):
+            if not self._writers:
+                break
+            await asyncio.sleep(0.01)
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            while True:
+                try:
+                    req = await httpio.read_request(reader)
+                except HTTPError as e:
+                    await httpio.send_error(writer, e.status, e.message)
+                    break
+                if req is None:
+                    break
+                path = req.path.split('?', 1)[0]
+                if path == '/sdapi/v1/progress':
+                    await httpio.send_json(writer, 200, self.gpu.progress(), req.keep_alive)
+                elif path == '/sdapi/v1/txt2img' and req.method == 'POST':
+                    try:
+                        payload = req.json()
+                        pngs, seeds = await self.gpu.txt2img(payload)
+                    except HTTPError as e:
+                        await httpio.send_error(writer, e.status, e.message, req.keep_alive)
+                        continue
+                    except MockFailure as e:
+                        if e.mode == 'reset':
+                            writer.transport.abort()
+                            return
+                        await httpio.send_json(writer, 500, {'error': 'RuntimeError', 'detail': '',
+                                                             'body': '', 'errors': 'injected failure'})
+                        break
+                    images = [base64.b64encode(png).decode('ascii') for png in pngs]
+                    info = json.dumps({'prompt': payload.get('prompt', ''), 'seed': seeds[0], 'all_seeds': seeds})
+                    await httpio.send_json(writer, 200, {'images': images, 'parameters': payload, 'info': info},
+                                           req.keep_alive)
+                else:
+                    await httpio.send_json(writer, 404, {'detail': 'Not Found'}, req.keep_alive)
+                if not req.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+
+class MockUpstream:
+    """The mock as an in-process passthrough upstream (no HTTP hop)."""
+
+    supports_batch = True
+
+    def __init__(self, gpu, timeout=60.0):
+        self.gpu = gpu
+        self.timeout = timeout
+
+    async def _call(self, payload):
+        try:
+            pngs, _ = await asyncio.wait_for(self.gpu.txt2img(payload), self.timeout)
+        except MockFailure as e:
+            raise HTTPError(502, 'Upstream A1111 failed ({})'.format(e.mode))
+        except TimeoutError:
+            raise HTTPError(502, 'Upstream A1111 service unavailable: timed out')
+        if not pngs:
+            raise HTTPError(502, 'Upstream A1111 response has no image')
+        return pngs
+
+    async def txt2img(self, payload):
+        return (await self._call(payload))[0]
+
+    async def txt2img_batch(self, payloads):
+        return await self._call(batch_payload(payloads))
+
+    async def close(self):
+        pass
+
+
+def gpu_from_env(env=None):
+    env = os.environ if env is None else env
+    seed = env.get('MOCK_SEED')
+    return MockGPU(
+        latency=env.get('MOCK_LATENCY', 'lognormal:2500,0.35'),
+        concurrency=int(env.get('MOCK_CONCURRENCY', 1)),
+        fail_rate=float(env.get('MOCK_FAIL_RATE', 0)),
+        fail_modes=[m for m in env.get('MOCK_FAIL_MODES', 'error').split(',') if m],
+        max_queue=int(env.get('MOCK_MAX_QUEUE', 0)),
+        seed=int(seed) if seed else None,
+        batch_cost=float(env.get('MOCK_BATCH_COST', 0.25)),
+    )
+
+
+def create_upstream(settings):
+    return MockUpstream(gpu_from_env(), settings.a1111_timeout)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Mock Automatic1111 txt2img/progress server')
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=7860)
+    ap.add_argument('--latency', default='lognormal:2500,0.35', help='see parse_latency(); times in ms')
+    ap.add_argument('--concurrency', type=int, default=1, help='jobs generated at once (1 = one GPU)')
+    ap.add_argument('--max-queue', type=int, default=0, help='503 once this many wait (0 = unbounded)')
+    ap.add_argument('--fail-rate', type=float, default=0.0)
+    ap.add_argument('--fail-modes', default='error', help='comma list of ' + ','.join(FAIL_MODES))
+    ap.add_argument('--batch-cost', type=float, default=0.25, help='extra latency per additional batch item')
+    ap.add_argument('--seed', type=int, help='seed for latency/failure draws (reproducible runs)')
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    async def run():
+        gpu = MockGPU(args.latency, args.concurrency, args.fail_rate, args.fail_modes.split(','),
+                      args.max_queue, args.seed, args.batch_cost)
+        server = MockA1111Server(gpu)
+        await server.start(args.host, args.port)
+        log.info('mock A1111 on %s:%d (latency %s, concurrency %d, fail rate %.3f)', args.host, server.port,
+                 args.latency, args.concurrency, args.fail_rate)
+        async with server.server:
+            await server.server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,374 @@
+"""The passthrough HTTP server.
+
+    POST /sdapi/v1/txt2img   A1111 txt2img payload in, RGB565 frame out
+    GET  /health             status and counters (probed by the device)
+
+txt2img forwards the payload to the upstream, decodes the returned PNG
+and renders it into an RGB565 frame off the event loop (convpool.py, a
+process pool by default), and streams it as application/octet-stream with
+an exact Content-Length and X-Image-Width / X-Image-Height /
+X-Image-Format headers (response option A in the passthrough doc). A
+client that accepts JSON but not octet-stream gets option B instead:
+{"images": [<base64 RGB565>], ...}.
+
+The frame is sized for the asking panel: X-Display-Width, X-Display-Height
+and X-Display-Format (one of convert.PIXEL_FORMATS) when the device sends
+them, TARGET_WIDTH x TARGET_HEIGHT rgb565-be otherwise. A negotiated size
+gets the centred crop of the image with its aspect ratio; the configured
+one is stretched as the passthrough doc's converter does. The output is not
+part of the generation: panels asking for the same seeded payload share
+one upstream job, and each gets its own variant rendered from the decoded
+image.
+
+Frames for seeded payloads are cached (cache.py), and so are recently
+decoded generations, which later variants are rendered from. Identical
+seeded requests arriving while one is generating share that generation
+(singleflight.py). X-Cache says whether a response was a hit-mem,
+hit-disk, variant (rendered from a cached generation), inflight (joined a
+running generation), miss, or bypass (no seed: neither cached nor shared).
+
+With BATCH_WINDOW_MS set and an upstream that takes per-item batches,
+generations from different requests are grouped into upstream batches
+(batcher.py).
+
+Generations go through admission control (admission.py): at most
+MAX_WORKERS at once, QUEUE_SIZE waiting by X-Priority, and a 503 with
+Retry-After and X-Queue-Position for the rest.
+"""
+import asyncio
+import base64
+import contextlib
+import hmac
+import logging
+import time
+from collections import namedtuple
+
+from . import httpio
+from .admission import PRIORITY_INTERACTIVE, Admission, request_priority
+from .batcher import MicroBatcher
+from .cache import FrameCache, ImageCache, cache_key, generation_key
+from .convert import PIXEL_FORMATS
+from .convpool import make_converter
+from .httpio import HTTPError
+from .singleflight import SingleFlight
+from .upstream import load_upstream
+
+log = logging.getLogger('passthrough')
+
+TXT2IMG_PATH = '/sdapi/v1/txt2img'
+STREAM_CHUNK = 16 * 1024
+# How often a request waiting on a generation checks for a client disconnect
+DISCONNECT_POLL_S = 0.25
+# Largest panel side a device may ask for
+MAX_OUTPUT_SIDE = 1024
+DEFAULT_FORMAT = 'rgb565-be'
+
+# What one panel wants: width x height pixels in a PIXEL_FORMATS format,
+# cropped to its aspect ratio (crop) or stretched to it
+Output = namedtuple('Output', 'width height fmt crop')
+
+
+class PassthroughServer:
+    def __init__(self, settings, upstream=None):
+        self.settings = settings
+        self.upstream = upstream if upstream is not None else load_upstream(settings)
+        self.converter = make_converter(settings)
+        self.cache = None
+        if settings.cache_mem_mb or settings.cache_dir:
+            self.cache = FrameCache(settings.cache_mem_mb << 20, settings.cache_dir, settings.cache_disk_mb << 20)
+        self.images = ImageCache(settings.image_cache_mb << 20) if settings.image_cache_mb > 0 else None
+        self.server = None
+        # inflight shares whole frames (same payload, same output);
+        # generating shares generations across outputs
+        self.inflight = SingleFlight() if settings.singleflight else None
+        self.generating = SingleFlight() if settings.singleflight else None
+        self.batcher = None
+        if settings.batch_window_ms > 0:
+            if getattr(self.upstream, 'supports_batch', False):
+                self.batcher = MicroBatcher(self._upstream_batch, settings.batch_window_ms, settings.batch_max)
+            else:
+                log.warning('BATCH_WINDOW_MS is set but the upstream does not take per-item batches '
+                            '(UPSTREAM_BATCH); batching is off')
+        self.admission = None
+        if settings.max_workers > 0:
+            # MAX_WORKERS counts upstream calls; a batched call carries up to
+            # BATCH_MAX requests
+            workers = settings.max_workers * (settings.batch_max if self.batcher else 1)
+            self.admission = Admission(workers, settings.queue_size, settings.queue_max_wait_s)
+        self.stats = {'requests': 0, 'upstream_calls': 0, 'generations': 0, 'frames': 0, 'errors': 0,
+                      'upstream_ms': 0.0, 'decode_ms': 0.0, 'convert_ms': 0.0, 'abandoned': 0}
+
+    async def start(self, host=None, port=None):
+        starter = getattr(self.upstream, 'start', None)
+        if starter is not None:
+            await starter()
+        await self.converter.start()
+        self.server = await asyncio.start_server(
+            self._handle, host or self.settings.service_host,
+            self.settings.service_port if port is None else port,
+            limit=httpio.MAX_HEADER_BYTES)
+        return self.server
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        log.info('listening on %s:%d, upstream %s', self.settings.service_host, self.port, self._upstream_name())
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        await self.upstream.close()
+        await self.converter.close()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    req = await httpio.read_request(reader)
+                except HTTPError as e:
+                    await httpio.send_error(writer, e.status, e.message)
+                    break
+                if req is None:
+                    break
+                self.stats['requests'] += 1
+                try:
+                    await self._route(req, reader, writer)
+                except HTTPError as e:
+                    self.stats['errors'] += 1
+                    log.warning('%s %s -> %d %s', req.method, req.path, e.status, e.message)
+                    await httpio.send_error(writer, e.status, e.message, req.keep_alive, e.headers)
+                except ConnectionError:
+                    raise
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    log.exception('%s %s failed', req.method, req.path)
+                    await httpio.send_error(writer, 500, 'Internal error: {}'.format(e))
+                    break
+                if not req.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, req, reader, writer):
+        path = req.path.split('?', 1)[0]
+        if path == TXT2IMG_PATH:
+            if req.method != 'POST':
+                raise HTTPError(405, 'use POST')
+            return await self.txt2img(req, reader, writer)
+        if path == '/health':
+            return await httpio.send_json(writer, 200, self.health(), req.keep_alive)
+        raise HTTPError(404, 'not found: {}'.format(path))
+
+    def _check_key(self, req):
+        key = self.settings.service_api_key
+        if key and not hmac.compare_digest(req.headers.get('x-api-key', ''), key):
+            raise HTTPError(401, 'missing or wrong X-API-Key')
+
+    def _output(self, req):
+        """The Output the requesting panel wants, from its X-Display-*
+        headers; the configured TARGET_* size and rgb565-be by default."""
+        s = self.settings
+        h = req.headers
+        negotiated = bool(h.get('x-display-width') or h.get('x-display-height'))
+        try:
+            width = int(h.get('x-display-width') or s.target_width)
+            height = int(h.get('x-display-height') or s.target_height)
+        except ValueError:
+            raise HTTPError(400, 'X-Display-Width / X-Display-Height must be integers')
+        if not (0 < width <= MAX_OUTPUT_SIDE and 0 < height <= MAX_OUTPUT_SIDE):
+            raise HTTPError(400, 'display size must be 1..{} per side'.format(MAX_OUTPUT_SIDE))
+        fmt = h.get('x-display-format', DEFAULT_FORMAT).strip().lower() or DEFAULT_FORMAT
+        if fmt not in PIXEL_FORMATS:
+            raise HTTPError(400, 'X-Display-Format must be one of {}'.format(', '.join(PIXEL_FORMATS)))
+        return Output(width, height, fmt, negotiated)
+
+    async def render(self, payload):
+        """Generate and decode one image; returns a convert.Decoded."""
+        t0 = time.perf_counter()
+        if self.batcher is not None:
+            png = await self.batcher.submit(payload)
+        else:
+            self.stats['upstream_calls'] += 1
+            png = await self.upstream.txt2img(payload)
+        t1 = time.perf_counter()
+        try:
+            decoded = await self.converter.decode(png)
+        except OSError as e:
+            raise HTTPError(422, 'Failed to process image: {}'.format(e))
+        t2 = time.perf_counter()
+        self.stats['upstream_ms'] += (t1 - t0) * 1000
+        self.stats['decode_ms'] += (t2 - t1) * 1000
+        log.info('generation: upstream %.0f ms, decode %.1f ms', (t1 - t0) * 1000, (t2 - t1) * 1000)
+        return decoded
+
+    async def _variant(self, decoded, out):
+        """Render a decoded generation for one panel; returns the frame."""
+        t0 = time.perf_counter()
+        frame = await self.converter.render(decoded, out.width, out.height, self.settings.luminance_invert, out.fmt,
+                                            out.crop)
+        self.stats['convert_ms'] += (time.perf_counter() - t0) * 1000
+        self.stats['frames'] += 1
+        return frame
+
+    async def _upstream_batch(self, payloads):
+        self.stats['upstream_calls'] += 1
+        if len(payloads) == 1:
+            return [await self.upstream.txt2img(payloads[0])]
+        return await self.upstream.txt2img_batch(payloads)
+
+    async def txt2img(self, req, reader, writer):
+        self._check_key(req)
+        payload = req.json()
+        if not isinstance(payload, dict) or not payload.get('prompt'):
+            raise HTTPError(400, 'payload needs a prompt')
+        out = self._output(req)
+        key = cache_key(payload, out.width, out.height, self.settings.luminance_invert, out.fmt, out.crop)
+        hit = self.cache.get(key) if key and self.cache else None
+        if hit and hit[0] == 'disk':
+            try:
+                return await self._send_file(req, writer, payload, out, hit[1], hit[2])
+            except FileNotFoundError:
+                self.cache.forget(key)
+                hit = None
+        if hit:
+            return await self._send_frame(req, writer, payload, out, hit[1], 'hit-mem')
+        priority = request_priority(req.headers)
+        gen = generation_key(payload)
+        if key and self.inflight is not None:
+            job = self._shared(key, gen, payload, out, priority)
+        else:
+            job = self._frame(key, gen, payload, out, priority)
+        try:
+            frame, source = await self._unless_gone(reader, job)
+        except TimeoutError:
+            raise HTTPError(504, 'timed out waiting for the generation')
+        await self._send_frame(req, writer, payload, out, frame, source)
+        if key and self.cache:
+            await self.cache.save(key, frame)
+
+    async def _frame(self, key, gen, payload, out, priority=PRIORITY_INTERACTIVE):
+        decoded, source = await self._decoded(gen, payload, priority)
+        frame = await self._variant(decoded, out)
+        if key and self.cache:
+            self.cache.put(key, frame)
+        return frame, source
+
+    async def _decoded(self, gen, payload, priority=PRIORITY_INTERACTIVE):
+        """The decoded generation for payload and where it came from."""
+        if gen is None:
+            return await self._generate(None, payload, priority), 'bypass'
+        decoded = self.images.get(gen) if self.images is not None else None
+        if decoded is not None:
+            return decoded, 'variant'
+        if self.generating is None:
+            return await self._generate(gen, payload, priority), 'miss'
+        # no timeout here: the frame-level wait in _shared() bounds it
+        joined = self.generating.running(gen)
+        decoded = await self.generating.do(gen, lambda: self._generate(gen, payload, priority))
+        return decoded, 'inflight' if joined else 'miss'
+
+    async def _generate(self, gen, payload, priority=PRIORITY_INTERACTIVE):
+        slot = self.admission.slot(priority) if self.admission else contextlib.nullcontext()
+        async with slot:
+            decoded = await self.render(payload)
+        self.stats['generations'] += 1
+        if gen and self.images is not None:
+            self.images.put(gen, decoded)
+        return decoded
+
+    async def _shared(self, key, gen, payload, out, priority=PRIORITY_INTERACTIVE):
+        # checked in the same step as do() registers, so the label is exact
+        joined = self.inflight.running(key)
+        frame, source = await self.inflight.do(key, lambda: self._frame(key, gen, payload, out, priority),
+                                               self.settings.inflight_timeout or None)
+        return frame, 'inflight' if joined else source
+
+    async def _unless_gone(self, reader, coro):
+        """Await coro, but give up (cancelling it) if the client disconnects
+        first: a device that timed out should not keep a generation alive.
+        EOF shows up in the reader's buffer state, so nothing is consumed."""
+        task = asyncio.ensure_future(coro)
+        while True:
+            done, _ = await asyncio.wait((task,), timeout=DISCONNECT_POLL_S)
+            if done:
+                return task.result()
+            if reader.at_eof():
+                task.cancel()
+                self.stats['abandoned'] += 1
+                raise ConnectionResetError('client disconnected while waiting')
+
+    def _wants_json(self, req):
+        accept = req.headers.get('accept', '')
+        return 'json' in accept and 'octet-stream' not in accept
+
+    def _frame_headers(self, out, size, source):
+        return {
+            'Content-Type': 'application/octet-stream',
+            'Content-Length': str(size),
+            'X-Image-Width': str(out.width),
+            'X-Image-Height': str(out.height),
+            'X-Image-Format': out.fmt,
+            'X-Cache': source,
+        }
+
+    async def _send_frame(self, req, writer, payload, out, frame, source):
+        if self._wants_json(req):
+            return await self._send_json_frame(req, writer, payload, out, frame)
+        writer.write(httpio.response_head(200, self._frame_headers(out, len(frame), source), req.keep_alive))
+        view = memoryview(frame)
+        for i in range(0, len(view), STREAM_CHUNK):
+            writer.write(view[i:i + STREAM_CHUNK])
+            await writer.drain()
+
+    async def _send_file(self, req, writer, payload, out, path, size):
+        """Serve a disk-tier hit; the frame goes file -> socket via sendfile."""
+        with open(path, 'rb') as f:
+            if self._wants_json(req):
+                return await self._send_json_frame(req, writer, payload, out, await asyncio.to_thread(f.read))
+            writer.write(httpio.response_head(200, self._frame_headers(out, size, 'hit-disk'), req.keep_alive))
+            await writer.drain()
+            await asyncio.get_running_loop().sendfile(writer.transport, f, 0, size)
+
+    async def _send_json_frame(self, req, writer, payload, out, frame):
+        await httpio.send_json(writer, 200, {
+            'images': [base64.b64encode(frame).decode('ascii')],
+            'parameters': payload,
+            'info': '{}x{} {} format for Pico LCD'.format(
+                out.width, out.height, 'RGB565' if out.fmt == DEFAULT_FORMAT else out.fmt.upper()),
+        }, req.keep_alive)
+
+    def _upstream_name(self):
+        s = self.settings
+        return s.upstream or s.a1111_backends or s.a1111_base_url
+
+    def health(self):
+        out = {'status': 'ok', 'upstream': self._upstream_name()}
+        out.update(self.stats)
+        pool = getattr(self.upstream, 'pool', None)
+        if pool is not None:
+            out['upstream_connections'] = {'opened': pool.opened, 'reused': pool.reused}
+        info = getattr(self.upstream, 'info', None)
+        if info is not None:
+            out['upstream_pool'] = info()
+        out['convert'] = self.converter.info()
+        if self.cache is not None:
+            out['cache'] = self.cache.info()
+        if self.images is not None:
+            out['image_cache'] = self.images.info()
+        if self.batcher is not None:
+            out['batching'] = self.batcher.info()
+        if self.admission is not None:
+            out['admission'] = self.admission.info()
+        if self.inflight is not None:
+            out['singleflight'] = dict(self.inflight.stats, inflight=self.inflight.inflight(),
+                                       generations=dict(self.generating.stats, inflight=self.generating.inflight()))
+        return out
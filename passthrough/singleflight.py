@@ -0,0 +1,68 @@
+"""Single-flight: one upstream generation per key, however many ask for it.
+
+A double-press on one device, or several devices landing on the same seeded
+payload, would otherwise each start a generation while the first is still
+running (the frame cache only helps once it has finished). SingleFlight
+tracks in-flight jobs by key: the first caller starts the job, later
+callers attach to the same task and all get the same result or exception.
+
+Each waiter can give up on its own (timeout, or its client going away)
+without affecting the others; the shared job is cancelled only when its
+last waiter leaves.
+"""
+import asyncio
+
+
+class _Call:
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self.stats = {'started': 0, 'joined': 0, 'abandoned': 0, 'cancelled': 0}
+
+    def inflight(self):
+        return len(self._calls)
+
+    def running(self, key):
+        return key in self._calls
+
+    async def do(self, key, factory, timeout=None):
+        """Await the job for key, starting factory() if none is running.
+
+        timeout (seconds) bounds this waiter only; on expiry it raises
+        TimeoutError and the job keeps running for the others."""
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _, key=key, call=call: self._done(key, call))
+            self.stats['started'] += 1
+        else:
+            self.stats['joined'] += 1
+        call.waiters += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(call.task), timeout)
+        except BaseException:
+            if not call.task.done():
+                self.stats['abandoned'] += 1
+            raise
+        finally:
+            call.waiters -= 1
+            if not call.waiters and not call.task.done():
+                self.stats['cancelled'] += 1
+                self._done(key, call)
+                call.task.cancel()
+
+    def _done(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if call.task.done() and not call.task.cancelled():
+            # retrieved here so a job nobody waits for any more does not
+            # log "exception was never retrieved"
+            call.task.exception()
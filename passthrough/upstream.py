@@ -0,0 +1,101 @@
+"""Upstream image generators.
+
+An upstream is any object with
+
+    async def txt2img(self, payload) -> bytes     # PNG bytes
+    async def close(self)
+
+optionally async start() (called once the server's loop runs) and info()
+(extra /health detail), and optionally, for micro-batching (batcher.py),
+
+    supports_batch = True
+    async def txt2img_batch(self, payloads) -> [bytes]   # one PNG per payload
+
+A1111Upstream talks to an Automatic1111 webui (or anything speaking its
+/sdapi/v1/txt2img API, such as a local mock) over the shared keep-alive
+ConnectionPool. UPSTREAM=module:factory in the environment swaps in another
+implementation; factory(settings) returns the upstream.
+
+Stock A1111 takes a single prompt and seed per call (batch_size just
+continues the seed), so batching to it needs a backend that accepts
+per-item prompt/seed lists; UPSTREAM_BATCH=true declares that it does.
+"""
+import asyncio
+import base64
+import importlib
+import json
+
+from .httpio import ConnectionPool, HTTPError
+
+TXT2IMG_PATH = '/sdapi/v1/txt2img'
+
+
+class A1111Upstream:
+    def __init__(self, settings, pool=None):
+        self.settings = settings
+        self.supports_batch = settings.upstream_batch
+        self.pool = pool or ConnectionPool(settings.a1111_base_url, settings.upstream_pool_size,
+                                           settings.a1111_timeout)
+        self.headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+        if settings.a1111_username and settings.a1111_password:
+            creds = '{}:{}'.format(settings.a1111_username, settings.a1111_password).encode('utf-8')
+            self.headers['Authorization'] = 'Basic ' + base64.b64encode(creds).decode('ascii')
+
+    async def _post(self, payload):
+        """POST a txt2img payload; returns the decoded PNGs."""
+        body = json.dumps(payload).encode('utf-8')
+        try:
+            status, _, data = await self.pool.request('POST', TXT2IMG_PATH, body, self.headers)
+        except (OSError, TimeoutError, asyncio.IncompleteReadError) as e:
+            raise HTTPError(502, 'Upstream A1111 service unavailable: {}'.format(e or type(e).__name__))
+        if status == 401:
+            raise HTTPError(401, 'Invalid A1111 credentials')
+        if status != 200:
+            raise HTTPError(502, 'Upstream A1111 returned HTTP {}'.format(status))
+        try:
+            images = json.loads(data)['images']
+        except (ValueError, KeyError, TypeError):
+            images = None
+        if not images or not isinstance(images, list):
+            raise HTTPError(502, 'Upstream A1111 response has no image')
+        # data:image/png;base64,...
+        return [base64.b64decode(i.split(',', 1)[1] if ',' in i[:64] else i) for i in images]
+
+    async def txt2img(self, payload):
+        return (await self._post(payload))[0]
+
+    async def txt2img_batch(self, payloads):
+        images = await self._post(batch_payload(payloads))
+        if len(images) == len(payloads) + 1:
+            # A1111 puts a grid of the batch first unless grids are disabled
+            images = images[1:]
+        if len(images) != len(payloads):
+            raise HTTPError(502, 'Upstream A1111 returned {} images for a batch of {}'.format(
+                len(images), len(payloads)))
+        return images
+
+    async def close(self):
+        await self.pool.close()
+
+
+def batch_payload(payloads):
+    """One upstream payload for compatible payloads (same everything but
+    prompt and seed): per-item "prompt" and "seed" lists plus batch_size."""
+    out = {k: v for k, v in payloads[0].items() if k not in ('prompt', 'seed')}
+    out['prompt'] = [p.get('prompt', '') for p in payloads]
+    out['seed'] = [p.get('seed', -1) for p in payloads]
+    out['batch_size'] = len(payloads)
+    return out
+
+
+def load_upstream(settings):
+    """The configured upstream: settings.upstream (module:factory), a pool
+    of A1111 backends (A1111_BACKENDS) or a single A1111."""
+    if not settings.upstream:
+        if settings.a1111_backends:
+            from .backends import BackendPool
+            return BackendPool(settings)
+        return A1111Upstream(settings)
+    module, _, attr = settings.upstream.partition(':')
+    factory = getattr(importlib.import_module(module), attr or 'create_upstream')
+    return factory(settings)
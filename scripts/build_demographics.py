@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Pack demographics.json into the compact demographics.bin store.
+
+The device reads demographics.bin with seek() (micropython/demostore.py), so
+picking a value costs two small reads instead of keeping every category's
+value list resident in RAM. demographics.json remains the source of truth:
+
+    python scripts/build_demographics.py            # writes micropython/demographics.bin
+    python scripts/build_demographics.py --out x.bin
+    python scripts/build_demographics.py --check-sampling 200000
+
+The store records the JSON's size and CRC32 so the device can tell when
+demographics.json was edited after the .bin was built and fall back to it.
+Every value is read back through DemographicsStore after writing. Alias
+tables for categories with "weights" are built here, so the device does not
+build them at boot. --check-sampling draws from every category through the
+packed store, with and without a recency window, and chi-square tests the
+observed frequencies against the expected (conditional) distribution.
+"""
+import argparse
+import json
+import math
+import random
+import struct
+import sys
+import zlib
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO / 'micropython'))
+
+from demostore import (  # noqa: E402
+    ALIAS_REC, ENTRY_SIZE, FLAG_WEIGHTED, HEADER_SIZE, MAGIC, VERSION, DemographicsStore, build_alias,
+)
+
+
+def pack(src_bytes):
+    """Return the packed store for the JSON document in src_bytes."""
+    cats = json.loads(src_bytes).get('categories') or {}
+    keys = list(cats.keys())
+    for key in keys:
+        if len(key) != 1 or ord(key) > 127:
+            raise ValueError('category keys must be single ASCII characters: {!r}'.format(key))
+    if len(keys) > 255:
+        raise ValueError('too many categories')
+
+    names = bytearray()
+    name_offs = []
+    base = HEADER_SIZE + ENTRY_SIZE * len(keys)
+    for key in keys:
+        name = (cats[key].get('name') or '').encode('utf-8')[:255]
+        name_offs.append(base + len(names))
+        names += bytes([len(name)]) + name
+
+    values = [[str(v).encode('utf-8') for v in (cats[k].get('values') or [])] for k in keys]
+    tables = []
+    for key, vals in zip(keys, values):
+        if len(vals) > 0xFFFF:
+            raise ValueError('category {} has more than 65535 values'.format(key))
+        weights = cats[key].get('weights')
+        if weights is None:
+            tables.append(None)
+            continue
+        if len(weights) != len(vals):
+            raise ValueError('category {}: {} weights for {} values'.format(key, len(weights), len(vals)))
+        tables.append(build_alias(weights))
+
+    index_base = base + len(names)
+    index_offs = []
+    off = index_base
+    for vals, table in zip(values, tables):
+        index_offs.append(off)
+        off += 4 * (len(vals) + 1)
+        if table:
+            off += ALIAS_REC * len(vals)
+    strings_base = off
+
+    index = bytearray()
+    strings = bytearray()
+    for vals, table in zip(values, tables):
+        for v in vals:
+            index += struct.pack('<I', strings_base + len(strings))
+            strings += v
+        index += struct.pack('<I', strings_base + len(strings))
+        if table:
+            for prob, alias, norm in zip(*table):
+                index += struct.pack('<IIH', prob, norm, alias)
+
+    out = bytearray(struct.pack('<4sBBHII', MAGIC, VERSION, len(keys), 0,
+                                len(src_bytes), zlib.crc32(src_bytes) & 0xFFFFFFFF))
+    for key, vals, table, name_off, index_off in zip(keys, values, tables, name_offs, index_offs):
+        flags = FLAG_WEIGHTED if table else 0
+        out += struct.pack('<BBHII', ord(key), flags, len(vals), name_off, index_off)
+    out += names + index + strings
+    return bytes(out)
+
+
+def verify(packed, src_bytes):
+    cats = json.loads(src_bytes).get('categories') or {}
+    store = DemographicsStore(packed)
+    assert store.keys() == list(cats.keys())
+    for key, cat in cats.items():
+        assert store.name(key) == (cat.get('name') or '')
+        vals = cat.get('values') or []
+        assert store.count(key) == len(vals)
+        for i, v in enumerate(vals):
+            assert store.value(key, i) == str(v), (key, i)
+        assert store._weighted(key) == ('weights' in cat)
+
+
+def _chi2_critical(df, z=3.09):
+    """Upper chi-square quantile (Wilson-Hilferty); z=3.09 is p = 0.001."""
+    c = 2.0 / (9 * df)
+    return df * (1 - c + z * math.sqrt(c)) ** 3
+
+
+def check_sampling(packed, src_bytes, draws, seed=1):
+    """Chi-square test every category's sample() against its distribution.
+
+    Runs once with no exclusions and once excluding the first value (or the
+    first two for larger categories), where the expected distribution is the
+    weights renormalised over the remaining values. Returns False if any
+    test rejects at p = 0.001.
+    """
+    random.seed(seed)
+    cats = json.loads(src_bytes).get('categories') or {}
+    store = DemographicsStore(packed)
+    ok = True
+    for key, cat in cats.items():
+        n = len(cat.get('values') or [])
+        if n < 2:
+            continue
+        weights = cat.get('weights') or [1] * n
+        for recent in ((), tuple(range(min(2, n - 1)))):
+            expected = [0 if i in recent else w for i, w in enumerate(weights)]
+            total = float(sum(expected))
+            counts = [0] * n
+            for _ in range(draws):
+                counts[store.sample(key, recent)] += 1
+            chi2 = 0.0
+            df = -1
+            for i in range(n):
+                e = draws * expected[i] / total
+                if e == 0:
+                    if counts[i]:
+                        print('  {} recent={}: drew excluded/zero-weight index {}'.format(key, recent, i))
+                        ok = False
+                    continue
+                chi2 += (counts[i] - e) ** 2 / e
+                df += 1
+            crit = _chi2_critical(max(df, 1))
+            passed = chi2 <= crit
+            ok = ok and passed
+            print('  {} recent={}: chi2={:.1f} df={} critical={:.1f} {}'.format(
+                key, list(recent), chi2, df, crit, 'ok' if passed else 'FAIL'))
+    return ok
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--src', default=str(REPO / 'micropython/demographics.json'))
+    ap.add_argument('--out', default=str(REPO / 'micropython/demographics.bin'))
+    ap.add_argument('--check-sampling', type=int, metavar='DRAWS', default=0,
+                    help='chi-square test sample() with this many draws per category')
+    args = ap.parse_args()
+
+    src_bytes = Path(args.src).read_bytes()
+    packed = pack(src_bytes)
+    verify(packed, src_bytes)
+    Path(args.out).write_bytes(packed)
+    print('Wrote {} ({} bytes from {} bytes of JSON)'.format(args.out, len(packed), len(src_bytes)))
+    if args.check_sampling and not check_sampling(packed, src_bytes, args.check_sampling):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+# Usage: ./scripts/build_mpy.sh [extra mpy-cross args]
+#
+# Precompiles the app modules in micropython/ to .mpy bytecode with mpy-cross
+# so the Pico does not compile them from source (seconds of CPU and a
+# fragmented heap) on every boot. Output goes to build/mpy/, laid out exactly
+# like the device filesystem, ready for ./scripts/deploy_pico.sh --mpy.
+#
+# main.py stays as source because it is the boot entrypoint; dev helpers and
+# the on-device benchmarks stay as source too. Modules are compiled with
+# -O1 like the frozen manifest, which strips asserts and `if __debug__:`
+# blocks (the hot-path debug logs); MPY_OPT=-O0 keeps them for debugging.
+# Extra arguments are passed to mpy-cross.
+#
+# mpy-cross comes from the MicroPython tree (see custom_micropython.md) or
+# from PyPI: pip install mpy-cross. Its version must match the firmware's
+# .mpy ABI; check with `mpy-cross --version`.
+
+if [ ! -d micropython ]; then
+  echo "micropython/ folder not found. Run from repo root."
+  exit 1
+fi
+
+MPY_CROSS=${MPY_CROSS:-mpy-cross}
+MPY_OPT=${MPY_OPT:--O1}
+if ! command -v "$MPY_CROSS" >/dev/null 2>&1; then
+  echo "mpy-cross not found. Install it with: pip install mpy-cross" >&2
+  exit 1
+fi
+
+OUT=build/mpy
+rm -rf "$OUT"
+mkdir -p "$OUT/assets" "$OUT/images"
+
+echo "Compiling with $($MPY_CROSS --version), $MPY_OPT"
+for py_file in micropython/*.py; do
+    name=$(basename "$py_file")
+    case "$name" in
+        manifest.py)
+            # firmware build input, not a device module
+            ;;
+        main.py|app_stub.py|test_draw.py|bench_*.py)
+            cp "$py_file" "$OUT/$name"
+            echo "  copied   $name"
+            ;;
+        *)
+            "$MPY_CROSS" "$MPY_OPT" "$@" -o "$OUT/${name%.py}.mpy" "$py_file"
+            echo "  compiled $name -> ${name%.py}.mpy ($(wc -c < "$OUT/${name%.py}.mpy") bytes, source $(wc -c < "$py_file") bytes)"
+            ;;
+    esac
+done
+
+for json_file in micropython/*.json; do
+    if [[ "$json_file" != *"secrets.local.json" ]]; then
+        cp "$json_file" "$OUT/"
+    fi
+done
+cp micropython/assets/* "$OUT/assets/" 2>/dev/null || true
+python scripts/build_demographics.py --out "$OUT/demographics.bin"
+
+echo "Build complete: $OUT"
@@ -1,16 +1,20 @@
 WIPE=0
-FIRST_ARG=${1:-}
-if [ "${FIRST_ARG}" = "--wipe" ]; then
-    WIPE=1
-    # shift positional args so caller can pass serial as second arg
-    shift
-fi
+MPY=0
+# Leading flags: --wipe (clear the device first), --mpy (deploy precompiled
+# bytecode from ./scripts/build_mpy.sh). Shifted so the serial port can follow.
+while [ $# -gt 0 ]; do
+    case "$1" in
+        --wipe) WIPE=1; shift ;;
+        --mpy) MPY=1; shift ;;
+        *) break ;;
+    esac
+done
 
 SERIAL=${1:-serial://auto}
 #!/usr/bin/env bash
 set -euo pipefail
 
-# Usage: ./scripts/deploy_pico.sh [serial_port]
+# Usage: ./scripts/deploy_pico.sh [--wipe] [--mpy] [serial_port]
 SERIAL=${1:-serial://auto}
 
 if [ ! -d micropython ]; then
@@ -18,6 +22,12 @@ if [ ! -d micropython ]; then
   exit 1
 fi
 
+SRC=micropython
+if [ "$MPY" -eq 1 ]; then
+    ./scripts/build_mpy.sh
+    SRC=build/mpy
+fi
+
 echo "Deploying micropython/ to $SERIAL using robust exec method from pico_tips.md"
 
 # Function to upload a file using the robust exec fallback
@@ -34,6 +44,44 @@ subprocess.run(['python','-m','mpremote','connect','$SERIAL','exec', exec_cmd],
 PY
 }
 
+# Upload a binary file via base64 chunks decoded on the device
+upload_binary() {
+    local src_file="$1"
+    local dest_file="$2"
+    echo "Uploading binary $src_file as $dest_file via base64"
+    python - <<PY
+import base64
+import subprocess
+from pathlib import Path
+
+binary_data = Path('$src_file').read_bytes()
+b64_data = base64.b64encode(binary_data).decode('ascii')
+
+# Split into chunks to avoid command line length limits
+chunk_size = 3000
+chunks = [b64_data[i:i+chunk_size] for i in range(0, len(b64_data), chunk_size)]
+
+# Clear any existing file and write chunks
+subprocess.run(['python', '-m', 'mpremote', 'connect', '$SERIAL', 'exec',
+               "open('$dest_file.b64', 'w').close()"], check=True)
+
+for i, chunk in enumerate(chunks):
+    cmd = f"f = open('$dest_file.b64', 'a'); f.write({chunk!r}); f.close()"
+    subprocess.run(['python', '-m', 'mpremote', 'connect', '$SERIAL', 'exec', cmd], check=True)
+
+# Decode base64 to binary on device
+decode_cmd = f"""
+import ubinascii, os
+b64_content = open('$dest_file.b64', 'r').read()
+with open('$dest_file', 'wb') as f:
+    f.write(ubinascii.a2b_base64(b64_content))
+os.remove('$dest_file.b64')
+print('Binary $dest_file installed')
+"""
+subprocess.run(['python', '-m', 'mpremote', 'connect', '$SERIAL', 'exec', decode_cmd], check=True)
+PY
+}
+
 if [ "$WIPE" -eq 1 ]; then
     echo "Wiping device filesystem (optional) on $SERIAL"
     # Run a conservative wipe: attempt to remove everything under /, but ignore errors.
@@ -68,22 +116,47 @@ fi
 
 # Upload all Python files
 echo "Uploading Python modules..."
-for py_file in micropython/*.py; do
-    if [ -f "$py_file" ]; then
+for py_file in $SRC/*.py; do
+    # manifest.py is a firmware build input, not a device module
+    if [ -f "$py_file" ] && [ "$(basename "$py_file")" != "manifest.py" ]; then
         basename_file=$(basename "$py_file")
         upload_file "$py_file" "$basename_file"
     fi
 done
 
+# Upload precompiled modules. MicroPython imports a .py in preference to a
+# .mpy of the same name, so remove any stale source copy from the device.
+if [ "$MPY" -eq 1 ]; then
+    echo "Uploading precompiled .mpy modules..."
+    for mpy_file in $SRC/*.mpy; do
+        basename_file=$(basename "$mpy_file")
+        upload_binary "$mpy_file" "$basename_file"
+        python -m mpremote connect $SERIAL exec "import os
+try:
+    os.remove('${basename_file%.mpy}.py')
+    print('Removed stale ${basename_file%.mpy}.py')
+except OSError:
+    pass
+"
+    done
+fi
+
 # Upload JSON config files
 echo "Uploading configuration files..."
-for json_file in micropython/*.json; do
+for json_file in $SRC/*.json; do
     if [ -f "$json_file" ] && [[ "$json_file" != *"secrets.local.json" ]]; then
         basename_file=$(basename "$json_file")
         upload_file "$json_file" "$basename_file"
     fi
 done
 
+# Pack demographics.json into the compact store the device reads with seek()
+echo "Uploading demographics store..."
+if [ "$MPY" -eq 0 ]; then
+    python scripts/build_demographics.py
+fi
+upload_binary "$SRC/demographics.bin" "demographics.bin"
+
 # Create directories
 echo "Creating directories..."
 python -m mpremote connect $SERIAL exec "
@@ -108,46 +181,11 @@ except OSError as e:
 
 # Upload assets (binary files need base64 encoding)
 echo "Uploading assets..."
-if [ -d "micropython/assets" ]; then
-    for asset_file in micropython/assets/*; do
+if [ -d "$SRC/assets" ]; then
+    for asset_file in $SRC/assets/*; do
         if [ -f "$asset_file" ]; then
             asset_name=$(basename "$asset_file")
-            echo "Uploading binary asset $asset_file as /assets/$asset_name via base64"
-            python - <<PY
-import base64
-import subprocess
-from pathlib import Path
-
-asset_path = Path('$asset_file')
-if asset_path.exists():
-    # Read binary file and base64 encode
-    binary_data = asset_path.read_bytes()
-    b64_data = base64.b64encode(binary_data).decode('ascii')
-    
-    # Split into chunks to avoid command line length limits
-    chunk_size = 3000
-    chunks = [b64_data[i:i+chunk_size] for i in range(0, len(b64_data), chunk_size)]
-    
-    # Clear any existing file and write chunks
-    subprocess.run(['python', '-m', 'mpremote', 'connect', '$SERIAL', 'exec', 
-                   "open('/assets/$asset_name.b64', 'w').close()"], check=True)
-    
-    for i, chunk in enumerate(chunks):
-        cmd = f"f = open('/assets/$asset_name.b64', 'a'); f.write({chunk!r}); f.close()"
-        subprocess.run(['python', '-m', 'mpremote', 'connect', '$SERIAL', 'exec', cmd], check=True)
-    
-    # Decode base64 to binary on device
-    decode_cmd = f"""
-import ubinascii
-b64_content = open('/assets/$asset_name.b64', 'r').read()
-with open('/assets/$asset_name', 'wb') as f:
-    f.write(ubinascii.a2b_base64(b64_content))
-print('Binary asset $asset_name installed')
-"""
-    subprocess.run(['python', '-m', 'mpremote', 'connect', '$SERIAL', 'exec', decode_cmd], check=True)
-else:
-    print('Asset file not found: $asset_file')
-PY
+            upload_binary "$asset_file" "/assets/$asset_name"
         fi
     done
 else
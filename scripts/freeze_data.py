@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""Generate frozen constant-data modules for the custom firmware build.
+
+Writes build/frozen/demographics_data.py holding the packed demographics
+store (the demographics.bin format, see micropython/demostore.py) as a single
+bytes constant. When that module is frozen into the firmware (see
+micropython/manifest.py) the bytes object lives in flash and DemographicsStore
+reads values from it through a memoryview, so neither the JSON nor the value
+lists are loaded into RAM. main.py prefers the frozen copy when it is
+importable and falls back to demographics.bin / demographics.json otherwise.
+
+    python scripts/freeze_data.py
+
+demographics.json stays the source of truth; re-run this (and rebuild the
+firmware) after editing it.
+"""
+from pathlib import Path
+
+from build_demographics import pack, verify
+
+REPO = Path(__file__).resolve().parent.parent
+OUT = REPO / 'build' / 'frozen'
+
+
+def main():
+    OUT.mkdir(parents=True, exist_ok=True)
+    src_bytes = (REPO / 'micropython' / 'demographics.json').read_bytes()
+    packed = pack(src_bytes)
+    verify(packed, src_bytes)
+    target = OUT / 'demographics_data.py'
+    target.write_text(
+        '# Generated by scripts/freeze_data.py from demographics.json - do not edit.\n'
+        'DEMOGRAPHICS_BIN = {!r}\n'.format(packed)
+    )
+    print('Wrote {} ({} bytes of data)'.format(target, len(packed)))
+
+
+if __name__ == '__main__':
+    main()
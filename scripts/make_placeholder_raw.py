@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""Precompile the boot placeholder PNG into a raw RGB565 frame.
+
+main.py blits assets/unknown_portrait.raw straight after display init (the
+instant-on path), which avoids decoding a PNG on the device. Run from the
+repo root after changing the placeholder image:
+
+    python scripts/make_placeholder_raw.py
+
+Requires Pillow on the host. Packs with passthrough/convert.py, so the
+frame matches what the passthrough sends. Writes the .raw file plus its
+metadata sidecar (same format as images/last.raw, see micropython/storage.py).
+"""
+import argparse
+import sys
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO / 'micropython'))
+sys.path.insert(0, str(REPO))
+
+from passthrough.convert import png_to_rgb565  # noqa: E402
+from storage import crc32, write_frame_meta  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--src', default=str(REPO / 'micropython/assets/unknown_portrait.png'))
+    ap.add_argument('--dst', default=str(REPO / 'micropython/assets/unknown_portrait.raw'))
+    ap.add_argument('--width', type=int, default=240)
+    ap.add_argument('--height', type=int, default=240)
+    args = ap.parse_args()
+
+    data = png_to_rgb565(Path(args.src).read_bytes(), args.width, args.height)
+    Path(args.dst).write_bytes(data)
+    write_frame_meta(args.dst, 'rgb565', args.width, args.height, crc32(data))
+    print('Wrote {} ({} bytes) and {}.meta'.format(args.dst, len(data), args.dst))
+
+
+if __name__ == '__main__':
+    main()
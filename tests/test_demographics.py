@@ -0,0 +1,111 @@
+"""Weighted sampling of the demographics stores.
+
+Runs on the host against a small weighted fixture, through both the packed
+DemographicsStore (built by scripts/build_demographics.py) and the
+JsonDemographics fallback:
+
+    python -m pytest tests
+"""
+import json
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO / 'micropython'))
+sys.path.insert(0, str(REPO / 'scripts'))
+
+from build_demographics import _chi2_critical, pack, verify  # noqa: E402
+from demostore import PROB_ONE, DemographicsStore, JsonDemographics, build_alias  # noqa: E402
+
+DEMOS = {
+    'categories': {
+        'A': {'name': 'Age', 'values': ['20s', '30s', '40s', '50s', '60s'], 'weights': [5, 3, 1, 1, 0]},
+        'B': {'name': 'Build', 'values': ['slim', 'average', 'broad']},
+    }
+}
+DRAWS = 20000
+
+
+def _src():
+    return json.dumps(DEMOS).encode('utf-8')
+
+
+@pytest.fixture(params=['packed', 'json'])
+def store(request):
+    if request.param == 'packed':
+        packed = pack(_src())
+        verify(packed, _src())
+        return DemographicsStore(packed)
+    return JsonDemographics(DEMOS)
+
+
+def _alias_distribution(prob, alias):
+    n = len(prob)
+    p = [0.0] * n
+    for j in range(n):
+        keep = prob[j] / PROB_ONE
+        p[j] += keep / n
+        p[alias[j]] += (1 - keep) / n
+    return p
+
+
+def _chi2(counts, expected):
+    total = float(sum(expected))
+    draws = sum(counts)
+    chi2 = 0.0
+    df = -1
+    for c, w in zip(counts, expected):
+        if not w:
+            assert c == 0
+            continue
+        e = draws * w / total
+        chi2 += (c - e) ** 2 / e
+        df += 1
+    return chi2, df
+
+
+@pytest.mark.parametrize('weights', [[5, 3, 1, 1, 0], [1, 1, 1], [0.1, 7, 2.5, 0.4], [1]])
+def test_build_alias_reproduces_weights(weights):
+    prob, alias, norm = build_alias(weights)
+    total = float(sum(weights))
+    for got, w in zip(_alias_distribution(prob, alias), weights):
+        assert abs(got - w / total) < 1e-6
+    assert abs(sum(norm) - PROB_ONE) <= len(weights)
+
+
+@pytest.mark.parametrize('weights', [[], [0, 0], [1, -1]])
+def test_build_alias_rejects_bad_weights(weights):
+    with pytest.raises(ValueError):
+        build_alias(weights)
+
+
+@pytest.mark.parametrize('key', ['A', 'B'])
+@pytest.mark.parametrize('recent', [(), (0,), (1, 0)])
+def test_sample_matches_distribution(store, key, recent):
+    random.seed(1)
+    n = store.count(key)
+    weights = DEMOS['categories'][key].get('weights') or [1] * n
+    expected = [0 if i in recent else w for i, w in enumerate(weights)]
+    counts = [0] * n
+    for _ in range(DRAWS):
+        counts[store.sample(key, recent)] += 1
+    chi2, df = _chi2(counts, expected)
+    assert chi2 <= _chi2_critical(max(df, 1))
+
+
+def test_sample_keeps_a_candidate(store):
+    # Only the newest count - 1 recent indices are honoured
+    random.seed(2)
+    assert {store.sample('B', (2, 1, 0)) for _ in range(50)} == {0}
+    assert store.sample('missing') is None
+
+
+def test_json_ignores_malformed_weights():
+    demos = {'categories': {'A': {'values': ['a', 'b'], 'weights': [1]}}}
+    store = JsonDemographics(demos)
+    assert not store._weighted('A')
+    random.seed(3)
+    assert {store.sample('A') for _ in range(50)} == {0, 1}